@@ -0,0 +1,329 @@
+"""
+记忆整理 - 在后台合并相似或重复的偏好和事实
+
+长期使用后记忆中会积累大量重复、近似或互相矛盾的条目（如 "likes python" 和 "likes python a lot"），
+每轮都注入提示词既浪费 token，也让上下文不稳定。MemoryConsolidator 在请求路径之外定期:
+1. 用 MinHash + LSH 找出候选的相似条目，再用字符 n-gram 的重叠系数与簇首精确比较，合并成簇；
+   数字不同或否定 / 极性不同（"is vegetarian" 与 "is not vegetarian"、"likes" 与 "dislikes"）的条目是不同的事实，不合并
+2. 每个簇合并成一条：较长的条目包含其他条目的全部词时保留它，否则保留最新的一条；配置了 LLM 时让 LLM 改写成一条
+   （应传入以后台优先级排队的 LLM，如 scheduler.wrap(llm, PRIORITY_BACKGROUND)）
+3. 通过 replace_entries 原子地改写存储；整理期间新增的条目不受影响
+
+合并后的条目放在簇中最新条目的位置，保持"越靠后越新"的顺序。
+"""
+
+import re
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from llm.base import BaseLLM
+from llm.tokens import estimate_tokens
+from tools.dedup import MinHash, normalize_passage, shingles
+
+MERGE_PROMPT = """The following notes about the same user overlap. Merge them into ONE concise note that keeps every distinct detail.
+Notes are listed oldest first; when they conflict, keep what the most recent note says.
+Reply with the merged note only.
+
+{notes}"""
+
+# 参与整理的字段
+CONSOLIDATED_FIELDS = ("preferences", "facts")
+
+_NUMBER_RE = re.compile(r"\d+")
+_WORD_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]")
+
+# 否定词（撇号已去掉，如 don't -> dont）和中文否定字
+_NEGATION_WORDS = {
+    "not", "no", "never", "none", "nothing", "neither", "nor", "cannot", "without",
+    "dont", "doesnt", "didnt", "isnt", "arent", "wasnt", "werent", "wont", "cant",
+    "hasnt", "havent", "hadnt", "shouldnt", "wouldnt", "couldnt",
+    "不", "没", "无", "非", "别",
+}
+# 反义前缀：dislikes / likes、unhappy / happy
+_NEGATION_PREFIXES = ("dis", "un", "non")
+
+
+def _words(text: str) -> Set[str]:
+    return set(_WORD_RE.findall(text.lower().replace("'", "").replace("\u2019", "")))
+
+
+def _polarity_conflict(a: Set[str], b: Set[str]) -> bool:
+    """两条条目的否定词不同，或一条的某个词是另一条某个词加反义前缀"""
+    if (a & _NEGATION_WORDS) != (b & _NEGATION_WORDS):
+        return True
+    union = a | b
+    for word in a ^ b:
+        for prefix in _NEGATION_PREFIXES:
+            if word.startswith(prefix) and word[len(prefix):] in union:
+                return True
+    return False
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # 以较小的下标为根，簇的顺序与条目顺序一致
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+class MemoryConsolidator:
+    """
+    记忆整理器
+
+    用法:
+        consolidator = MemoryConsolidator(llm=background_llm)
+        consolidator.consolidate(memory)              # 立即整理一次
+        consolidator.start(lambda: [memory], 600)     # 每 10 分钟在后台整理
+        consolidator.stop()
+    """
+
+    def __init__(
+        self,
+        llm: Optional[BaseLLM] = None,
+        threshold: float = 0.8,
+        min_entries: int = 10,
+        max_llm_calls: int = 20,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 3
+    ):
+        """
+        参数:
+            llm: 用于改写合并结果的 LLM（None 时使用规则合并）
+            threshold: 两条记忆字符 n-gram 的重叠系数 |A∩B| / min(|A|, |B|) 达到该值时视为相似
+            min_entries: 条目数少于该值的字段不整理
+            max_llm_calls: 每次整理最多调用 LLM 的次数，其余簇使用规则合并
+            num_perm, bands: MinHash 签名长度和 LSH 分段数
+            shingle_size: 字符 n-gram 长度
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) 必须能被 bands ({bands}) 整除")
+        self.llm = llm
+        self.threshold = threshold
+        self.min_entries = min_entries
+        self.max_llm_calls = max_llm_calls
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self._minhash = MinHash(num_perm=num_perm)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        # 每个 Memory 上次整理后的条目数，没有变化时跳过
+        self._last_sizes: "weakref.WeakKeyDictionary[Any, Tuple[int, ...]]" = weakref.WeakKeyDictionary()
+
+        self.stats = {
+            "runs": 0, "skipped": 0, "conflicts": 0, "clusters": 0, "removed": 0,
+            "llm_calls": 0, "llm_failures": 0, "tokens_before": 0, "tokens_after": 0,
+            "last_run_ms": 0.0,
+        }
+
+    # ---- 聚类 ----
+
+    def cluster(self, entries: List[str]) -> List[List[int]]:
+        """
+        把相似的条目分成簇
+
+        返回:
+            包含两条及以上条目的簇（条目下标按原顺序排列）
+        """
+        normalized = [normalize_passage(text) for text in entries]
+        grams: List[Set[int]] = [shingles(text, self.shingle_size) for text in normalized]
+        # 只差在数字上的条目（日期、年龄、编号）是不同的事实，不合并
+        numbers = [frozenset(_NUMBER_RE.findall(text)) for text in normalized]
+        words = [_words(text) for text in entries]
+        buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(self.bands)]
+        union = _UnionFind(len(entries))
+
+        for i, gram in enumerate(grams):
+            if not gram:
+                continue
+            signature = self._minhash.signature(gram)
+            keys = [signature[band * self.rows:(band + 1) * self.rows] for band in range(self.bands)]
+            # 只和候选所在簇的首条（簇首）比较，避免相似关系一路传递把不相关的条目串成一簇
+            leaders = {union.find(j) for band, key in enumerate(keys) for j in buckets[band].get(key, ())}
+            for leader in sorted(leaders):
+                if numbers[leader] != numbers[i] or _polarity_conflict(words[leader], words[i]):
+                    continue
+                overlap = len(gram & grams[leader]) / min(len(gram), len(grams[leader]))
+                if overlap >= self.threshold:
+                    union.union(leader, i)
+                    break
+            for band, key in enumerate(keys):
+                buckets[band].setdefault(key, []).append(i)
+
+        clusters: Dict[int, List[int]] = {}
+        for i in range(len(entries)):
+            clusters.setdefault(union.find(i), []).append(i)
+        return [members for members in clusters.values() if len(members) > 1]
+
+    # ---- 合并 ----
+
+    @staticmethod
+    def _merge_by_rule(members: List[str]) -> str:
+        """
+        最长的一条包含其他每条的全部词时保留它（一样长时取较新的），否则保留最新的一条
+
+        相似但不互相包含的条目可能是更新后的说法，只有确定没有丢信息时才让旧的长条目胜出。
+        """
+        longest = max(reversed(members), key=len)
+        covered = _words(longest)
+        if all(_words(text) <= covered for text in members):
+            return longest
+        return members[-1]
+
+    def _merge_by_llm(self, members: List[str]) -> Optional[str]:
+        notes = "\n".join(f"{n}. {text}" for n, text in enumerate(members, 1))
+        try:
+            text = self.llm.generate([{"role": "user", "content": MERGE_PROMPT.format(notes=notes)}])
+        except Exception as e:
+            print(f"[Memory] Consolidation LLM call failed: {e}")
+            return None
+        merged = " ".join(text.split()).strip().lstrip("-*• ").strip()
+        # 回复为空或比原文还长时不采用
+        if not merged or len(merged) > sum(len(m) for m in members):
+            return None
+        return merged
+
+    def plan(self, entries: List[str], llm_calls: int = 0) -> Tuple[List[str], int, int]:
+        """
+        计算整理后的列表（不修改存储）
+
+        参数:
+            entries: 原始条目
+            llm_calls: 本次整理已使用的 LLM 调用次数
+
+        返回:
+            (整理后的列表, 合并的簇数, 已使用的 LLM 调用次数)
+        """
+        clusters = self.cluster(entries)
+        replacement: Dict[int, str] = {}
+        dropped: Set[int] = set()
+        for members in clusters:
+            texts = [entries[i] for i in members]
+            merged = None
+            if self.llm is not None and llm_calls < self.max_llm_calls:
+                llm_calls += 1
+                with self._lock:
+                    self.stats["llm_calls"] += 1
+                merged = self._merge_by_llm(texts)
+                if merged is None:
+                    with self._lock:
+                        self.stats["llm_failures"] += 1
+            if merged is None:
+                merged = self._merge_by_rule(texts)
+            # 合并结果放在簇中最新条目的位置
+            replacement[members[-1]] = merged
+            dropped.update(members[:-1])
+
+        result = [replacement.get(i, text) for i, text in enumerate(entries) if i not in dropped]
+        return list(dict.fromkeys(result)), len(clusters), llm_calls
+
+    def consolidate(self, memory) -> Dict[str, int]:
+        """
+        整理一个 Memory（或 SQLiteMemory）
+
+        返回:
+            {clusters, removed, tokens_before, tokens_after}
+        """
+        start = time.perf_counter()
+        result = {"clusters": 0, "removed": 0, "tokens_before": 0, "tokens_after": 0}
+        llm_calls = 0
+        data = memory.data
+        for field in CONSOLIDATED_FIELDS:
+            entries = list(data[field])
+            if len(entries) < self.min_entries:
+                continue
+            new_entries, clusters, llm_calls = self.plan(entries, llm_calls)
+            if len(new_entries) == len(entries) and new_entries == entries:
+                continue
+            if not memory.replace_entries(field, entries, new_entries):
+                # 整理期间被其他改写修改过，下次再整理
+                with self._lock:
+                    self.stats["conflicts"] += 1
+                continue
+            result["clusters"] += clusters
+            result["removed"] += len(entries) - len(new_entries)
+            result["tokens_before"] += sum(estimate_tokens(text) + 1 for text in entries)
+            result["tokens_after"] += sum(estimate_tokens(text) + 1 for text in new_entries)
+
+        with self._lock:
+            self.stats["runs"] += 1
+            for key in ("clusters", "removed", "tokens_before", "tokens_after"):
+                self.stats[key] += result[key]
+            self.stats["last_run_ms"] = (time.perf_counter() - start) * 1000
+        if result["removed"]:
+            print(
+                f"[Memory] Consolidated {result['clusters']} clusters, removed {result['removed']} entries "
+                f"({result['tokens_before']} -> {result['tokens_after']} tokens)"
+            )
+        return result
+
+    # ---- 后台运行 ----
+
+    def run_once(self, memories: Iterable) -> int:
+        """
+        整理自上次以来有变化的 Memory
+
+        返回:
+            整理的 Memory 个数
+        """
+        count = 0
+        for memory in memories:
+            data = memory.data
+            sizes = tuple(len(data[field]) for field in CONSOLIDATED_FIELDS)
+            if self._last_sizes.get(memory) == sizes:
+                with self._lock:
+                    self.stats["skipped"] += 1
+                continue
+            try:
+                self.consolidate(memory)
+            except Exception as e:
+                print(f"[Memory] Consolidation failed: {e}")
+                continue
+            data = memory.data
+            self._last_sizes[memory] = tuple(len(data[field]) for field in CONSOLIDATED_FIELDS)
+            count += 1
+        return count
+
+    def start(self, memories: Callable[[], Iterable], interval: float = 600.0) -> None:
+        """
+        启动后台整理线程
+
+        参数:
+            memories: 返回要整理的 Memory 列表的函数（如 MemoryManager.memories）
+            interval: 两次整理之间的间隔（秒）
+        """
+        if self._worker is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.run_once(memories())
+
+        self._worker = threading.Thread(target=loop, name="memory-consolidation", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        """停止后台线程（正在进行的整理会先完成）"""
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
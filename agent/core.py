@@ -8,12 +8,16 @@
 4. 更好的错误处理
 """
 
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Mapping, Optional, Union
 import re
+import uuid
 from llm.base import BaseLLM
+from llm.tokens import estimate_tokens, estimate_messages_tokens
+from llm.usage import UsageTracker, global_usage_tracker
 from tools.base import BaseTool
-from tools.registry import ToolRegistry
+from tools.registry import ToolRegistry, ToolSnapshot
 from .memory import Memory
+from .retrieval import ToolSelector
 
 SYSTEM_PROMPT = """You are a helpful AI assistant.
 You have access to the following tools:
@@ -41,6 +45,8 @@ class EnhancedChatAgent:
     - MCP 客户端集成
     - 动态工具管理
     - 记忆系统
+    - Token 用量统计
+    - 按相关性筛选暴露给 LLM 的工具
     """
     
     def __init__(
@@ -49,7 +55,13 @@ class EnhancedChatAgent:
         tools: Optional[Union[List[BaseTool], ToolRegistry]] = None,
         memory: Optional[Memory] = None,
         max_history: int = 5,
-        max_iterations: int = 3
+        max_iterations: int = 3,
+        usage_tracker: Optional[UsageTracker] = None,
+        session_id: Optional[str] = None,
+        tool_selector: Optional[ToolSelector] = None,
+        max_observation_chars: Optional[int] = 3000,
+        memory_top_k: Optional[int] = 10,
+        memory_token_budget: Optional[int] = 500
     ):
         """
         初始化增强版 Agent
@@ -60,55 +72,119 @@ class EnhancedChatAgent:
             memory: 记忆系统
             max_history: 保留的最大对话轮数
             max_iterations: ReAct 循环的最大迭代次数
+            usage_tracker: Token 用量统计器（默认使用进程级全局统计器）
+            session_id: 会话 ID，用于按会话汇总用量（默认随机生成）
+            tool_selector: 工具选择器；设置后提示词中只包含与当前输入最相关的工具
+            max_observation_chars: 单次工具观察结果的最大字符数（None 表示不限制）；
+                                   流式工具达到该预算后会被提前终止
+            memory_top_k: 每轮最多注入的相关偏好/事实条数（None 表示不限）
+            memory_token_budget: 注入的偏好/事实的估算 token 上限（None 表示不限）
         """
         self.llm = llm
         self.memory = memory
         self.history: List[Dict[str, str]] = []
         self.max_history = max_history
         self.max_iterations = max_iterations
+        self.usage_tracker = usage_tracker or global_usage_tracker
+        self.session_id = session_id or uuid.uuid4().hex[:8]
+        self.tool_selector = tool_selector
+        self.max_observation_chars = max_observation_chars
+        self.memory_top_k = memory_top_k
+        self.memory_token_budget = memory_token_budget
+        
+        # 最近一次构建的系统提示词中各部分的估算 token 数
+        self._system_prompt_parts: Dict[str, int] = {}
         
         # 处理工具输入
         if isinstance(tools, ToolRegistry):
             self.tool_registry = tools
-            self.tools = {t.name: t for t in tools.get_all_tools()}
-        elif isinstance(tools, list):
-            self.tool_registry = ToolRegistry()
-            self.tool_registry.register_multiple(tools)
-            self.tools = {t.name: t for t in tools}
         else:
             self.tool_registry = ToolRegistry()
-            self.tools = {}
+            if tools:
+                self.tool_registry.register_multiple(tools)
+        
+        # 不单独维护工具表：订阅注册器的快照，热路径上只读取快照引用，无需加锁
+        self._tool_snapshot: ToolSnapshot = self.tool_registry.snapshot()
+        self._unsubscribe_tools = self.tool_registry.subscribe(self._on_tools_changed)
+    
+    def _on_tools_changed(self, snapshot: ToolSnapshot) -> None:
+        """注册器发布新版本时更新本地快照引用"""
+        self._tool_snapshot = snapshot
+    
+    @property
+    def tools(self) -> Mapping[str, BaseTool]:
+        """当前可用工具（只读，随注册器更新）"""
+        return self._tool_snapshot.tools
     
     def add_tool(self, tool: BaseTool) -> None:
         """动态添加工具"""
         self.tool_registry.register(tool)
-        self.tools[tool.name] = tool
     
     def remove_tool(self, tool_name: str) -> bool:
         """移除工具"""
-        if tool_name in self.tools:
-            del self.tools[tool_name]
-            return self.tool_registry.unregister(tool_name)
-        return False
+        return self.tool_registry.unregister(tool_name)
     
     def list_tools(self) -> List[str]:
         """列出所有可用工具"""
-        return list(self.tools.keys())
+        return self._tool_snapshot.names()
     
-    def _build_system_prompt(self) -> str:
-        """构建系统提示词"""
-        tool_descs = "\n".join([f"- {t.name}: {t.description}" for t in self.tools.values()])
+    def _select_tools(self, query: str, snapshot: Optional[ToolSnapshot] = None) -> List[BaseTool]:
+        """选择放进提示词的工具（未配置选择器时返回全部工具）"""
+        snapshot = snapshot or self._tool_snapshot
+        if self.tool_selector is None:
+            return snapshot.values()
+        
+        # 注册器版本变化后重建索引
+        if self.tool_selector.indexed_version != snapshot.version:
+            self.tool_selector.index_tools(snapshot.values(), version=snapshot.version)
+        return self.tool_selector.select(query)
+    
+    def _build_system_prompt(self, query: str = "", snapshot: Optional[ToolSnapshot] = None) -> str:
+        """
+        构建系统提示词
+        
+        参数:
+            query: 当前输入及近期上下文，用于筛选相关工具和记忆
+            snapshot: 使用的工具快照（默认为当前快照）
+        """
+        tool_descs = "\n".join([f"- {t.name}: {t.description}" for t in self._select_tools(query, snapshot)])
         if not tool_descs:
             tool_descs = "No tools available."
         
         mem_ctx = ""
         if self.memory:
-            mem_ctx = self.memory.get_context()
+            mem_ctx = self.memory.get_context(
+                query,
+                top_k=self.memory_top_k,
+                token_budget=self.memory_token_budget
+            )
         
-        return SYSTEM_PROMPT.format(
+        prompt = SYSTEM_PROMPT.format(
             tool_descriptions=tool_descs, 
             memory_context=mem_ctx
         )
+        
+        tools_tokens = estimate_tokens(tool_descs)
+        memory_tokens = estimate_tokens(mem_ctx)
+        self._system_prompt_parts = {
+            "tools": tools_tokens,
+            "memory": memory_tokens,
+            "system": max(estimate_tokens(prompt) - tools_tokens - memory_tokens, 0),
+        }
+        return prompt
+    
+    def _prompt_components(self, messages: List[Dict[str, str]], base_len: int) -> Dict[str, int]:
+        """
+        估算提示词各组成部分的 token 数
+        
+        参数:
+            messages: 本次发送给 LLM 的消息
+            base_len: 系统提示词 + 历史记录的消息条数（之后的都是本轮 ReAct 产生的消息）
+        """
+        components = dict(self._system_prompt_parts)
+        components["history"] = estimate_messages_tokens(messages[1:base_len])
+        components["react"] = estimate_messages_tokens(messages[base_len:])
+        return components
     
     def chat(self, user_input: str, verbose: bool = True) -> str:
         """
@@ -124,15 +200,32 @@ class EnhancedChatAgent:
         # 1. 添加用户消息到历史记录
         self.history.append({"role": "user", "content": user_input})
         
-        # 2. 准备 LLM 消息
+        # 本轮始终使用同一个工具快照，期间注册器的变更从下一轮开始生效
+        snapshot = self._tool_snapshot
+        
+        # 2. 准备 LLM 消息（用当前输入和上一轮对话来筛选工具）
+        recent_context = " ".join(m["content"] for m in self.history[-3:])
         messages = [
-            {"role": "system", "content": self._build_system_prompt()}
+            {"role": "system", "content": self._build_system_prompt(recent_context, snapshot)}
         ] + self.history[-self.max_history * 2:]
+        base_len = len(messages)
         
         # 3. ReAct 循环
         for iteration in range(self.max_iterations):
             try:
-                response = self.llm.generate(messages)
+                result = self.llm.generate_with_usage(messages)
+                response = result.text
+                self.usage_tracker.record(
+                    result,
+                    session=self.session_id,
+                    iteration=iteration,
+                    components=self._prompt_components(messages, base_len)
+                )
+                if verbose:
+                    print(
+                        f"[LLM 用量]: 提示 {result.prompt_tokens} + 生成 {result.completion_tokens} tokens, "
+                        f"耗时 {result.latency * 1000:.0f}ms"
+                    )
                 
                 # 检查是否有工具调用
                 action_match = re.search(
@@ -151,9 +244,13 @@ class EnhancedChatAgent:
                         print(f"[工具参数]: {tool_args}")
                     
                     # 执行工具
-                    if tool_name in self.tools:
+                    # 使用本轮固定的快照中的工具，期间注册器的变更不影响这一轮
+                    tool = snapshot.get(tool_name)
+                    if tool is not None:
                         try:
-                            tool_result = self.tools[tool_name].run(tool_args)
+                            tool_result = self.tool_registry.run_tool(
+                                tool, tool_args, max_chars=self.max_observation_chars
+                            )
                             observation = f"Observation: {tool_result}"
                             
                             if verbose:
@@ -170,7 +267,7 @@ class EnhancedChatAgent:
                             if verbose:
                                 print(f"[工具错误]: {str(e)}")
                     else:
-                        error_msg = f"Observation: Tool '{tool_name}' not found. Available tools: {', '.join(self.tools.keys())}"
+                        error_msg = f"Observation: Tool '{tool_name}' not found. Available tools: {', '.join(snapshot.names())}"
                         messages.append({"role": "assistant", "content": response})
                         messages.append({"role": "system", "content": error_msg})
                         if verbose:
@@ -199,6 +296,16 @@ class EnhancedChatAgent:
         self.history = []
         print("[Agent] 对话历史已重置")
     
+    def close(self) -> None:
+        """结束会话：取消对注册器的订阅（可重复调用）"""
+        if self._unsubscribe_tools is not None:
+            self._unsubscribe_tools()
+            self._unsubscribe_tools = None
+    
+    def get_usage(self) -> Dict:
+        """获取当前会话的 token 用量汇总"""
+        return self.usage_tracker.get_summary(session=self.session_id)
+    
     def get_history(self) -> List[Dict[str, str]]:
         """获取对话历史"""
         return self.history.copy()
@@ -1,66 +1,300 @@
 import json
-import os
-from typing import Dict, Any, List
+import threading
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from llm.tokens import estimate_tokens
+from .memory_store import LIST_OP_FIELDS, JSONFileBackend, MemoryBackend, apply_op, build_membership
+from .retrieval import EmbedFn, KeywordIndex, _cosine
+
+# 参与相关性检索的字段及其在上下文中的标题
+_INDEXED_FIELDS = (("preferences", "User Preferences"), ("facts", "Known Facts"))
+
+
+def _json_size(value: Any) -> int:
+    """按 JSON 序列化后的字节数"""
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def format_context(profile: Dict[str, Any], preferences: List[str], facts: List[str]) -> str:
+    """把档案、偏好和事实格式化成注入 System Prompt 的记忆上下文"""
+    context_parts = []
+
+    if profile:
+        profile_str = ", ".join([f"{k}: {v}" for k, v in profile.items()])
+        context_parts.append(f"User Profile: [{profile_str}]")
+
+    for (_, title), items in zip(_INDEXED_FIELDS, (preferences, facts)):
+        if items:
+            context_parts.append(f"{title}: [{'; '.join(items)}]")
+
+    return "\n".join(context_parts)
+
 
 class Memory:
-    def __init__(self, file_path: str = "user_memory.json"):
+    """
+    用户记忆：档案 (profile)、偏好 (preferences) 和事实 (facts)
+
+    每次修改通过持久化后端 (backend) 保存：默认原子地重写 JSON 文件，
+    也可以使用 WALBackend 只追加日志记录（见 agent/memory_store.py）。
+
+    偏好和事实用哈希集合去重，并建立关键词 (BM25) 索引，可选本地向量索引；
+    get_context 传入 query 时只注入与之最相关的 top-k 条，且不超过 token 预算。
+
+    autosave=False 时修改只记在内存中（dirty），调用 flush() 时才批量交给后端，
+    供 MemoryManager 做写回 (write-behind) 缓存。
+    """
+
+    def __init__(
+        self,
+        file_path: str = "user_memory.json",
+        backend: Optional[MemoryBackend] = None,
+        embed_fn: Optional[EmbedFn] = None,
+        vector_weight: float = 0.5,
+        autosave: bool = True
+    ):
+        """
+        参数:
+            file_path: JSON 文件路径（未指定 backend 时使用）
+            backend: 持久化后端
+            embed_fn: 可选的本地 embedding 函数（输入文本列表，返回向量列表）
+            vector_weight: 向量相似度的权重
+            autosave: 每次修改是否立即持久化；False 时需要调用 flush()
+        """
         self.file_path = file_path
+        self.backend = backend or JSONFileBackend(file_path)
+        self.embed_fn = embed_fn
+        self.vector_weight = vector_weight
+        self.autosave = autosave
+        self._lock = threading.RLock()
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
         self.data = self._load()
-        # 确保存储结构初始化
-        if "profile" not in self.data:
-            self.data["profile"] = {}
-        if "preferences" not in self.data:
-            self.data["preferences"] = []
-        if "facts" not in self.data:
-            self.data["facts"] = []
+        self._bytes = _json_size(self.data)
+
+        self.stats = {"context_calls": 0, "full_tokens": 0, "injected_tokens": 0}
+        self._rebuild_index()
 
     def _load(self) -> Dict[str, Any]:
-        if os.path.exists(self.file_path):
-            try:
-                with open(self.file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        return self.backend.load()
 
     def save(self):
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        """完整保存当前数据（WAL 后端会立即写出快照并清空日志）"""
+        with self._lock:
+            self.backend.save(self.data)
+            self._pending = []
+
+    def flush(self) -> int:
+        """
+        把尚未持久化的修改批量交给后端
+
+        返回:
+            写出的修改条数
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending = self._pending
+            self.backend.append_many(pending, self.data)
+            self._pending = []
+            return len(pending)
+
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未持久化的修改"""
+        return bool(self._pending)
+
+    @property
+    def estimated_bytes(self) -> int:
+        """数据按 JSON 序列化后的估算大小（字节），用于限制缓存占用"""
+        return self._bytes
+
+    def close(self):
+        """写出未持久化的修改，刷新并关闭后端"""
+        with self._lock:
+            self.flush()
+            self.backend.close()
+
+    # ---- 索引 ----
+
+    def _rebuild_index(self) -> None:
+        """根据当前数据重建去重集合和检索索引"""
+        with self._lock:
+            self._seen = build_membership(self.data)
+            self._index = KeywordIndex()
+            self._entry_tokens: Dict[str, int] = {}
+            self._vectors: Dict[str, Sequence[float]] = {}
+            for field, _ in _INDEXED_FIELDS:
+                for i, text in enumerate(self.data[field]):
+                    self._index_entry(field, i, text)
+
+    def _index_entry(self, field: str, position: int, text: str) -> None:
+        doc_id = f"{field}:{position}"
+        self._index.add(doc_id, text)
+        # 每条额外计 1 个 token 的分隔符
+        self._entry_tokens[doc_id] = estimate_tokens(text) + 1
+
+    def _entry_text(self, doc_id: str) -> str:
+        field, position = doc_id.split(":")
+        return self.data[field][int(position)]
+
+    def _rank(self, query: str) -> List[Tuple[str, float]]:
+        """对偏好和事实打分并排序：BM25 归一化分数 + vector_weight * 余弦相似度"""
+        keyword = self._index.scores(query)
+        top = max(keyword.values()) if keyword else 0.0
+        combined = {doc_id: score / top for doc_id, score in keyword.items()} if top else {}
+
+        if self.embed_fn and self._entry_tokens:
+            # 向量按需批量计算，新增的条目在下一次检索时补齐
+            missing = [d for d in self._entry_tokens if d not in self._vectors]
+            if missing:
+                vectors = self.embed_fn([self._entry_text(d) for d in missing])
+                self._vectors.update(zip(missing, vectors))
+            query_vector = self.embed_fn([query])[0]
+            for doc_id, vector in self._vectors.items():
+                combined[doc_id] = combined.get(doc_id, 0.0) + self.vector_weight * _cosine(query_vector, vector)
+
+        return sorted(
+            ((d, s) for d, s in combined.items() if s > 0),
+            key=lambda item: item[1],
+            reverse=True
+        )
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        检索与 query 最相关的偏好和事实
+
+        返回:
+            [(文本, 分数), ...]
+        """
+        with self._lock:
+            return [(self._entry_text(d), s) for d, s in self._rank(query)[:k]]
+
+    # ---- 修改 ----
+
+    def _mutate(self, op: str, payload: Dict[str, Any]) -> bool:
+        """应用一次修改并交给后端持久化；数据没有变化时不写入"""
+        with self._lock:
+            # 覆盖已有的档案字段时，要减去旧值的大小
+            replaced = None
+            if op == "set_profile" and payload["key"] in self.data["profile"]:
+                replaced = {"key": payload["key"], "value": self.data["profile"][payload["key"]]}
+            if not apply_op(self.data, op, payload, self._seen):
+                return False
+            field = LIST_OP_FIELDS.get(op)
+            if field is not None:
+                self._index_entry(field, len(self.data[field]) - 1, payload["value"])
+            self._bytes += _json_size(payload)
+            if replaced is not None:
+                self._bytes -= _json_size(replaced)
+            if self.autosave:
+                self.backend.append(op, payload, self.data)
+            else:
+                self._pending.append((op, payload))
+            return True
 
     def update_profile(self, key: str, value: Any):
         """更新用户基础属性（如姓名、年龄、职业）"""
-        self.data["profile"][key] = value
-        self.save()
+        self._mutate("set_profile", {"key": key, "value": value})
 
     def add_preference(self, preference: str):
         """添加用户偏好（如喜欢 Python，讨厌香菜）"""
-        if preference not in self.data["preferences"]:
-            self.data["preferences"].append(preference)
-            self.save()
+        self._mutate("add_preference", {"value": preference})
 
     def add_fact(self, fact: str):
         """添加关于用户的通用事实或对话中的重要信息"""
-        if fact not in self.data["facts"]:
-            self.data["facts"].append(fact)
-            self.save()
-
-    def get_context(self) -> str:
-        """获取格式化的记忆上下文，用于注入 System Prompt"""
-        context_parts = []
-        
-        if self.data["profile"]:
-            profile_str = ", ".join([f"{k}: {v}" for k, v in self.data["profile"].items()])
-            context_parts.append(f"User Profile: [{profile_str}]")
-            
-        if self.data["preferences"]:
-            prefs_str = "; ".join(self.data["preferences"])
-            context_parts.append(f"User Preferences: [{prefs_str}]")
-            
-        if self.data["facts"]:
-            facts_str = "; ".join(self.data["facts"])
-            context_parts.append(f"Known Facts: [{facts_str}]")
-            
-        if not context_parts:
-            return ""
-            
-        return "\n".join(context_parts)
+        self._mutate("add_fact", {"value": fact})
+
+    def replace_entries(self, field: str, old: List[str], new: List[str]) -> bool:
+        """
+        原子地改写偏好或事实列表（供后台整理使用）
+
+        old 是改写前读取到的列表，new 是用来替换它的结果；读取之后新追加的条目保留在末尾。
+        改写后立即完整保存（JSON 后端原子替换文件，WAL 后端写出快照）。
+
+        参数:
+            field: "preferences" 或 "facts"
+            old: 改写前读取到的列表
+            new: 替换后的列表
+
+        返回:
+            是否改写成功；读取后列表被其他改写修改过时返回 False，不做任何修改
+        """
+        with self._lock:
+            current = self.data[field]
+            if current[:len(old)] != old:
+                return False
+            # 去重并保持顺序
+            self.data[field] = list(dict.fromkeys(new + current[len(old):]))
+            self._rebuild_index()
+            self._bytes = _json_size(self.data)
+            self.backend.save(self.data)
+            # 完整保存已包含所有未写出的修改
+            self._pending = []
+            return True
+
+    def _select_entries(self, query: str, top_k: Optional[int], token_budget: Optional[int]) -> List[str]:
+        """挑选要注入的条目 ID（调用方持有锁）"""
+        total_tokens = sum(self._entry_tokens.values())
+        fits_all = (top_k is None or len(self._entry_tokens) <= top_k) and (
+            token_budget is None or total_tokens <= token_budget
+        )
+        if fits_all:
+            # 记忆很少时全部注入，和不做检索时一致
+            return list(self._entry_tokens)
+
+        selected: List[str] = []
+        used = 0
+        for doc_id, _ in self._rank(query):
+            if top_k is not None and len(selected) >= top_k:
+                break
+            cost = self._entry_tokens[doc_id]
+            if token_budget is not None and used + cost > token_budget:
+                continue
+            selected.append(doc_id)
+            used += cost
+        return selected
+
+    def get_context(
+        self,
+        query: Optional[str] = None,
+        top_k: Optional[int] = None,
+        token_budget: Optional[int] = None
+    ) -> str:
+        """
+        获取格式化的记忆上下文，用于注入 System Prompt
+
+        参数:
+            query: 当前输入；为 None 时注入全部偏好和事实
+            top_k: 最多注入的偏好 + 事实条数（None 表示不限）
+            token_budget: 偏好 + 事实的估算 token 上限（None 表示不限）；档案总是全部注入
+        """
+        with self._lock:
+            if query is None or (top_k is None and token_budget is None):
+                selected = list(self._entry_tokens)
+            else:
+                selected = self._select_entries(query, top_k, token_budget)
+
+            self.stats["context_calls"] += 1
+            self.stats["full_tokens"] += sum(self._entry_tokens.values())
+            self.stats["injected_tokens"] += sum(self._entry_tokens[d] for d in selected)
+
+            # 按原始顺序输出被选中的条目
+            chosen = set(selected)
+            sections = {
+                field: [text for i, text in enumerate(self.data[field]) if f"{field}:{i}" in chosen]
+                for field, _ in _INDEXED_FIELDS
+            }
+            return format_context(self.data["profile"], sections["preferences"], sections["facts"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取记忆规模和上下文注入统计
+
+        返回:
+            {preferences, facts, context_calls, full_tokens, injected_tokens, saved_tokens, saved_ratio}
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["preferences"] = len(self.data["preferences"])
+            stats["facts"] = len(self.data["facts"])
+        stats["saved_tokens"] = stats["full_tokens"] - stats["injected_tokens"]
+        stats["saved_ratio"] = stats["saved_tokens"] / stats["full_tokens"] if stats["full_tokens"] else 0.0
+        return stats
@@ -0,0 +1,292 @@
+"""
+多用户记忆管理 - 按用户 ID 取得 Memory 实例
+
+- 常用用户的 Memory 保存在 LRU 缓存中，按用户数和估算字节数限制占用
+- 未缓存的用户在第一次访问时才从存储中加载；同一用户的并发访问只加载一次
+- 缓存中的 Memory 以 autosave=False 创建，修改先留在内存中（写回 / write-behind），
+  在被淘汰、flush_all() 或 close() 时批量写出；start_flusher() 启动定时写回，限制崩溃时丢失的修改
+- 写回失败的用户留在缓存中（不关闭），之后的淘汰或定时写回会重试，未保存的修改不会丢失
+- 统计命中率、加载耗时和写回耗时
+
+注意: Memory 被淘汰后就不再由管理器写回，调用方不要长期持有实例，每次使用前通过 get() 获取；
+必须长期持有时（如单用户的命令行会话）应启动定时写回。
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .memory import Memory
+
+MemoryFactory = Callable[[str], Memory]
+
+_SAFE_USER_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def user_file_name(user_id: str) -> str:
+    """用户 ID 对应的文件名；含特殊字符的 ID 使用哈希，避免路径穿越"""
+    if _SAFE_USER_RE.match(user_id):
+        return f"{user_id}.json"
+    return f"user-{hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:16]}.json"
+
+
+class MemoryManager:
+    """
+    多用户记忆管理器（线程安全）
+
+    用法:
+        manager = MemoryManager(base_dir="user_memories", max_users=128)
+        memory = manager.get("alice")
+        memory.add_fact("lives in Berlin")
+        manager.close()  # 写出所有未保存的修改
+    """
+
+    def __init__(
+        self,
+        base_dir: str = "user_memories",
+        factory: Optional[MemoryFactory] = None,
+        max_users: int = 128,
+        max_bytes: Optional[int] = 64 * 1024 * 1024
+    ):
+        """
+        参数:
+            base_dir: 默认工厂存放每个用户 JSON 文件的目录
+            factory: 根据用户 ID 创建 Memory 的函数（默认每个用户一个 JSON 文件、写回模式）
+            max_users: 最多缓存的用户数
+            max_bytes: 缓存中所有 Memory 的估算字节数上限（None 表示不限）
+        """
+        self.base_dir = base_dir
+        self.factory = factory or self._default_factory
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, Memory]" = OrderedDict()
+        # 正在加载 / 正在写回的用户，访问它们时等待对应事件
+        self._loading: Dict[str, threading.Event] = {}
+        self._evicting: Dict[str, threading.Event] = {}
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+        self.stats = {
+            "hits": 0, "misses": 0, "evictions": 0,
+            "loads": 0, "load_seconds": 0.0,
+            "flushes": 0, "flushed_ops": 0, "flush_errors": 0,
+            "flush_seconds": 0.0, "max_flush_seconds": 0.0,
+        }
+
+    def _default_factory(self, user_id: str) -> Memory:
+        os.makedirs(self.base_dir, exist_ok=True)
+        return Memory(os.path.join(self.base_dir, user_file_name(user_id)), autosave=False)
+
+    def get(self, user_id: str) -> Memory:
+        """获取用户的 Memory，不在缓存中时加载"""
+        while True:
+            with self._lock:
+                memory = self._users.get(user_id)
+                if memory is not None:
+                    self._users.move_to_end(user_id)
+                    self.stats["hits"] += 1
+                    evicted = self._collect_evictions()
+                    break
+                pending = self._loading.get(user_id) or self._evicting.get(user_id)
+                if pending is None:
+                    loading = threading.Event()
+                    self._loading[user_id] = loading
+                    self.stats["misses"] += 1
+                    break
+            # 其他线程正在加载该用户，或者该用户刚被淘汰、还没写回完成
+            pending.wait()
+
+        if memory is None:
+            memory, evicted = self._load(user_id, loading)
+        self._flush_evicted(evicted)
+        return memory
+
+    def _load(self, user_id: str, loading: threading.Event) -> Tuple[Memory, List[Tuple[str, Memory, threading.Event]]]:
+        start = time.perf_counter()
+        try:
+            memory = self.factory(user_id)
+        except BaseException:
+            with self._lock:
+                self._loading.pop(user_id, None)
+            loading.set()
+            raise
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._users[user_id] = memory
+            self._loading.pop(user_id, None)
+            self.stats["loads"] += 1
+            self.stats["load_seconds"] += elapsed
+            evicted = self._collect_evictions()
+        loading.set()
+        return memory, evicted
+
+    def _total_bytes(self) -> int:
+        return sum(m.estimated_bytes for m in self._users.values())
+
+    def _collect_evictions(self) -> List[Tuple[str, Memory, threading.Event]]:
+        """取出超出限制的最久未使用用户（调用方持有锁；最近访问的用户总是保留）"""
+        evicted = []
+        # 总大小只计算一次，之后每淘汰一个用户减去它的大小
+        total = self._total_bytes() if self.max_bytes is not None else 0
+        while len(self._users) > 1 and (
+            len(self._users) > self.max_users
+            or (self.max_bytes is not None and total > self.max_bytes)
+        ):
+            user_id, memory = self._users.popitem(last=False)
+            total -= memory.estimated_bytes
+            done = threading.Event()
+            self._evicting[user_id] = done
+            self.stats["evictions"] += 1
+            evicted.append((user_id, memory, done))
+        return evicted
+
+    def _write_back(self, user_id: str, memory: Memory) -> bool:
+        """
+        写出一个用户的未保存修改并记录耗时
+
+        返回:
+            是否写出成功
+        """
+        start = time.perf_counter()
+        try:
+            ops = memory.flush()
+        except Exception as e:
+            with self._lock:
+                self.stats["flush_errors"] += 1
+            print(f"[Memory] Failed to flush memory for user {user_id}: {e}")
+            return False
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats["flushes"] += 1
+            self.stats["flushed_ops"] += ops
+            self.stats["flush_seconds"] += elapsed
+            self.stats["max_flush_seconds"] = max(self.stats["max_flush_seconds"], elapsed)
+        return True
+
+    def _flush_evicted(self, evicted: List[Tuple[str, Memory, threading.Event]]) -> List[str]:
+        """
+        写回并关闭被淘汰的用户（在锁外执行，慢的写回不会阻塞其他用户的访问）
+
+        返回:
+            写回失败、重新放回缓存的用户
+        """
+        kept = []
+        for user_id, memory, done in evicted:
+            try:
+                if memory.dirty and not self._write_back(user_id, memory):
+                    # 写回失败：放回缓存的最久未使用端，保留未保存的修改，下次淘汰或定时写回时重试；
+                    # 否则下一次 get() 会从存储中加载到旧数据
+                    with self._lock:
+                        self._users[user_id] = memory
+                        self._users.move_to_end(user_id, last=False)
+                        self.stats["evictions"] -= 1
+                    kept.append(user_id)
+                    continue
+                memory.close()
+            except Exception as e:
+                print(f"[Memory] Failed to close memory for user {user_id}: {e}")
+            finally:
+                with self._lock:
+                    self._evicting.pop(user_id, None)
+                done.set()
+        return kept
+
+    def flush_all(self) -> int:
+        """
+        写出所有缓存用户的未保存修改（用户仍保留在缓存中）
+
+        返回:
+            写回成功的用户数
+        """
+        with self._lock:
+            dirty = [(u, m) for u, m in self._users.items() if m.dirty]
+        return sum(1 for user_id, memory in dirty if self._write_back(user_id, memory))
+
+    def start_flusher(self, interval: float = 5.0) -> None:
+        """
+        启动后台定时写回线程
+
+        参数:
+            interval: 两次 flush_all() 之间的间隔（秒），即崩溃时最多丢失的修改时间窗口
+        """
+        if self._flusher is not None:
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.flush_all()
+
+        self._flusher = threading.Thread(target=loop, name="memory-flusher", daemon=True)
+        self._flusher.start()
+
+    def stop_flusher(self) -> None:
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+
+    def evict(self, user_id: str) -> bool:
+        """
+        主动淘汰一个用户（先写回）
+
+        返回:
+            是否已淘汰（用户不在缓存中或写回失败时为 False）
+        """
+        with self._lock:
+            memory = self._users.pop(user_id, None)
+            if memory is None:
+                return False
+            done = threading.Event()
+            self._evicting[user_id] = done
+            self.stats["evictions"] += 1
+        return not self._flush_evicted([(user_id, memory, done)])
+
+    def close(self) -> None:
+        """停止定时写回，写回并关闭所有缓存的用户"""
+        self.stop_flusher()
+        with self._lock:
+            users = list(self._users)
+        failed = [user_id for user_id in users if not self.evict(user_id)]
+        if failed:
+            print(f"[Memory] {len(failed)} users could not be flushed and keep unsaved changes: {', '.join(failed)}")
+
+    def memories(self) -> List[Memory]:
+        """当前缓存中的所有 Memory（供后台任务遍历）"""
+        with self._lock:
+            return list(self._users.values())
+
+    def __contains__(self, user_id: str) -> bool:
+        with self._lock:
+            return user_id in self._users
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._users)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        返回:
+            {users, estimated_bytes, dirty_users, hits, misses, hit_rate, evictions,
+             loads, avg_load_ms, flushes, flushed_ops, flush_errors, avg_flush_ms, max_flush_ms}
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["users"] = len(self._users)
+            stats["estimated_bytes"] = self._total_bytes()
+            stats["dirty_users"] = sum(1 for m in self._users.values() if m.dirty)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["avg_load_ms"] = stats.pop("load_seconds") / stats["loads"] * 1000 if stats["loads"] else 0.0
+        flush_seconds = stats.pop("flush_seconds")
+        stats["avg_flush_ms"] = flush_seconds / stats["flushes"] * 1000 if stats["flushes"] else 0.0
+        stats["max_flush_ms"] = stats.pop("max_flush_seconds") * 1000
+        return stats
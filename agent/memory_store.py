@@ -0,0 +1,382 @@
+"""
+记忆持久化后端
+
+Memory 的每次修改都以一条操作记录 (op, payload) 交给后端持久化:
+- JSONFileBackend: 每次修改原子地重写整个 JSON 文件（临时文件 + fsync + os.replace），
+  与原来的 user_memory.json 格式完全兼容
+- WALBackend: 只向预写日志 (WAL) 追加一行小记录，按 fsync 策略刷盘；
+  记录数达到阈值后在后台线程中把当前数据压缩成快照并丢弃旧日志。
+  加载时读取快照并重放日志（重放是幂等的，压缩中途崩溃也不会重复数据）
+
+快照文件就是普通的 Memory JSON 文件，因此两种后端可以互相切换。
+"""
+
+import copy
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# fsync 策略
+FSYNC_ALWAYS = "always"      # 每条记录都 fsync，最安全
+FSYNC_INTERVAL = "interval"  # 后台线程每 fsync_interval 秒 fsync 一次未落盘的记录（最多丢失最近 fsync_interval 秒的写入）
+FSYNC_NEVER = "never"        # 只 flush 到操作系统，由操作系统决定何时落盘
+
+
+def empty_memory_data() -> Dict[str, Any]:
+    return {"profile": {}, "preferences": [], "facts": []}
+
+
+# 列表型操作 -> 对应的数据字段
+LIST_OP_FIELDS = {"add_preference": "preferences", "add_fact": "facts"}
+
+MembershipSets = Dict[str, Set[str]]
+
+
+def build_membership(data: Dict[str, Any]) -> MembershipSets:
+    """为偏好和事实建立哈希集合，用于 O(1) 去重"""
+    return {field: set(data[field]) for field in LIST_OP_FIELDS.values()}
+
+
+def apply_op(
+    data: Dict[str, Any],
+    op: str,
+    payload: Dict[str, Any],
+    seen: Optional[MembershipSets] = None
+) -> bool:
+    """
+    把一条操作应用到记忆数据上
+
+    参数:
+        data: 记忆数据
+        op, payload: 操作记录
+        seen: build_membership() 得到的集合（会同步更新）；None 时退化为线性查找
+
+    返回:
+        数据是否发生变化（重复的偏好/事实不会重复添加，因此重放日志是幂等的）
+    """
+    if op == "set_profile":
+        key, value = payload["key"], payload["value"]
+        if key in data["profile"] and data["profile"][key] == value:
+            return False
+        data["profile"][key] = value
+        return True
+    field = LIST_OP_FIELDS.get(op)
+    if field is None:
+        raise ValueError(f"Unknown memory op: {op}")
+    value = payload["value"]
+    if value in (seen[field] if seen is not None else data[field]):
+        return False
+    data[field].append(value)
+    if seen is not None:
+        seen[field].add(value)
+    return True
+
+
+def _normalize(data: Dict[str, Any]) -> Dict[str, Any]:
+    """确保存储结构完整"""
+    data.setdefault("profile", {})
+    data.setdefault("preferences", [])
+    data.setdefault("facts", [])
+    return data
+
+
+def write_json_atomic(path: str, data: Dict[str, Any], indent: Optional[int] = 2) -> None:
+    """原子地写入 JSON：先写临时文件并 fsync，再用 os.replace 替换，崩溃时旧文件保持完整"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_json(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return empty_memory_data()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return _normalize(json.load(f))
+    except (OSError, ValueError) as e:
+        print(f"[Memory] Failed to load {path}: {e}")
+        return empty_memory_data()
+
+
+class MemoryBackend:
+    """持久化后端接口"""
+
+    def load(self) -> Dict[str, Any]:
+        """加载记忆数据"""
+        raise NotImplementedError
+
+    def append(self, op: str, payload: Dict[str, Any], data: Dict[str, Any]) -> None:
+        """
+        持久化一次修改（调用方持有 Memory 的锁）
+
+        参数:
+            op, payload: 操作记录
+            data: 应用修改后的完整数据
+        """
+        raise NotImplementedError
+
+    def append_many(self, records: List[Tuple[str, Dict[str, Any]]], data: Dict[str, Any]) -> None:
+        """持久化一批修改（调用方持有 Memory 的锁）"""
+        for op, payload in records:
+            self.append(op, payload, data)
+
+    def save(self, data: Dict[str, Any]) -> None:
+        """完整保存一次数据"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JSONFileBackend(MemoryBackend):
+    """每次修改原子地重写整个 JSON 文件"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def load(self) -> Dict[str, Any]:
+        return read_json(self.file_path)
+
+    def append(self, op: str, payload: Dict[str, Any], data: Dict[str, Any]) -> None:
+        self.save(data)
+
+    def append_many(self, records: List[Tuple[str, Dict[str, Any]]], data: Dict[str, Any]) -> None:
+        # 整个文件重写一次即可包含全部修改
+        self.save(data)
+
+    def save(self, data: Dict[str, Any]) -> None:
+        write_json_atomic(self.file_path, data)
+
+
+class WALBackend(MemoryBackend):
+    """
+    预写日志后端
+
+    文件:
+        snapshot_path: 快照（普通 Memory JSON）
+        wal_path: 当前日志，每行一条 JSON 记录 {"op": ..., ...}
+        wal_path + ".old": 正在压缩的旧日志，压缩完成后删除
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str = "user_memory.json",
+        wal_path: Optional[str] = None,
+        fsync: str = FSYNC_INTERVAL,
+        fsync_interval: float = 1.0,
+        compact_every: int = 1000,
+        background_compaction: bool = True
+    ):
+        """
+        参数:
+            snapshot_path: 快照文件路径
+            wal_path: 日志文件路径（默认 snapshot_path + ".wal"）
+            fsync: fsync 策略，"always" / "interval" / "never"
+            fsync_interval: "interval" 策略下后台定时 fsync 的间隔（秒）
+            compact_every: 日志记录数达到该值后压缩成快照
+            background_compaction: 是否在后台线程中写快照
+        """
+        if fsync not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f"不支持的 fsync 策略: {fsync}")
+        self.snapshot_path = snapshot_path
+        self.wal_path = wal_path or f"{snapshot_path}.wal"
+        self.old_wal_path = f"{self.wal_path}.old"
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.background_compaction = background_compaction
+
+        self._file = None
+        self._records = 0
+        self._dirty = False
+        # 保护 _file / _dirty：定时 fsync 线程与写入线程共用同一个文件对象
+        self._file_lock = threading.Lock()
+        self._compaction: Optional[threading.Thread] = None
+        self._fsync_thread: Optional[threading.Thread] = None
+        self._fsync_stop = threading.Event()
+
+        self.stats = {
+            "appends": 0, "fsyncs": 0, "compactions": 0, "replayed": 0,
+            "torn_records": 0, "corrupt_records": 0
+        }
+
+    # ---- 加载 ----
+
+    def _replay(self, path: str, data: Dict[str, Any], seen: MembershipSets) -> int:
+        """
+        重放日志，返回成功应用的记录数
+
+        只有最后一行没有换行符时才视为崩溃时写了一半的记录并截掉；
+        中间无法解析的完整行说明文件已损坏，记录日志后跳过，继续重放后面的记录
+        """
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        good_offset = 0
+        torn = False
+        with open(path, "rb") as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.endswith(b"\n"):
+                    # 只可能出现在文件末尾
+                    torn = True
+                    break
+                good_offset += len(line)
+                try:
+                    record = json.loads(line)
+                    op = record.pop("op")
+                    apply_op(data, op, record, seen)
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    self.stats["corrupt_records"] += 1
+                    print(f"[Memory] Skipping corrupt record at {path}:{lineno}: {e}")
+                    continue
+                count += 1
+        if torn:
+            self.stats["torn_records"] += 1
+            print(f"[Memory] Truncating torn record at end of {path}")
+            with open(path, "r+b") as f:
+                f.truncate(good_offset)
+        return count
+
+    def load(self) -> Dict[str, Any]:
+        self.wait_for_compaction()
+        data = read_json(self.snapshot_path)
+        seen = build_membership(data)
+        replayed = self._replay(self.old_wal_path, data, seen)
+        replayed += self._replay(self.wal_path, data, seen)
+        self.stats["replayed"] += replayed
+        if os.path.exists(self.old_wal_path):
+            # 上次压缩没完成：当前数据已包含两段日志，先写出完整快照再删除日志
+            write_json_atomic(self.snapshot_path, data)
+            os.remove(self.old_wal_path)
+            if os.path.exists(self.wal_path):
+                os.remove(self.wal_path)
+            self.stats["compactions"] += 1
+            replayed = 0
+        self._records = replayed
+        return data
+
+    # ---- 写入 ----
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.wal_path, "ab")
+        if self.fsync == FSYNC_INTERVAL and self._fsync_thread is None:
+            self._fsync_stop.clear()
+            self._fsync_thread = threading.Thread(
+                target=self._fsync_loop, name="memory-wal-fsync", daemon=True
+            )
+            self._fsync_thread.start()
+        return self._file
+
+    def _sync(self, force: bool = False) -> None:
+        """调用方需持有 _file_lock"""
+        f = self._file
+        if f is None:
+            return
+        f.flush()
+        if self._dirty and (force or self.fsync == FSYNC_ALWAYS):
+            os.fsync(f.fileno())
+            self._dirty = False
+            self.stats["fsyncs"] += 1
+
+    def _fsync_loop(self) -> None:
+        """"interval" 策略：定时把已写入但未 fsync 的记录落盘"""
+        while not self._fsync_stop.wait(self.fsync_interval):
+            with self._file_lock:
+                try:
+                    self._sync(force=True)
+                except (OSError, ValueError) as e:
+                    print(f"[Memory] WAL fsync failed: {e}")
+
+    def _stop_fsync_thread(self) -> None:
+        if self._fsync_thread is not None:
+            self._fsync_stop.set()
+            self._fsync_thread.join()
+            self._fsync_thread = None
+
+    def append(self, op: str, payload: Dict[str, Any], data: Dict[str, Any]) -> None:
+        self.append_many([(op, payload)], data)
+
+    def append_many(self, records: List[Tuple[str, Dict[str, Any]]], data: Dict[str, Any]) -> None:
+        # 一批记录一次写入、一次刷盘
+        lines = []
+        for op, payload in records:
+            record = {"op": op}
+            record.update(payload)
+            lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        with self._file_lock:
+            f = self._open()
+            f.write("".join(lines).encode("utf-8"))
+            self._dirty = True
+            self._sync()
+        self._records += len(records)
+        self.stats["appends"] += len(records)
+
+        if self._records >= self.compact_every:
+            self._start_compaction(data)
+
+    # ---- 压缩 ----
+
+    def _rotate(self) -> None:
+        """把当前日志改名为旧日志，之后的记录写入新日志"""
+        with self._file_lock:
+            self._sync(force=True)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if os.path.exists(self.wal_path):
+            os.replace(self.wal_path, self.old_wal_path)
+        self._records = 0
+
+    def _write_snapshot(self, data: Dict[str, Any]) -> None:
+        write_json_atomic(self.snapshot_path, data)
+        if os.path.exists(self.old_wal_path):
+            os.remove(self.old_wal_path)
+        self.stats["compactions"] += 1
+
+    def _compact_now(self, data_copy: Dict[str, Any]) -> None:
+        self._rotate()
+        self._write_snapshot(data_copy)
+
+    def _start_compaction(self, data: Dict[str, Any]) -> None:
+        # 上一次压缩还在进行时先等待，保证任意时刻最多只有一个旧日志
+        self.wait_for_compaction()
+        # 调用方持有 Memory 的锁：此刻的数据副本恰好包含旧日志中的全部记录
+        data_copy = copy.deepcopy(data)
+        self._rotate()
+        if not self.background_compaction:
+            self._write_snapshot(data_copy)
+            return
+        self._compaction = threading.Thread(
+            target=self._write_snapshot, args=(data_copy,), name="memory-compaction", daemon=True
+        )
+        self._compaction.start()
+
+    def wait_for_compaction(self) -> None:
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+
+    def save(self, data: Dict[str, Any]) -> None:
+        """立即压缩：写出快照并清空日志"""
+        self.wait_for_compaction()
+        self._compact_now(copy.deepcopy(data))
+
+    def close(self) -> None:
+        self.wait_for_compaction()
+        self._stop_fsync_thread()
+        with self._file_lock:
+            self._sync(force=True)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["pending_records"] = self._records
+        stats["fsync_policy"] = self.fsync
+        return stats
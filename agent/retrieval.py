@@ -0,0 +1,278 @@
+"""
+轻量级检索 - 关键词 (BM25) + 可选的本地向量相似度
+
+- KeywordIndex: 通用的 BM25 倒排索引，支持中英文混合文本
+- ToolSelector: 为当前输入挑选最相关的 top-k 工具，只把它们的描述放进提示词
+
+向量检索是可选的：传入 embed_fn（本地 embedding 函数，输入文本列表，返回向量列表）即可启用。
+"""
+
+import math
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from llm.tokens import estimate_tokens
+
+EmbedFn = Callable[[List[str]], List[Sequence[float]]]
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CJK_RE = re.compile(r"[一-鿿]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "of", "to", "in", "for", "on", "with", "and", "or",
+    "what", "how", "me", "it", "this", "that", "use", "when", "you", "your", "i",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：英文按单词（拆分驼峰命名），中文按单字和相邻双字
+    """
+    if not text:
+        return []
+    text = _CAMEL_RE.sub(" ", text).lower()
+    tokens = [w for w in _WORD_RE.findall(text) if w not in STOPWORDS]
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class KeywordIndex:
+    """
+    BM25 倒排索引
+
+    用法:
+        index = KeywordIndex()
+        index.add("doc1", "some text")
+        index.search("query", k=5)  # [(doc_id, score), ...]
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_lengths
+
+    def add(self, doc_id: str, text: str) -> None:
+        """添加（或替换）一个文档"""
+        if doc_id in self._doc_lengths:
+            self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        self._doc_terms[doc_id] = list(counts)
+        length = sum(counts.values())
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: str) -> None:
+        """删除一个文档"""
+        length = self._doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._doc_terms.pop(doc_id, []):
+            docs = self._postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self._postings[term]
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._doc_terms.clear()
+        self._doc_lengths.clear()
+        self._total_length = 0
+
+    def scores(self, query: str) -> Dict[str, float]:
+        """计算查询与每个相关文档的 BM25 分数（只返回分数 > 0 的文档）"""
+        n_docs = len(self._doc_lengths)
+        if n_docs == 0:
+            return {}
+        avg_length = self._total_length / n_docs or 1.0
+
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            docs = self._postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return scores
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """返回分数最高的 k 个文档"""
+        ranked = sorted(self.scores(query).items(), key=lambda item: item[1], reverse=True)
+        return ranked[:k]
+
+
+class _ToolIndex:
+    """一次建好的工具索引，建好后不再修改，多个线程可以同时读取"""
+
+    def __init__(
+        self,
+        version: Optional[int],
+        keyword: KeywordIndex,
+        tools: Dict[str, object],
+        vectors: Dict[str, Sequence[float]],
+        desc_tokens: Dict[str, int]
+    ):
+        self.version = version
+        self.keyword = keyword
+        self.tools = tools
+        self.vectors = vectors
+        self.desc_tokens = desc_tokens
+
+
+class ToolSelector:
+    """
+    工具选择器 - 按相关性只暴露 top-k 个工具
+
+    打分 = BM25 归一化分数 + vector_weight * 向量余弦相似度（启用 embed_fn 时）。
+    固定工具 (pinned) 总是出现在提示词中，不占 top-k 名额。
+
+    同一个选择器由所有 Agent 线程共享：重建索引时在局部变量中建好新索引，
+    再用一次引用赋值替换，select() 读到的总是完整的旧索引或新索引。
+    """
+
+    def __init__(
+        self,
+        top_k: int = 5,
+        pinned: Optional[Iterable[str]] = None,
+        embed_fn: Optional[EmbedFn] = None,
+        vector_weight: float = 0.5,
+        min_score: float = 0.0
+    ):
+        """
+        参数:
+            top_k: 每次最多选择的（非固定）工具数
+            pinned: 总是暴露的工具名称
+            embed_fn: 可选的本地 embedding 函数
+            vector_weight: 向量相似度的权重
+            min_score: 低于该分数的工具不会被选中
+        """
+        self.top_k = top_k
+        self.pinned = list(pinned or [])
+        self.embed_fn = embed_fn
+        self.vector_weight = vector_weight
+        self.min_score = min_score
+
+        self._index = _ToolIndex(None, KeywordIndex(), {}, {}, {})
+        self._stats_lock = threading.Lock()
+
+        self.stats = {"selections": 0, "full_tokens": 0, "selected_tokens": 0}
+
+    @property
+    def indexed_version(self) -> Optional[int]:
+        """已索引的工具注册器快照版本（未按版本索引时为 None）"""
+        return self._index.version
+
+    @staticmethod
+    def _describe(tool) -> str:
+        return f"- {tool.name}: {tool.description}"
+
+    def index_tools(self, tools: Iterable, version: Optional[int] = None) -> None:
+        """
+        （重新）建立工具索引
+
+        参数:
+            tools: 工具列表
+            version: 工具集合对应的注册器快照版本，调用方据此判断是否需要重建
+        """
+        keyword = KeywordIndex()
+        tool_map = {t.name: t for t in tools}
+        desc_tokens = {}
+        for name, tool in tool_map.items():
+            keyword.add(name, f"{name} {tool.description}")
+            desc_tokens[name] = estimate_tokens(self._describe(tool))
+
+        vectors = {}
+        if self.embed_fn and tool_map:
+            names = list(tool_map)
+            vectors = dict(zip(names, self.embed_fn([f"{n}: {tool_map[n].description}" for n in names])))
+
+        self._index = _ToolIndex(version, keyword, tool_map, vectors, desc_tokens)
+
+    def indexed_names(self) -> List[str]:
+        return list(self._index.tools)
+
+    def rank(self, query: str) -> List[Tuple[str, float]]:
+        """对所有工具打分并排序"""
+        return self._rank(self._index, query)
+
+    def _rank(self, index: _ToolIndex, query: str) -> List[Tuple[str, float]]:
+        keyword = index.keyword.scores(query)
+        top = max(keyword.values()) if keyword else 0.0
+        combined = {name: score / top for name, score in keyword.items()} if top else {}
+
+        if index.vectors:
+            query_vector = self.embed_fn([query])[0]
+            for name, vector in index.vectors.items():
+                combined[name] = combined.get(name, 0.0) + self.vector_weight * _cosine(query_vector, vector)
+
+        return sorted(
+            ((n, s) for n, s in combined.items() if s > self.min_score),
+            key=lambda item: item[1],
+            reverse=True
+        )
+
+    def select(self, query: str) -> List:
+        """
+        选择要暴露给 LLM 的工具
+
+        返回:
+            工具列表：固定工具在前，其余按相关性排序
+        """
+        # 整个选择过程只读同一个索引对象，期间另一个线程重建索引也不受影响
+        index = self._index
+        selected = [index.tools[n] for n in self.pinned if n in index.tools]
+        chosen = {t.name for t in selected}
+        picked = 0
+        for name, _ in self._rank(index, query):
+            if picked >= self.top_k:
+                break
+            if name in chosen:
+                continue
+            selected.append(index.tools[name])
+            chosen.add(name)
+            picked += 1
+
+        full_tokens = sum(index.desc_tokens.values())
+        selected_tokens = sum(index.desc_tokens[t.name] for t in selected)
+        with self._stats_lock:
+            self.stats["selections"] += 1
+            self.stats["full_tokens"] += full_tokens
+            self.stats["selected_tokens"] += selected_tokens
+        return selected
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        获取节省的提示词 token 统计
+
+        返回:
+            {selections, full_tokens, selected_tokens, saved_tokens, saved_ratio}
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["saved_tokens"] = stats["full_tokens"] - stats["selected_tokens"]
+        stats["saved_ratio"] = stats["saved_tokens"] / stats["full_tokens"] if stats["full_tokens"] else 0.0
+        return stats
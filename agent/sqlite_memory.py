@@ -0,0 +1,414 @@
+"""
+SQLite 记忆存储 - 多用户、多进程共享一个数据库
+
+与 Memory 接口相同（update_profile / add_preference / add_fact / get_context / save / close），
+RememberTool 和 EnhancedChatAgent 无需修改即可使用:
+- 所有用户存放在同一个数据库中，按 user_id 区分
+- WAL 日志模式 + busy_timeout：多个进程可以同时读写同一个用户，读不阻塞写
+- 偏好和事实建立 FTS5 全文索引，get_context 按 BM25 只取最相关的条目，不把全部记忆读进内存
+- 写入先进入缓冲区，攒够 batch_size 条或超过 flush_interval 秒后在一个事务中批量提交；
+  读取前会先提交缓冲区，保证读到自己的写入
+- 偏好/事实由唯一约束去重，并发写入同一条记忆也只会保存一次
+
+FTS5 中存放的是 retrieval.tokenize 的分词结果（英文单词 + 中文单字和双字），
+因此中英文检索行为与内存版 Memory 的关键词索引一致。
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from llm.tokens import estimate_tokens
+from .memory import format_context
+from .retrieval import tokenize
+
+# 条目类型 -> Memory 数据中的字段
+_KINDS = {"preference": "preferences", "fact": "facts"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profile (
+    user_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (user_id, kind, text)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(user_key, terms);
+"""
+
+
+def _user_key(user_id: str) -> str:
+    """FTS5 中的用户标识：固定格式的哈希，避免 user_id 中的特殊字符被分词"""
+    return "u" + hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:16]
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+class SQLiteMemory:
+    """
+    基于 SQLite 的用户记忆
+
+    用法:
+        memory = SQLiteMemory("user_memory.db", user_id="alice")
+        memory.add_fact("lives in Berlin")
+        memory.get_context("where do I live?", top_k=5, token_budget=200)
+    """
+
+    def __init__(
+        self,
+        db_path: str = "user_memory.db",
+        user_id: str = "default",
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        busy_timeout: float = 5.0,
+        max_term_docs: int = 1000
+    ):
+        """
+        参数:
+            db_path: 数据库文件路径
+            user_id: 用户标识
+            batch_size: 缓冲区达到该条数时立即提交
+            flush_interval: 缓冲的写入最多延迟多少秒提交（后台线程定期提交）
+            busy_timeout: 等待其他进程释放写锁的最长时间（秒）
+            max_term_docs: 查询词在该用户超过这么多条记忆中出现时视为常见词，不参与检索
+                           （常见词几乎不影响排序，却会让 BM25 为大量条目打分）
+        """
+        self.db_path = db_path
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_term_docs = max_term_docs
+        self._user_key = _user_key(user_id)
+
+        self._lock = threading.RLock()
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        # 当前用户条目的估算 token 总数（首次使用时统计，之后随本实例的写入累加，仅用于统计）
+        self._total_tokens: Optional[int] = None
+
+        self._conn = sqlite3.connect(
+            db_path, timeout=busy_timeout, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        self.stats = {
+            "writes": 0, "batches": 0, "inserted": 0,
+            "context_calls": 0, "full_tokens": 0, "injected_tokens": 0,
+        }
+
+    # ---- 写入 ----
+
+    def _enqueue(self, op: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._conn is None:
+                raise RuntimeError("SQLiteMemory 已关闭")
+            self._pending.append((op, payload))
+            self.stats["writes"] += 1
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+            elif self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name="memory-sqlite-flush", daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                # 保留缓冲区，下一轮重试
+                print(f"[Memory] SQLite flush failed: {e}")
+
+    def _write(self, op: str, payload: Dict[str, Any], now: float) -> None:
+        if op == "set_profile":
+            self._conn.execute(
+                "INSERT INTO profile (user_id, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value",
+                (self.user_id, payload["key"], json.dumps(payload["value"], ensure_ascii=False))
+            )
+            return
+        kind = op[len("add_"):]
+        if kind not in _KINDS:
+            raise ValueError(f"Unknown memory op: {op}")
+        text = payload["value"]
+        tokens = estimate_tokens(text) + 1
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO entries (user_id, kind, text, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+            (self.user_id, kind, text, tokens, now)
+        )
+        if cursor.rowcount == 1:
+            if self._total_tokens is not None:
+                self._total_tokens += tokens
+            self._conn.execute(
+                "INSERT INTO entries_fts (rowid, user_key, terms) VALUES (?, ?, ?)",
+                (cursor.lastrowid, self._user_key, " ".join(tokenize(text)))
+            )
+            self.stats["inserted"] += 1
+
+    def flush(self) -> int:
+        """
+        在一个事务中提交缓冲区中的全部写入
+
+        返回:
+            提交的写入条数
+        """
+        with self._lock:
+            if not self._pending or self._conn is None:
+                return 0
+            pending = self._pending
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for op, payload in pending:
+                    self._write(op, payload, now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pending = []
+            self.stats["batches"] += 1
+            return len(pending)
+
+    def update_profile(self, key: str, value: Any):
+        """更新用户基础属性（如姓名、年龄、职业）"""
+        self._enqueue("set_profile", {"key": key, "value": value})
+
+    def add_preference(self, preference: str):
+        """添加用户偏好（如喜欢 Python，讨厌香菜）"""
+        self._enqueue("add_preference", {"value": preference})
+
+    def add_fact(self, fact: str):
+        """添加关于用户的通用事实或对话中的重要信息"""
+        self._enqueue("add_fact", {"value": fact})
+
+    def replace_entries(self, field: str, old: List[str], new: List[str]) -> bool:
+        """
+        在一个事务中改写偏好或事实（参数和返回值同 Memory.replace_entries）
+
+        old 中不再出现在 new 里的条目被删除，new 中新出现的条目追加在末尾。
+        """
+        kind = next(k for k, f in _KINDS.items() if f == field)
+        with self._lock:
+            self.flush()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, text FROM entries WHERE user_id = ? AND kind = ? ORDER BY id",
+                    (self.user_id, kind)
+                ).fetchall()
+                if [text for _, text in rows[:len(old)]] != old:
+                    self._conn.execute("ROLLBACK")
+                    return False
+                keep = set(new)
+                removed = [(entry_id,) for entry_id, text in rows[:len(old)] if text not in keep]
+                self._conn.executemany("DELETE FROM entries WHERE id = ?", removed)
+                self._conn.executemany("DELETE FROM entries_fts WHERE rowid = ?", removed)
+                now = time.time()
+                for text in new:
+                    self._write(f"add_{kind}", {"value": text}, now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._total_tokens = None
+            return True
+
+    def save(self):
+        """提交缓冲区"""
+        self.flush()
+
+    def close(self):
+        """提交缓冲区并关闭数据库连接"""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._lock:
+            if self._conn is None:
+                return
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未提交的写入"""
+        return bool(self._pending)
+
+    @property
+    def estimated_bytes(self) -> int:
+        """常驻内存的估算大小（字节）：数据在数据库中，只计算写缓冲区"""
+        with self._lock:
+            return sum(len(json.dumps(payload, ensure_ascii=False).encode("utf-8")) for _, payload in self._pending)
+
+    # ---- 读取 ----
+
+    def _profile(self) -> Dict[str, Any]:
+        rows = self._conn.execute(
+            "SELECT key, value FROM profile WHERE user_id = ? ORDER BY rowid", (self.user_id,)
+        )
+        return {key: json.loads(value) for key, value in rows}
+
+    def _entries(self, ids: Optional[List[int]] = None) -> Dict[str, List[str]]:
+        """按插入顺序读取偏好和事实（ids 为 None 时读取全部）"""
+        sql = "SELECT kind, text FROM entries WHERE user_id = ?"
+        params: List[Any] = [self.user_id]
+        if ids is not None:
+            if not ids:
+                return {field: [] for field in _KINDS.values()}
+            sql += f" AND id IN ({','.join('?' * len(ids))})"
+            params.extend(ids)
+        sections: Dict[str, List[str]] = {field: [] for field in _KINDS.values()}
+        for kind, text in self._conn.execute(sql + " ORDER BY id", params):
+            sections[_KINDS[kind]].append(text)
+        return sections
+
+    def _totals(self) -> int:
+        """当前用户条目的估算 token 总数"""
+        if self._total_tokens is None:
+            self._total_tokens = self._conn.execute(
+                "SELECT COALESCE(SUM(tokens), 0) FROM entries WHERE user_id = ?", (self.user_id,)
+            ).fetchone()[0]
+        return self._total_tokens
+
+    def _fits_all(self, top_k: Optional[int], token_budget: Optional[int]) -> bool:
+        """全部条目是否都在 top_k 和 token 预算之内（只读取到超出为止）"""
+        sql = "SELECT tokens FROM entries WHERE user_id = ?"
+        params: List[Any] = [self.user_id]
+        if top_k is not None:
+            sql += " LIMIT ?"
+            params.append(top_k + 1)
+        count = used = 0
+        for (tokens,) in self._conn.execute(sql, params):
+            count += 1
+            used += tokens
+            if (top_k is not None and count > top_k) or (token_budget is not None and used > token_budget):
+                return False
+        return True
+
+    def _match(self, terms: List[str]) -> str:
+        return f"user_key : {_quote(self._user_key)} AND terms : ({' OR '.join(_quote(t) for t in terms)})"
+
+    def _term_docs(self, term: str) -> int:
+        """该词在当前用户的多少条记忆中出现（最多数到 max_term_docs）"""
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM (SELECT rowid FROM entries_fts WHERE entries_fts MATCH ? LIMIT ?)",
+            (self._match([term]), self.max_term_docs)
+        ).fetchone()[0]
+
+    def _rank(self, query: str, limit: int) -> List[Tuple[int, int, float]]:
+        """FTS5 检索，返回 [(条目 id, token 数, 分数), ...]，分数越高越相关"""
+        counts = {term: self._term_docs(term) for term in set(tokenize(query))}
+        counts = {term: n for term, n in counts.items() if n > 0}
+        if not counts:
+            return []
+        terms = sorted(term for term, n in counts.items() if n < self.max_term_docs)
+        # 全是常见词时为每条匹配打分既慢又区分不出相关性，改为取包含最少见词的最新条目
+        order = "rank" if terms else "entries_fts.rowid DESC"
+        terms = terms or [min(counts, key=counts.get)]
+        rows = self._conn.execute(
+            "SELECT e.id, e.tokens, bm25(entries_fts, 0.0, 1.0) AS rank "
+            "FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid "
+            f"WHERE entries_fts MATCH ? ORDER BY {order} LIMIT ?",
+            (self._match(terms), limit)
+        )
+        # bm25() 越小越相关，取反后与 Memory.search 的分数方向一致
+        return [(entry_id, tokens, -rank) for entry_id, tokens, rank in rows]
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        检索与 query 最相关的偏好和事实
+
+        返回:
+            [(文本, 分数), ...]
+        """
+        with self._lock:
+            self.flush()
+            ranked = self._rank(query, k)
+            if not ranked:
+                return []
+            texts = dict(self._conn.execute(
+                f"SELECT id, text FROM entries WHERE id IN ({','.join('?' * len(ranked))})",
+                [entry_id for entry_id, _, _ in ranked]
+            ).fetchall())
+            return [(texts[entry_id], score) for entry_id, _, score in ranked]
+
+    def get_context(
+        self,
+        query: Optional[str] = None,
+        top_k: Optional[int] = None,
+        token_budget: Optional[int] = None
+    ) -> str:
+        """
+        获取格式化的记忆上下文，用于注入 System Prompt（参数含义同 Memory.get_context）
+        """
+        with self._lock:
+            self.flush()
+            total_tokens = self._totals()
+            if query is None or (top_k is None and token_budget is None) or self._fits_all(top_k, token_budget):
+                sections = self._entries()
+                injected = total_tokens
+            else:
+                # 预算会跳过过长的条目，多取一些候选
+                limit = (top_k or 50) * 4
+                selected: List[int] = []
+                injected = 0
+                for entry_id, tokens, _ in self._rank(query, limit):
+                    if top_k is not None and len(selected) >= top_k:
+                        break
+                    if token_budget is not None and injected + tokens > token_budget:
+                        continue
+                    selected.append(entry_id)
+                    injected += tokens
+                sections = self._entries(selected)
+
+            self.stats["context_calls"] += 1
+            self.stats["full_tokens"] += total_tokens
+            self.stats["injected_tokens"] += injected
+            return format_context(self._profile(), sections["preferences"], sections["facts"])
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """当前用户的全部记忆（与 Memory.data 结构相同；会读取该用户的所有条目）"""
+        with self._lock:
+            self.flush()
+            data: Dict[str, Any] = {"profile": self._profile()}
+            data.update(self._entries())
+            return data
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取记忆规模、写入批次和上下文注入统计
+
+        返回:
+            {preferences, facts, pending, writes, batches, inserted, context_calls,
+             full_tokens, injected_tokens, saved_tokens, saved_ratio}
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending"] = len(self._pending)
+            for kind, field in _KINDS.items():
+                stats[field] = 0
+                if self._conn is not None:
+                    stats[field] = self._conn.execute(
+                        "SELECT COUNT(*) FROM entries WHERE user_id = ? AND kind = ?", (self.user_id, kind)
+                    ).fetchone()[0]
+        stats["saved_tokens"] = stats["full_tokens"] - stats["injected_tokens"]
+        stats["saved_ratio"] = stats["saved_tokens"] / stats["full_tokens"] if stats["full_tokens"] else 0.0
+        return stats
@@ -1,5 +1,60 @@
+import time
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
+from .tokens import estimate_messages_tokens, estimate_tokens
+
+
+class LLMResult:
+    """
+    一次 LLM 调用的结果：生成文本 + token 用量 + 耗时
+
+    属性:
+        text: 生成的文本
+        prompt_tokens: 提示词 token 数
+        completion_tokens: 生成 token 数
+        latency: 总耗时（秒）
+        time_to_first_token: 首 token 耗时（秒），非流式调用时为 None
+        model: 实际使用的模型名称
+        estimated: token 数是否为估算值（Provider 未返回真实用量）
+    """
+
+    def __init__(
+        self,
+        text: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        latency: float = 0.0,
+        time_to_first_token: Optional[float] = None,
+        model: Optional[str] = None,
+        estimated: bool = False
+    ):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.latency = latency
+        self.time_to_first_token = time_to_first_token
+        self.model = model
+        self.estimated = estimated
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def tokens_per_second(self) -> float:
+        """生成速度（生成 token 数 / 秒）"""
+        return self.completion_tokens / self.latency if self.latency > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency": self.latency,
+            "time_to_first_token": self.time_to_first_token,
+            "model": self.model,
+            "estimated": self.estimated,
+        }
+
 
 class BaseLLM(ABC):
     @abstractmethod
@@ -15,3 +70,33 @@ class BaseLLM(ABC):
             生成的文本。
         """
         pass
+
+    def generate_with_usage(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> LLMResult:
+        """
+        生成回复，并同时返回 token 用量和耗时。
+        
+        默认实现调用 generate() 并估算 token 数；能拿到真实用量的 Provider 应重写此方法。
+        
+        返回：
+            LLMResult
+        """
+        start = time.perf_counter()
+        text = self.generate(messages, stop=stop)
+        latency = time.perf_counter() - start
+        return LLMResult(
+            text=text,
+            prompt_tokens=estimate_messages_tokens(messages),
+            completion_tokens=estimate_tokens(text),
+            latency=latency,
+            model=getattr(self, "model", None) or type(self).__name__,
+            estimated=True
+        )
+
+    def generate_stream(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> Iterator[str]:
+        """
+        流式生成回复，逐块产出文本片段。
+        
+        默认实现一次性产出 generate() 的结果；支持流式接口的 Provider 应重写此方法。
+        调用方可以提前 close() 生成器以停止生成。
+        """
+        yield self.generate(messages, stop=stop)
@@ -0,0 +1,219 @@
+"""
+级联模型 (Model Cascade) - 简单轮次用小模型，困难轮次升级到大模型
+
+工作方式:
+1. 按顺序尝试各层级模型（通常从小而快的模型开始）
+2. 对每个回复做置信度检查:
+   - ACTION 格式错误（包含 ACTION 但无法解析）
+   - 调用了不存在的工具
+   - 模型自报的置信度低于阈值（CONFIDENCE: 0.x）
+3. 检查失败则升级到下一层级，最后一层的回复总是被接受
+
+每一层级都会统计调用次数、接受/升级次数、错误次数、延迟和 token 用量。
+"""
+
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+from .base import BaseLLM, LLMResult
+
+# 与 agent/core.py 中解析工具调用的正则保持一致
+ACTION_PATTERN = re.compile(r"ACTION:\s*(\w+)\s*\[(.*?)\]", re.IGNORECASE | re.DOTALL)
+CONFIDENCE_PATTERN = re.compile(r"^\s*CONFIDENCE:\s*([0-9]*\.?[0-9]+)\s*$", re.IGNORECASE | re.MULTILINE)
+
+CONFIDENCE_INSTRUCTION = (
+    "\nAfter your reply, add a final line 'CONFIDENCE: <0-1>' "
+    "to report how confident you are in the reply."
+)
+
+
+class CascadeLLM(BaseLLM):
+    """
+    级联 LLM - 先用小模型，置信度检查失败时升级到更大的模型
+
+    用法:
+        llm = CascadeLLM(
+            tiers=[("small", OpenAILLM(model="gpt-4o-mini")), ("large", OpenAILLM(model="gpt-4o"))],
+            known_tools=registry.get_tool_names,
+        )
+    """
+
+    def __init__(
+        self,
+        tiers: List[Union[BaseLLM, Tuple[str, BaseLLM]]],
+        known_tools: Optional[Union[Iterable[str], Callable[[], Iterable[str]]]] = None,
+        min_confidence: float = 0.6,
+        request_confidence: bool = False,
+        confidence_check: Optional[Callable[[str], Optional[str]]] = None
+    ):
+        """
+        初始化级联 LLM
+
+        参数:
+            tiers: 层级列表，从小到大。元素为 LLM 实例或 (名称, LLM) 元组
+            known_tools: 可用工具名称列表，或返回该列表的函数（用于检查未知工具）
+            min_confidence: 自报置信度的最低阈值
+            request_confidence: 是否要求非最终层级的模型在回复末尾自报置信度
+            confidence_check: 自定义检查函数，返回升级原因（None 表示通过）
+        """
+        if not tiers:
+            raise ValueError("CascadeLLM 至少需要一个层级")
+
+        self.tiers: List[Tuple[str, BaseLLM]] = []
+        for i, tier in enumerate(tiers):
+            if isinstance(tier, tuple):
+                self.tiers.append(tier)
+            else:
+                self.tiers.append((f"tier{i}", tier))
+
+        self.known_tools = known_tools
+        self.min_confidence = min_confidence
+        self.request_confidence = request_confidence
+        self.confidence_check = confidence_check
+
+        self._stats: Dict[str, Dict[str, float]] = {
+            name: {
+                "calls": 0,
+                "accepted": 0,
+                "escalated": 0,
+                "errors": 0,
+                "total_latency": 0.0,
+                "max_latency": 0.0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+            }
+            for name, _ in self.tiers
+        }
+        self.escalation_reasons: Dict[str, int] = {}
+
+    def _get_known_tools(self) -> Optional[List[str]]:
+        """获取当前可用的工具名称"""
+        if self.known_tools is None:
+            return None
+        if callable(self.known_tools):
+            return list(self.known_tools())
+        return list(self.known_tools)
+
+    def _check(self, response: str) -> Tuple[Optional[str], str]:
+        """
+        检查回复的置信度
+
+        返回:
+            (升级原因, 去掉置信度标记后的回复)。原因为 None 表示通过
+        """
+        if response is None or not response.strip():
+            return "empty_response", response or ""
+
+        # 提取并移除自报置信度
+        confidence = None
+        match = CONFIDENCE_PATTERN.search(response)
+        if match:
+            confidence = float(match.group(1))
+            response = CONFIDENCE_PATTERN.sub("", response).strip()
+
+        if confidence is not None and confidence < self.min_confidence:
+            return "low_confidence", response
+
+        action_match = ACTION_PATTERN.search(response)
+        if action_match is None and re.search(r"ACTION\s*:", response, re.IGNORECASE):
+            return "malformed_action", response
+
+        if action_match:
+            known = self._get_known_tools()
+            if known is not None and action_match.group(1) not in known:
+                return "unknown_tool", response
+
+        if self.confidence_check:
+            reason = self.confidence_check(response)
+            if reason:
+                return reason, response
+
+        return None, response
+
+    def _with_confidence_instruction(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """在系统提示词末尾追加自报置信度的要求"""
+        messages = [dict(m) for m in messages]
+        if messages and messages[0].get("role") == "system":
+            messages[0]["content"] = messages[0]["content"] + CONFIDENCE_INSTRUCTION
+        else:
+            messages.insert(0, {"role": "system", "content": CONFIDENCE_INSTRUCTION.strip()})
+        return messages
+
+    def _record(self, name: str, latency: float, outcome: str, result: Optional[LLMResult] = None) -> None:
+        stats = self._stats[name]
+        stats["calls"] += 1
+        stats[outcome] += 1
+        stats["total_latency"] += latency
+        stats["max_latency"] = max(stats["max_latency"], latency)
+        if result is not None:
+            stats["prompt_tokens"] += result.prompt_tokens
+            stats["completion_tokens"] += result.completion_tokens
+
+    def generate(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> str:
+        return self.generate_with_usage(messages, stop=stop).text
+
+    def generate_with_usage(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> LLMResult:
+        """
+        依次尝试各层级，返回被接受的回复
+
+        返回的用量包含所有尝试过的层级（升级前的小模型调用也计入成本）
+        """
+        last_index = len(self.tiers) - 1
+        cascade_start = time.perf_counter()
+        spent_prompt_tokens = 0
+        spent_completion_tokens = 0
+
+        for i, (name, llm) in enumerate(self.tiers):
+            is_last = i == last_index
+            tier_messages = messages
+            if self.request_confidence and not is_last:
+                tier_messages = self._with_confidence_instruction(messages)
+
+            start = time.perf_counter()
+            try:
+                result = llm.generate_with_usage(tier_messages, stop=stop)
+            except Exception:
+                self._record(name, time.perf_counter() - start, "errors")
+                if is_last:
+                    raise
+                self.escalation_reasons["error"] = self.escalation_reasons.get("error", 0) + 1
+                continue
+            latency = time.perf_counter() - start
+
+            reason, cleaned = self._check(result.text)
+            if reason is None or is_last:
+                self._record(name, latency, "accepted", result)
+                result.text = cleaned
+                result.prompt_tokens += spent_prompt_tokens
+                result.completion_tokens += spent_completion_tokens
+                result.latency = time.perf_counter() - cascade_start
+                return result
+
+            self._record(name, latency, "escalated", result)
+            self.escalation_reasons[reason] = self.escalation_reasons.get(reason, 0) + 1
+            spent_prompt_tokens += result.prompt_tokens
+            spent_completion_tokens += result.completion_tokens
+
+        # 最后一层要么返回要么抛出异常，不会走到这里
+        raise RuntimeError("CascadeLLM 没有可用的层级")
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        获取每个层级的统计信息
+
+        返回:
+            {层级名称: {calls, accepted, escalated, errors, avg_latency, max_latency, ...}}
+        """
+        result = {}
+        for name, stats in self._stats.items():
+            entry = dict(stats)
+            entry["avg_latency"] = stats["total_latency"] / stats["calls"] if stats["calls"] else 0.0
+            result[name] = entry
+        return result
+
+    def reset_stats(self) -> None:
+        """重置统计信息"""
+        for stats in self._stats.values():
+            for key in stats:
+                stats[key] = 0
+        self.escalation_reasons.clear()
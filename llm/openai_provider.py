@@ -1,22 +1,149 @@
 import os
-from typing import List, Dict, Optional
-from .base import BaseLLM
+import time
+from typing import Iterator, List, Dict, Optional
+from .base import BaseLLM, LLMResult
+from .tokens import estimate_messages_tokens, estimate_tokens
 
 class OpenAILLM(BaseLLM):
-    def __init__(self, model: str = "gpt-3.5-turbo", api_key: Optional[str] = None):
+    def __init__(
+        self,
+        model: str = "gpt-3.5-turbo",
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None
+    ):
+        """
+        参数:
+            model: 模型名称
+            api_key: API Key（默认读取 OPENAI_API_KEY）
+            base_url: API 地址（默认读取 OPENAI_BASE_URL），可指向本地替身服务器 llm/stub_server.py
+            timeout: 单次请求超时（秒）
+            max_retries: 失败重试次数（SDK 默认 2 次）
+        """
         try:
-            from openai import OpenAI
+            from openai import OpenAI, BadRequestError, UnprocessableEntityError
         except ImportError:
             raise ImportError("Please install openai package: pip install openai")
-            
-        self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+        
+        client_kwargs = {
+            "api_key": api_key or os.getenv("OPENAI_API_KEY"),
+            "base_url": base_url or os.getenv("OPENAI_BASE_URL"),
+        }
+        if timeout is not None:
+            client_kwargs["timeout"] = timeout
+        if max_retries is not None:
+            client_kwargs["max_retries"] = max_retries
+        
+        self.client = OpenAI(**client_kwargs)
         self.model = model
+        # 部分 OpenAI 兼容服务不接受 stream_options：被拒绝后改用非流式请求获取用量
+        self.stream_usage = True
+        self._rejected_param_errors = (BadRequestError, UnprocessableEntityError)
 
     def generate(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> str:
+        return self.generate_with_usage(messages, stop=stop).text
+
+    def generate_stream(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> Iterator[str]:
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stop=stop,
+            temperature=0.7,
+            stream=True
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+        finally:
+            # 提前关闭时断开连接，服务端停止生成
+            stream.close()
+
+    def generate_with_usage(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> LLMResult:
+        if not self.stream_usage:
+            return self._generate_blocking(messages, stop)
+        
+        # 使用流式接口以测量首 token 耗时，并要求在最后一个 chunk 中返回用量
+        start = time.perf_counter()
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stop=stop,
+                temperature=0.7,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+        except self._rejected_param_errors as e:
+            # 非流式请求也失败时说明不是 stream_options 的问题，异常照常抛出
+            result = self._generate_blocking(messages, stop)
+            self.stream_usage = False
+            print(f"[OpenAILLM] 服务端拒绝 stream_options ({e.status_code})，改用非流式请求")
+            return result
+        
+        parts = []
+        first_token_at = None
+        usage = None
+        model = self.model
+        try:
+            for chunk in stream:
+                if chunk.model:
+                    model = chunk.model
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        parts.append(delta)
+        finally:
+            # 迭代中途出错时也要释放连接
+            stream.close()
+        
+        latency = time.perf_counter() - start
+        text = "".join(parts)
+        ttft = first_token_at - start if first_token_at is not None else None
+        return self._build_result(messages, text, usage, model, latency, ttft)
+    
+    def _generate_blocking(self, messages: List[Dict[str, str]], stop: Optional[List[str]]) -> LLMResult:
+        """非流式请求（无法测量首 token 耗时）"""
+        start = time.perf_counter()
         response = self.client.chat.completions.create(
             model=self.model,
             messages=messages,
             stop=stop,
             temperature=0.7
         )
-        return response.choices[0].message.content
+        latency = time.perf_counter() - start
+        text = (response.choices[0].message.content or "") if response.choices else ""
+        return self._build_result(messages, text, response.usage, response.model or self.model, latency, None)
+    
+    @staticmethod
+    def _build_result(
+        messages: List[Dict[str, str]],
+        text: str,
+        usage,
+        model: str,
+        latency: float,
+        time_to_first_token: Optional[float]
+    ) -> LLMResult:
+        if usage is not None:
+            prompt_tokens = usage.prompt_tokens
+            completion_tokens = usage.completion_tokens
+        else:
+            prompt_tokens = estimate_messages_tokens(messages)
+            completion_tokens = estimate_tokens(text)
+        
+        return LLMResult(
+            text=text,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency=latency,
+            time_to_first_token=time_to_first_token,
+            model=model,
+            estimated=usage is None
+        )
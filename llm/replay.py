@@ -0,0 +1,227 @@
+"""
+录制/回放 LLM - 用于可复现的离线性能回归测试
+
+- RecordingLLM: 包装真实 LLM，把每次 generate 的请求/回复及耗时追加写入 JSONL 日志
+- ReplayLLM: 读取日志，按请求内容确定性地返回录制的回复，可选复现录制时的延迟分布
+
+日志文件以 .gz 结尾时自动使用 gzip 压缩。
+
+用法:
+    # 录制
+    llm = RecordingLLM(OpenAILLM(), "runs/session.jsonl.gz")
+    # 回放（无需网络）
+    llm = ReplayLLM("runs/session.jsonl.gz", latency_mode="recorded")
+"""
+
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from .base import BaseLLM, LLMResult
+
+
+def _open_log(path: str, mode: str):
+    """打开日志文件，.gz 后缀使用 gzip"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def request_key(messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> str:
+    """计算请求的稳定哈希，作为回放时的查找键"""
+    payload = json.dumps(
+        {"messages": messages, "stop": stop},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class RecordingLLM(BaseLLM):
+    """
+    录制 LLM - 透传调用并记录请求/回复/耗时
+
+    每条记录一行 JSON:
+        {"key": ..., "latency": ..., "response": ..., "usage": {...}, "messages": [...], "stop": ...}
+
+    日志文件在第一次录制时打开并保持打开，每条记录写入后 flush；用完后调用 close()。
+    """
+
+    def __init__(self, llm: BaseLLM, log_path: str, store_messages: bool = True):
+        """
+        参数:
+            llm: 被录制的真实 LLM
+            log_path: 日志文件路径（追加写入）
+            store_messages: 是否保存完整的请求消息（关闭后日志更紧凑，但只保留哈希键）
+        """
+        self.llm = llm
+        self.log_path = log_path
+        self.store_messages = store_messages
+        self._lock = threading.Lock()
+        self._file = None
+
+    def generate(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> str:
+        return self.generate_with_usage(messages, stop=stop).text
+
+    def generate_with_usage(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> LLMResult:
+        result = self.llm.generate_with_usage(messages, stop=stop)
+
+        record: Dict[str, Any] = {
+            "key": request_key(messages, stop),
+            "latency": round(result.latency, 6),
+            "response": result.text,
+            "usage": result.to_dict(),
+        }
+        if self.store_messages:
+            record["messages"] = messages
+            record["stop"] = stop
+
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                self._file = _open_log(self.log_path, "a")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+        return result
+
+    def close(self) -> None:
+        """关闭日志文件（之后再录制会重新以追加模式打开）"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ReplayLLM(BaseLLM):
+    """
+    回放 LLM - 从录制日志中确定性地返回回复
+
+    匹配模式:
+    - "key": 按请求哈希查找；同一请求被录制多次时按录制顺序依次返回，用完后重复最后一条
+    - "sequential": 忽略请求内容，严格按录制顺序返回
+
+    延迟模式:
+    - None: 立即返回
+    - "recorded": 复现每条记录自身的耗时
+    - "sampled": 从所有录制耗时中随机采样（使用固定种子，结果可复现）
+    """
+
+    def __init__(
+        self,
+        log_path: str,
+        match: str = "key",
+        latency_mode: Optional[str] = None,
+        latency_scale: float = 1.0,
+        seed: int = 0,
+        fallback: Optional[BaseLLM] = None
+    ):
+        """
+        参数:
+            log_path: RecordingLLM 生成的日志文件
+            match: 匹配模式，"key" 或 "sequential"
+            latency_mode: 延迟模式，None / "recorded" / "sampled"
+            latency_scale: 延迟缩放系数，回放延迟 = 录制延迟 * latency_scale
+                           （例如 0.1 表示延迟缩短为十分之一，即快 10 倍回放）
+            seed: "sampled" 模式的随机种子
+            fallback: 找不到录制记录时使用的 LLM；为 None 时抛出 KeyError
+        """
+        if match not in ("key", "sequential"):
+            raise ValueError(f"不支持的匹配模式: {match}")
+        if latency_mode not in (None, "recorded", "sampled"):
+            raise ValueError(f"不支持的延迟模式: {latency_mode}")
+
+        self.log_path = log_path
+        self.match = match
+        self.latency_mode = latency_mode
+        self.latency_scale = latency_scale
+        self.fallback = fallback
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self._records: List[Dict[str, Any]] = []
+        self._by_key: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._cursor = 0
+        self._load()
+
+        self._latencies = [r.get("latency", 0.0) for r in self._records]
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> None:
+        with _open_log(self.log_path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                self._records.append(record)
+                self._by_key.setdefault(record["key"], deque()).append(record)
+
+    def _next_record(self, messages: List[Dict[str, str]], stop: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self.match == "sequential":
+                if self._cursor >= len(self._records):
+                    return None
+                record = self._records[self._cursor]
+                self._cursor += 1
+                return record
+
+            queue = self._by_key.get(request_key(messages, stop))
+            if not queue:
+                return None
+            # 保留最后一条，使重复请求始终有回复
+            return queue.popleft() if len(queue) > 1 else queue[0]
+
+    def _delay(self, record: Dict[str, Any]) -> float:
+        if self.latency_mode == "recorded":
+            return record.get("latency", 0.0) * self.latency_scale
+        if self.latency_mode == "sampled" and self._latencies:
+            with self._lock:
+                return self._rng.choice(self._latencies) * self.latency_scale
+        return 0.0
+
+    def generate(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> str:
+        return self.generate_with_usage(messages, stop=stop).text
+
+    def generate_with_usage(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> LLMResult:
+        record = self._next_record(messages, stop)
+        if record is None:
+            self.misses += 1
+            if self.fallback is not None:
+                return self.fallback.generate_with_usage(messages, stop=stop)
+            raise KeyError("回放日志中没有与该请求匹配的记录")
+
+        self.hits += 1
+        start = time.perf_counter()
+        delay = self._delay(record)
+        if delay > 0:
+            time.sleep(delay)
+
+        usage = record.get("usage") or {}
+        ttft = usage.get("time_to_first_token")
+        return LLMResult(
+            text=record["response"],
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            latency=time.perf_counter() - start,
+            time_to_first_token=ttft * self.latency_scale if ttft is not None and delay > 0 else None,
+            model=usage.get("model"),
+            estimated=usage.get("estimated", True)
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取回放统计"""
+        total_latency = sum(self._latencies)
+        return {
+            "records": len(self._records),
+            "hits": self.hits,
+            "misses": self.misses,
+            "recorded_total_latency": total_latency,
+            "recorded_avg_latency": total_latency / len(self._latencies) if self._latencies else 0.0,
+        }
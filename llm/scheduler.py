@@ -0,0 +1,234 @@
+"""
+LLM 调用调度器 - 全局令牌桶限流 + 优先级队列
+
+在 BaseLLM.generate 前面加一层调度:
+1. 两个令牌桶分别限制每分钟请求数 (RPM) 和每分钟 token 数 (TPM，按估算值)
+2. 等待中的请求按优先级排队，交互式对话优先于后台任务（总结、DeepResearch 等）
+3. 统计队列深度和等待时间
+
+用法:
+    scheduler = LLMScheduler(rpm=60, tpm=90000)
+    chat_llm = scheduler.wrap(llm, priority=PRIORITY_INTERACTIVE)
+    background_llm = scheduler.wrap(llm, priority=PRIORITY_BACKGROUND)
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+from .base import BaseLLM, LLMResult
+from .tokens import estimate_messages_tokens, estimate_tokens
+
+# 优先级：数值越小越优先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 5
+PRIORITY_BACKGROUND = 10
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    以固定速率补充令牌，容量上限即允许的突发量。
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self._last_refill = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+            self._last_refill = now
+
+    def wait_time(self, amount: float) -> float:
+        """获取 amount 个令牌还需要等待的秒数（0 表示可以立即获取）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount: float) -> None:
+        """扣除令牌（调用前应确认 wait_time 为 0）"""
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class LLMScheduler:
+    """
+    LLM 调度器 - 所有会话共享的全局限流器
+
+    调用方在发起请求前调用 acquire()，调度器保证:
+    - 请求按 (优先级, 到达顺序) 出队
+    - 出队时 RPM 和 TPM 两个令牌桶都有足够的令牌
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        expected_completion_tokens: int = 256
+    ):
+        """
+        初始化调度器
+
+        参数:
+            rpm: 每分钟最大请求数（None 表示不限制）
+            tpm: 每分钟最大 token 数（None 表示不限制）
+            expected_completion_tokens: 估算 TPM 时为每次请求预留的生成 token 数
+        """
+        self.rpm_bucket = TokenBucket(rpm, rpm / 60.0) if rpm else None
+        self.tpm_bucket = TokenBucket(tpm, tpm / 60.0) if tpm else None
+        self.expected_completion_tokens = expected_completion_tokens
+
+        self._cond = threading.Condition()
+        self._queue: List = []
+        self._counter = itertools.count()
+
+        self._max_queue_depth = 0
+        self._wait_stats: Dict[int, Dict[str, float]] = {}
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.rpm_bucket:
+            wait = max(wait, self.rpm_bucket.wait_time(1))
+        if self.tpm_bucket:
+            wait = max(wait, self.tpm_bucket.wait_time(tokens))
+        return wait
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, tokens: int = 0) -> float:
+        """
+        排队等待发送一个请求
+
+        参数:
+            priority: 优先级，数值越小越优先
+            tokens: 该请求预计消耗的 token 数
+
+        返回:
+            实际等待的秒数
+        """
+        start = time.monotonic()
+        entry = (priority, next(self._counter))
+
+        with self._cond:
+            heapq.heappush(self._queue, entry)
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+
+            while True:
+                if self._queue[0] == entry:
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        break
+                    # 队首请求等待令牌补充；期间新到的更高优先级请求会插队
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+
+            heapq.heappop(self._queue)
+            if self.rpm_bucket:
+                self.rpm_bucket.consume(1)
+            if self.tpm_bucket:
+                self.tpm_bucket.consume(tokens)
+
+            waited = time.monotonic() - start
+            self._record_wait(priority, waited)
+            self._cond.notify_all()
+
+        return waited
+
+    def _record_wait(self, priority: int, waited: float) -> None:
+        stats = self._wait_stats.setdefault(
+            priority, {"requests": 0, "total_wait": 0.0, "max_wait": 0.0}
+        )
+        stats["requests"] += 1
+        stats["total_wait"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+
+    def reconcile(self, estimated: int, actual: int) -> None:
+        """
+        用真实用量校正 TPM 令牌桶
+
+        acquire() 时按估算值扣除令牌，调用完成后把差额退还（或补扣）
+        """
+        if not self.tpm_bucket or actual <= 0:
+            return
+        with self._cond:
+            self.tpm_bucket.consume(actual - estimated)
+            self.tpm_bucket.tokens = min(self.tpm_bucket.tokens, self.tpm_bucket.capacity)
+            self._cond.notify_all()
+
+    def estimate_request_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """估算一次请求消耗的 token 数（提示词 + 预留的生成长度）"""
+        return estimate_messages_tokens(messages) + self.expected_completion_tokens
+
+    def wrap(self, llm: BaseLLM, priority: int = PRIORITY_NORMAL) -> "ScheduledLLM":
+        """用指定优先级包装一个 LLM"""
+        return ScheduledLLM(llm, self, priority)
+
+    def get_stats(self) -> Dict:
+        """
+        获取调度统计
+
+        返回:
+            {queue_depth, max_queue_depth, by_priority: {优先级: {requests, avg_wait, max_wait}}}
+        """
+        with self._cond:
+            by_priority = {}
+            for priority, stats in sorted(self._wait_stats.items()):
+                entry = dict(stats)
+                entry["avg_wait"] = stats["total_wait"] / stats["requests"] if stats["requests"] else 0.0
+                by_priority[priority] = entry
+            return {
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self._max_queue_depth,
+                "by_priority": by_priority,
+            }
+
+
+class ScheduledLLM(BaseLLM):
+    """经过调度器限流的 LLM 包装器"""
+
+    def __init__(self, llm: BaseLLM, scheduler: LLMScheduler, priority: int = PRIORITY_NORMAL):
+        self.llm = llm
+        self.scheduler = scheduler
+        self.priority = priority
+
+    @property
+    def model(self) -> Optional[str]:
+        """被包装 LLM 的模型名称"""
+        return getattr(self.llm, "model", None)
+
+    def generate(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> str:
+        tokens = self.scheduler.estimate_request_tokens(messages)
+        self.scheduler.acquire(self.priority, tokens)
+        return self.llm.generate(messages, stop=stop)
+
+    def generate_with_usage(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> LLMResult:
+        tokens = self.scheduler.estimate_request_tokens(messages)
+        self.scheduler.acquire(self.priority, tokens)
+        result = self.llm.generate_with_usage(messages, stop=stop)
+        self.scheduler.reconcile(tokens, result.total_tokens)
+        return result
+
+    def generate_stream(self, messages: List[Dict[str, str]], stop: Optional[List[str]] = None) -> Iterator[str]:
+        tokens = self.scheduler.estimate_request_tokens(messages)
+        self.scheduler.acquire(self.priority, tokens)
+        # 流式接口不返回用量：按已收到的输出估算，调用方提前关闭流时同样校正
+        parts = []
+        try:
+            for chunk in self.llm.generate_stream(messages, stop=stop):
+                parts.append(chunk)
+                yield chunk
+        finally:
+            actual = tokens - self.scheduler.expected_completion_tokens + estimate_tokens("".join(parts))
+            self.scheduler.reconcile(tokens, actual)
+
+    def with_priority(self, priority: int) -> "ScheduledLLM":
+        """返回共享同一调度器、但优先级不同的包装器"""
+        return ScheduledLLM(self.llm, self.scheduler, priority)
@@ -0,0 +1,380 @@
+"""
+本地 OpenAI 兼容替身服务器 - 用于压测 OpenAILLM，无需真实 API
+
+特性:
+- 实现 /v1/chat/completions（含 stream=True 的 SSE 流式输出）和 /v1/models
+- 回复来源: MockLLM 启发式，或按顺序循环的脚本化回复
+- 可配置延迟分布（首 token 延迟）和生成速度（tokens/s）
+- 错误注入: 429（带 Retry-After）、500、超时（挂起后断开连接）
+
+用法:
+    python -m llm.stub_server --port 8000 --latency lognormal:0.3,0.5 --tokens-per-second 40 --error-429 0.05
+
+    llm = OpenAILLM(model="stub", api_key="test", base_url="http://127.0.0.1:8000/v1")
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from .mock_provider import MockLLM
+from .tokens import estimate_messages_tokens, estimate_tokens
+
+
+class LatencyDistribution:
+    """
+    延迟分布（秒）
+
+    支持:
+    - "fixed:0.2"            固定值
+    - "uniform:0.1,0.5"      均匀分布 [min, max]
+    - "normal:0.3,0.1"       正态分布 (均值, 标准差)，截断到 >= 0
+    - "lognormal:0.3,0.5"    对数正态分布 (中位数, sigma)
+    """
+
+    def __init__(self, spec: str = "fixed:0", seed: Optional[int] = None):
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p] if params else [0.0]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"不支持的延迟分布: {spec}")
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                return self.params[0]
+            if self.kind == "uniform":
+                return self._rng.uniform(self.params[0], self.params[1])
+            if self.kind == "normal":
+                return max(0.0, self._rng.gauss(self.params[0], self.params[1]))
+            # lognormal: 以中位数参数化，便于配置
+            median, sigma = self.params[0], self.params[1]
+            return median * self._rng.lognormvariate(0.0, sigma)
+
+
+class StubServer:
+    """
+    OpenAI 兼容替身服务器
+
+    用法:
+        server = StubServer(port=0, latency="fixed:0.05")
+        server.start()          # 后台线程运行
+        print(server.base_url)  # http://127.0.0.1:xxxxx/v1
+        server.stop()
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        responses: Optional[List[str]] = None,
+        latency: str = "fixed:0",
+        tokens_per_second: Optional[float] = None,
+        error_429_rate: float = 0.0,
+        error_500_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        timeout_seconds: float = 30.0,
+        seed: Optional[int] = None,
+        reject_stream_options: bool = False
+    ):
+        """
+        参数:
+            host: 监听地址
+            port: 监听端口（0 表示随机分配）
+            responses: 脚本化回复列表（按顺序循环）；为 None 时使用 MockLLM 生成回复
+            latency: 首 token 延迟分布，格式见 LatencyDistribution
+            tokens_per_second: 生成速度；为 None 时不模拟生成耗时
+            error_429_rate: 返回 429 的概率
+            error_500_rate: 返回 500 的概率
+            timeout_rate: 挂起 timeout_seconds 秒后断开连接的概率
+            timeout_seconds: 模拟超时的挂起时长
+            seed: 随机种子（延迟和错误注入）
+            reject_stream_options: 模拟不支持 stream_options 的兼容服务（返回 400）
+        """
+        self.host = host
+        self.port = port
+        self.responses = responses
+        self.latency = LatencyDistribution(latency, seed)
+        self.tokens_per_second = tokens_per_second
+        self.error_429_rate = error_429_rate
+        self.error_500_rate = error_500_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.reject_stream_options = reject_stream_options
+
+        self._mock = MockLLM()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._script_index = 0
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+        self.stats = {"requests": 0, "streamed": 0, "429": 0, "500": 0, "timeouts": 0, "client_disconnects": 0}
+
+    @property
+    def base_url(self) -> str:
+        port = self._httpd.server_address[1] if self._httpd else self.port
+        return f"http://{self.host}:{port}/v1"
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def pick_error(self) -> Optional[str]:
+        """按配置的概率决定是否注入错误"""
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.error_429_rate:
+            return "429"
+        roll -= self.error_429_rate
+        if roll < self.error_500_rate:
+            return "500"
+        roll -= self.error_500_rate
+        if roll < self.timeout_rate:
+            return "timeout"
+        return None
+
+    def generate_reply(self, messages: List[Dict[str, str]]) -> str:
+        """生成回复文本"""
+        if self.responses:
+            with self._lock:
+                reply = self.responses[self._script_index % len(self.responses)]
+                self._script_index += 1
+            return reply
+        return self._mock.generate(messages)
+
+    def token_delay(self) -> float:
+        """每个 token 的生成耗时"""
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _create_httpd(self) -> ThreadingHTTPServer:
+        handler = type("BoundStubHandler", (_StubHandler,), {"stub": self})
+        httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        httpd.daemon_threads = True
+        return httpd
+
+    def start(self) -> None:
+        """在后台线程中启动服务器"""
+        self._httpd = self._create_httpd()
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        """在当前线程中运行服务器（阻塞）"""
+        self._httpd = self._create_httpd()
+        print(f"[StubServer] 监听 {self.base_url}")
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        """停止服务器"""
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    stub: StubServer = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # 压测时不打印每个请求
+        pass
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, error_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_json(status, {"error": {"message": message, "type": error_type, "code": None}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+        else:
+            self._send_error(404, f"Unknown path: {self.path}", "invalid_request_error")
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_error(404, f"Unknown path: {self.path}", "invalid_request_error")
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_error(400, "Invalid JSON body", "invalid_request_error")
+            return
+
+        stub = self.stub
+        stub._count("requests")
+
+        if stub.reject_stream_options and "stream_options" in request:
+            self._send_error(400, "Unrecognized request argument supplied: stream_options", "invalid_request_error")
+            return
+
+        error = stub.pick_error()
+        if error == "429":
+            stub._count("429")
+            self._send_error(429, "Rate limit reached (injected)", "rate_limit_error", {"Retry-After": "1"})
+            return
+        if error == "500":
+            stub._count("500")
+            self._send_error(500, "Internal server error (injected)", "server_error")
+            return
+        if error == "timeout":
+            stub._count("timeouts")
+            time.sleep(stub.timeout_seconds)
+            self.close_connection = True
+            return
+
+        messages = request.get("messages", [])
+        model = request.get("model", "stub")
+        reply = stub.generate_reply(messages)
+        stop = request.get("stop")
+        if stop:
+            for s in ([stop] if isinstance(stop, str) else stop):
+                if s and s in reply:
+                    reply = reply[:reply.index(s)]
+
+        time.sleep(stub.latency.sample())
+
+        if request.get("stream"):
+            stub._count("streamed")
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            try:
+                self._stream_reply(model, messages, reply, include_usage)
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前关闭流（例如调用方拿到足够内容后停止生成）
+                stub._count("client_disconnects")
+        else:
+            chunks = _split_tokens(reply)
+            time.sleep(stub.token_delay() * len(chunks))
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": _usage(messages, reply),
+            })
+
+    def _stream_reply(self, model: str, messages: List[Dict[str, str]], reply: str, include_usage: bool) -> None:
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta: Dict, finish_reason: Optional[str] = None, usage: Optional[Dict] = None) -> None:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if usage:
+                payload["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        token_delay = self.stub.token_delay()
+        chunk({"role": "assistant", "content": ""})
+        for piece in _split_tokens(reply):
+            if token_delay:
+                time.sleep(token_delay)
+            chunk({"content": piece})
+        chunk({}, finish_reason="stop")
+        if include_usage:
+            chunk({}, usage=_usage(messages, reply))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def _split_tokens(text: str) -> List[str]:
+    """把回复切分成近似 token 的片段（单词 + 后随空白，中文逐字）"""
+    return re.findall(r"[一-鿿]|[^\s一-鿿]+\s*|\s+", text)
+
+
+def _usage(messages: List[Dict[str, str]], reply: str) -> Dict[str, int]:
+    prompt_tokens = estimate_messages_tokens(messages)
+    completion_tokens = estimate_tokens(reply)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容替身服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="fixed:0", help="首 token 延迟分布，如 lognormal:0.3,0.5")
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--error-429", type=float, default=0.0, help="429 错误概率")
+    parser.add_argument("--error-500", type=float, default=0.0, help="500 错误概率")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="超时概率")
+    parser.add_argument("--timeout-seconds", type=float, default=30.0)
+    parser.add_argument("--script", default=None, help="脚本化回复文件（每行一条 JSON 字符串或纯文本）")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--reject-stream-options", action="store_true", help="对带 stream_options 的请求返回 400")
+    args = parser.parse_args()
+
+    responses = None
+    if args.script:
+        responses = []
+        with open(args.script, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line:
+                    continue
+                try:
+                    responses.append(json.loads(line))
+                except json.JSONDecodeError:
+                    responses.append(line)
+
+    server = StubServer(
+        host=args.host,
+        port=args.port,
+        responses=responses,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_429_rate=args.error_429,
+        error_500_rate=args.error_500,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        seed=args.seed,
+        reject_stream_options=args.reject_stream_options
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[StubServer] 已停止")
+
+
+if __name__ == "__main__":
+    main()
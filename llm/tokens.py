@@ -0,0 +1,40 @@
+"""
+Token 数量估算工具
+
+不依赖 tiktoken 等分词库，使用简单的启发式规则:
+- 中日韩字符大约每个字符 1 个 token
+- 其他文本大约每 4 个字符 1 个 token
+- 每条消息额外计入少量格式开销
+"""
+
+from typing import Dict, List
+
+# 每条消息的格式开销（role、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF      # CJK 统一汉字
+        or 0x3400 <= code <= 0x4DBF   # CJK 扩展 A
+        or 0x3040 <= code <= 0x30FF   # 日文假名
+        or 0xAC00 <= code <= 0xD7AF   # 韩文音节
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """估算一段文本的 token 数量"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    """估算消息列表的 token 数量"""
+    return sum(
+        estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+        for m in messages
+    )
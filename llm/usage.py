@@ -0,0 +1,169 @@
+"""
+Token 用量统计 - 按调用、会话、ReAct 迭代和进程汇总
+
+每次 LLM 调用记录:
+- 提示词 / 生成 token 数
+- 总耗时与首 token 耗时
+- 提示词各组成部分（系统提示、历史、观察结果等）的估算 token 数
+
+汇总时计算生成速度 (tokens/s) 和成本估算。
+"""
+
+import threading
+from typing import Dict, List, Optional
+from .base import LLMResult
+
+# 每 100 万 token 的价格（美元）：(输入, 输出)
+MODEL_PRICING: Dict[str, tuple] = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+}
+
+
+def estimate_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> float:
+    """估算一次调用的成本（美元），未知模型返回 0"""
+    if not model:
+        return 0.0
+    # 按最长前缀匹配，兼容 "gpt-4o-2024-08-06" 这类带日期的模型名
+    matches = [name for name in MODEL_PRICING if model.startswith(name)]
+    if not matches:
+        return 0.0
+    input_price, output_price = MODEL_PRICING[max(matches, key=len)]
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def _empty_bucket() -> Dict[str, float]:
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "latency": 0.0,
+        "ttft_total": 0.0,
+        "ttft_calls": 0,
+        "cost": 0.0,
+    }
+
+
+def _summarize(bucket: Dict[str, float]) -> Dict[str, float]:
+    summary = {
+        "calls": bucket["calls"],
+        "prompt_tokens": bucket["prompt_tokens"],
+        "completion_tokens": bucket["completion_tokens"],
+        "total_tokens": bucket["prompt_tokens"] + bucket["completion_tokens"],
+        "latency": bucket["latency"],
+        "tokens_per_second": bucket["completion_tokens"] / bucket["latency"] if bucket["latency"] > 0 else 0.0,
+        "avg_time_to_first_token": bucket["ttft_total"] / bucket["ttft_calls"] if bucket["ttft_calls"] else None,
+        "cost": bucket["cost"],
+    }
+    return summary
+
+
+class UsageTracker:
+    """
+    用量统计器
+
+    用法:
+        tracker = UsageTracker()
+        tracker.record(result, session="abc", iteration=0, components={"system": 300, "history": 120})
+        tracker.get_summary()
+    """
+
+    def __init__(self, keep_records: int = 1000):
+        """
+        参数:
+            keep_records: 保留的最近调用明细条数
+        """
+        self.keep_records = keep_records
+        self._lock = threading.Lock()
+        self._total = _empty_bucket()
+        self._by_session: Dict[str, Dict[str, float]] = {}
+        self._by_iteration: Dict[int, Dict[str, float]] = {}
+        self._by_model: Dict[str, Dict[str, float]] = {}
+        self._components: Dict[str, int] = {}
+        self._records: List[Dict] = []
+
+    @staticmethod
+    def _add(bucket: Dict[str, float], result: LLMResult, cost: float) -> None:
+        bucket["calls"] += 1
+        bucket["prompt_tokens"] += result.prompt_tokens
+        bucket["completion_tokens"] += result.completion_tokens
+        bucket["latency"] += result.latency
+        bucket["cost"] += cost
+        if result.time_to_first_token is not None:
+            bucket["ttft_total"] += result.time_to_first_token
+            bucket["ttft_calls"] += 1
+
+    def record(
+        self,
+        result: LLMResult,
+        session: Optional[str] = None,
+        iteration: Optional[int] = None,
+        components: Optional[Dict[str, int]] = None
+    ) -> None:
+        """
+        记录一次 LLM 调用
+
+        参数:
+            result: LLM 调用结果
+            session: 会话 ID
+            iteration: ReAct 迭代序号（从 0 开始）
+            components: 提示词各组成部分的估算 token 数
+        """
+        cost = estimate_cost(result.model, result.prompt_tokens, result.completion_tokens)
+
+        with self._lock:
+            self._add(self._total, result, cost)
+            if session is not None:
+                self._add(self._by_session.setdefault(session, _empty_bucket()), result, cost)
+            if iteration is not None:
+                self._add(self._by_iteration.setdefault(iteration, _empty_bucket()), result, cost)
+            self._add(self._by_model.setdefault(result.model or "unknown", _empty_bucket()), result, cost)
+            for name, tokens in (components or {}).items():
+                self._components[name] = self._components.get(name, 0) + tokens
+
+            record = result.to_dict()
+            record.update({"session": session, "iteration": iteration, "cost": cost, "components": components})
+            self._records.append(record)
+            if len(self._records) > self.keep_records:
+                del self._records[:len(self._records) - self.keep_records]
+
+    def get_summary(self, session: Optional[str] = None) -> Dict:
+        """
+        获取汇总统计
+
+        参数:
+            session: 只返回指定会话的汇总；为 None 时返回进程级汇总及各维度明细
+        """
+        with self._lock:
+            if session is not None:
+                return _summarize(self._by_session.get(session, _empty_bucket()))
+
+            return {
+                "total": _summarize(self._total),
+                "by_session": {k: _summarize(v) for k, v in self._by_session.items()},
+                "by_iteration": {k: _summarize(v) for k, v in sorted(self._by_iteration.items())},
+                "by_model": {k: _summarize(v) for k, v in self._by_model.items()},
+                "prompt_components": dict(self._components),
+            }
+
+    def get_records(self) -> List[Dict]:
+        """获取最近的调用明细"""
+        with self._lock:
+            return list(self._records)
+
+    def reset(self) -> None:
+        """清空所有统计"""
+        with self._lock:
+            self._total = _empty_bucket()
+            self._by_session.clear()
+            self._by_iteration.clear()
+            self._by_model.clear()
+            self._components.clear()
+            self._records.clear()
+
+
+# 进程级全局统计器
+global_usage_tracker = UsageTracker()
@@ -10,67 +10,68 @@
 
 import os
 import sys
+from typing import Callable, Optional
 from dotenv import load_dotenv
 
 # 将当前目录添加到路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from agent.core_enhanced import EnhancedChatAgent
+from agent.core import EnhancedChatAgent
 from agent.memory import Memory
+from agent.retrieval import ToolSelector
 from tools.registry import ToolRegistry
-from tools.search import SearchTool
-from tools.remember import RememberTool
-from tools.image_gen import ImageGenTool
-from tools.deep_research import DeepResearchTool
-from tools.calculator import CalculatorTool
-from tools.weather import WeatherTool
-from tools.translator import TranslatorTool
-from tools.datetime_tool import DateTimeTool
-from tools.web_search import WebSearchTool, DuckDuckGoSearchTool
 from llm.mock_provider import MockLLM
 from llm.openai_provider import OpenAILLM
+from llm.base import BaseLLM
+from llm.scheduler import LLMScheduler, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from llm.usage import global_usage_tracker
 
 
-def setup_tools(docs_dir: str, memory: Memory) -> ToolRegistry:
-    """设置并注册所有工具"""
+def setup_tools(
+    docs_dir: str,
+    memory: Memory,
+    research_llm: Optional[Callable[[], Optional[BaseLLM]]] = None
+) -> ToolRegistry:
+    """
+    设置并注册所有工具
+    
+    工具均为延迟注册：只有第一次被调用时才导入对应模块并构造实例，
+    启动时不会加载 pytz、multiprocessing 等依赖。
+    
+    参数:
+        docs_dir: 本地文档目录
+        memory: 记忆系统
+        research_llm: 返回 DeepResearch 所用 LLM 的函数（首次使用 DeepResearch 时调用）；
+                      返回 None 时 DeepResearch 使用固定分解
+    """
     registry = ToolRegistry()
     
+    # 描述、元数据和缓存策略都取自 tools/catalog.py，注册时不导入工具模块
     # 核心工具
-    search_tool = SearchTool(docs_dir)
-    remember_tool = RememberTool(memory)
+    registry.register_builtin("Search", docs_dir)
+    registry.register_builtin("Remember", memory)
     
     # 实用工具
-    calculator_tool = CalculatorTool()
-    weather_tool = WeatherTool()
-    datetime_tool = DateTimeTool()
-    translator_tool = TranslatorTool()
+    registry.register_builtin("Calculator")
+    registry.register_builtin("Weather")
+    registry.register_builtin("DateTime")
+    registry.register_builtin("Translator")
     
     # 高级工具
-    image_tool = ImageGenTool()
-    research_tool = DeepResearchTool(search_tool)
-    web_search_tool = WebSearchTool()
-    
-    # 尝试添加 DuckDuckGo 搜索（需要额外依赖）
-    try:
-        ddg_search_tool = DuckDuckGoSearchTool()
-        registry.register(ddg_search_tool)
-    except:
-        print("[提示] DuckDuckGo 搜索工具不可用（需要安装 duckduckgo-search）")
-    
-    # 注册所有工具
-    tools = [
-        search_tool,
-        remember_tool,
-        calculator_tool,
-        weather_tool,
-        datetime_tool,
-        translator_tool,
-        image_tool,
-        research_tool,
-        web_search_tool,
-    ]
-    
-    registry.register_multiple(tools)
+    registry.register_builtin("ImageGen")
+    
+    def create_research_tool():
+        from tools.deep_research import DeepResearchTool
+        return DeepResearchTool(
+            registry.get_tool("Search"),
+            llm=research_llm() if research_llm else None
+        )
+    
+    registry.register_builtin("DeepResearch", factory=create_research_tool)
+    registry.register_builtin("WebSearch")
+    # DuckDuckGo 需要额外依赖，缺少时在调用时返回提示
+    registry.register_builtin("DuckDuckGoSearch")
+    
     return registry
 
 
@@ -78,7 +79,12 @@ def setup_mcp_tools(registry: ToolRegistry):
     """
     设置 MCP 工具（可选）
     
-    如果存在 mcp_config.json 文件，则尝试连接 MCP 服务器
+    如果存在 mcp_config.json 文件，则并发连接 MCP 服务器。
+    环境变量 MCP_LAZY=1 启用延迟模式（使用缓存的工具清单，首次调用时才连接），
+    MCP_STARTUP_TIMEOUT 设置每个服务器的启动超时（秒）。
+    
+    返回:
+        MCPManager 实例（没有配置文件或加载失败时为 None）
     """
     from tools.mcp_client import create_mcp_manager_from_config
     
@@ -88,19 +94,37 @@ def setup_mcp_tools(registry: ToolRegistry):
         print("[MCP] 正在尝试连接 MCP 服务器...")
         
         try:
-            mcp_manager = create_mcp_manager_from_config(config_file)
-            mcp_tools = mcp_manager.get_all_tools()
+            def register_late(client):
+                # 启动超时的服务器在后台连上后再注册它的工具
+                late_tools = client.get_tools_as_agent_tools()
+                registry.register_multiple(late_tools)
+                print(f"[MCP] 后台添加 {len(late_tools)} 个 MCP 工具（服务器: {client.server_name}）")
+            
+            lazy = os.getenv("MCP_LAZY")
+            startup_timeout = os.getenv("MCP_STARTUP_TIMEOUT")
+            # 回调在开始连接之前传入，启动超时后任何时刻连上的服务器都会注册工具
+            mcp_manager = create_mcp_manager_from_config(
+                config_file,
+                lazy=lazy == "1" if lazy is not None else None,
+                startup_timeout=float(startup_timeout) if startup_timeout else None,
+                on_late_connect=register_late
+            )
+            # 已经由 register_late 注册过的（刚好在启动结束前后连上的服务器）不重复注册
+            registered = set(registry.get_tool_names())
+            mcp_tools = [t for t in mcp_manager.get_all_tools() if t.name not in registered]
             
             if mcp_tools:
                 registry.register_multiple(mcp_tools)
                 print(f"[MCP] 成功添加 {len(mcp_tools)} 个 MCP 工具")
             else:
                 print("[MCP] 未找到可用的 MCP 工具")
+            return mcp_manager
         except Exception as e:
             print(f"[MCP] 加载 MCP 工具失败: {str(e)}")
     else:
         print(f"\n[MCP] 未找到配置文件 {config_file}")
         print("[MCP] 如需使用 MCP 功能，请创建 mcp_config.json 配置文件")
+    return None
 
 
 def print_banner():
@@ -121,6 +145,7 @@ def print_banner():
   • exit / quit - 退出程序
   • reset - 重置对话历史
   • tools - 查看所有可用工具
+  • stats - 查看 LLM 调用统计
   • help - 显示帮助信息
 
 💡 试试问我:
@@ -158,6 +183,7 @@ def print_help():
   • exit/quit - 退出
   • reset - 重置历史
   • tools - 查看工具
+  • stats - LLM 调用统计
   • help - 帮助信息
 
 ═══════════════════════════════════════════════════════════
@@ -165,40 +191,182 @@ def print_help():
     print(help_text)
 
 
+def print_llm_stats(llm, scheduler=None):
+    """打印 LLM 调用统计（token 用量、级联层级、回放和调度器统计）"""
+    print("\nLLM 调用统计:")
+    print("-" * 60)
+    usage = global_usage_tracker.get_summary()
+    total = usage["total"]
+    print(
+        f"  • 总计: 调用 {total['calls']} 次, 提示 {total['prompt_tokens']} + 生成 {total['completion_tokens']} tokens, "
+        f"{total['tokens_per_second']:.1f} tokens/s, 估算成本 ${total['cost']:.4f}"
+    )
+    for iteration, stats in usage["by_iteration"].items():
+        print(f"    - 第 {iteration + 1} 次迭代: 调用 {stats['calls']} 次, {stats['total_tokens']} tokens")
+    if usage["prompt_components"]:
+        parts = ", ".join(f"{k} {v}" for k, v in usage["prompt_components"].items())
+        print(f"    - 提示词组成 (估算 tokens): {parts}")
+    # 回放 / 级联模块只在启用时导入；没有导入过的模块不可能有实例，无需为统计而导入
+    replay_module = sys.modules.get("llm.replay")
+    cascade_module = sys.modules.get("llm.cascade")
+    if replay_module is not None and isinstance(llm, replay_module.ReplayLLM):
+        stats = llm.get_stats()
+        print(f"  • 回放: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次 (共 {stats['records']} 条录制)")
+    if cascade_module is not None and isinstance(llm, cascade_module.CascadeLLM):
+        for name, stats in llm.get_stats().items():
+            print(
+                f"  • {name}: 调用 {stats['calls']} 次, 接受 {stats['accepted']}, "
+                f"升级 {stats['escalated']}, 错误 {stats['errors']}, "
+                f"平均延迟 {stats['avg_latency'] * 1000:.1f}ms"
+            )
+    if scheduler is not None:
+        sched_stats = scheduler.get_stats()
+        print(f"  • 调度队列: 当前深度 {sched_stats['queue_depth']}, 最大深度 {sched_stats['max_queue_depth']}")
+        for priority, stats in sched_stats["by_priority"].items():
+            print(
+                f"    - 优先级 {priority}: 请求 {stats['requests']} 次, "
+                f"平均等待 {stats['avg_wait'] * 1000:.1f}ms, 最大等待 {stats['max_wait'] * 1000:.1f}ms"
+            )
+    print("-" * 60)
+
+
 def main():
     load_dotenv()
     
     print_banner()
     
-    # 1. 设置记忆系统
-    memory = Memory()
+    # 1. 设置记忆系统（MEMORY_BACKEND=wal 时只追加日志，后台压缩成快照；
+    #    MEMORY_BACKEND=sqlite 时多个用户/进程共享一个 SQLite 数据库；
+    #    设置 MEMORY_DIR 时由 MemoryManager 按用户管理，每个用户一个文件）
+    memory_backend = os.getenv("MEMORY_BACKEND")
+    memory_manager = None
+    if memory_backend == "wal":
+        from agent.memory_store import WALBackend
+        memory = Memory(backend=WALBackend(
+            "user_memory.json",
+            fsync=os.getenv("MEMORY_FSYNC", "interval")
+        ))
+        print("💾 记忆使用预写日志 (WAL) 存储")
+    elif memory_backend == "sqlite":
+        from agent.sqlite_memory import SQLiteMemory
+        memory_user = os.getenv("MEMORY_USER", "default")
+        memory = SQLiteMemory(os.getenv("MEMORY_DB", "user_memory.db"), user_id=memory_user)
+        print(f"💾 记忆使用 SQLite 存储 (用户: {memory_user})")
+    elif os.getenv("MEMORY_DIR"):
+        from agent.memory_manager import MemoryManager
+        memory_user = os.getenv("MEMORY_USER", "default")
+        memory_manager = MemoryManager(base_dir=os.getenv("MEMORY_DIR"))
+        memory = memory_manager.get(memory_user)
+        # 会话期间一直持有该用户的 Memory，定时写回，崩溃时最多丢失一个间隔内的修改
+        memory_manager.start_flusher(float(os.getenv("MEMORY_FLUSH_INTERVAL", "5")))
+        print(f"💾 记忆按用户存放在 {memory_manager.base_dir} (用户: {memory_user})")
+    else:
+        memory = Memory()
     
     # 2. 设置工具注册器
     docs_dir = os.path.join(os.path.dirname(__file__), "data", "docs")
-    tool_registry = setup_tools(docs_dir, memory)
+    # DeepResearch 的 LLM 在下面第 4 步创建，工具首次使用时才读取
+    research_llm = None
+    tool_registry = setup_tools(docs_dir, memory, research_llm=lambda: research_llm)
     
     # 3. 尝试设置 MCP 工具（可选）
-    setup_mcp_tools(tool_registry)
+    mcp_manager = setup_mcp_tools(tool_registry)
     
     print(f"\n✅ 已加载 {len(tool_registry.get_all_tools())} 个工具")
     
     # 4. 设置 LLM
     api_key = os.getenv("OPENAI_API_KEY")
-    if api_key:
-        print("🤖 使用 OpenAI LLM")
-        llm = OpenAILLM(api_key=api_key)
+    replay_path = os.getenv("LLM_REPLAY_PATH")
+    if replay_path:
+        from llm.replay import ReplayLLM
+        # 离线回放录制的会话（LLM_REPLAY_LATENCY: recorded / sampled）
+        print(f"🤖 使用回放 LLM ({replay_path})")
+        llm = ReplayLLM(
+            replay_path,
+            latency_mode=os.getenv("LLM_REPLAY_LATENCY") or None,
+            fallback=MockLLM()
+        )
+    elif api_key:
+        model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+        small_model = os.getenv("OPENAI_SMALL_MODEL")
+        if small_model:
+            from llm.cascade import CascadeLLM
+            # 级联模式: 简单轮次用小模型，置信度不足时升级到大模型
+            print(f"🤖 使用 OpenAI 级联 LLM ({small_model} -> {model})")
+            llm = CascadeLLM(
+                tiers=[
+                    ("small", OpenAILLM(model=small_model, api_key=api_key)),
+                    ("large", OpenAILLM(model=model, api_key=api_key)),
+                ],
+                known_tools=tool_registry.get_tool_names,
+                request_confidence=True
+            )
+        else:
+            print(f"🤖 使用 OpenAI LLM ({model})")
+            llm = OpenAILLM(model=model, api_key=api_key)
     else:
         print("🤖 使用 Mock LLM (演示模式)")
         print("   提示: 设置 OPENAI_API_KEY 环境变量以使用真实模型")
         llm = MockLLM()
     
+    # 可选: 录制真实请求用于离线回放（LLM_RECORD_PATH 环境变量）
+    chat_llm = llm
+    recorder = None
+    record_path = os.getenv("LLM_RECORD_PATH")
+    if record_path and not replay_path:
+        from llm.replay import RecordingLLM
+        print(f"📼 录制 LLM 请求到: {record_path}")
+        recorder = RecordingLLM(chat_llm, record_path)
+        chat_llm = recorder
+    
+    # 可选: 全局限流调度（LLM_RPM / LLM_TPM 环境变量）
+    scheduler = None
+    rpm = os.getenv("LLM_RPM")
+    tpm = os.getenv("LLM_TPM")
+    if rpm or tpm:
+        scheduler = LLMScheduler(
+            rpm=int(rpm) if rpm else None,
+            tpm=int(tpm) if tpm else None
+        )
+        print(f"⏱️  启用 LLM 限流: RPM={rpm or '不限'}, TPM={tpm or '不限'}")
+    # 可选: DeepResearch 使用 LLM 分解问题和总结（RESEARCH_LLM=1），在调度器中以后台优先级排队
+    if os.getenv("RESEARCH_LLM") == "1":
+        research_llm = scheduler.wrap(chat_llm, PRIORITY_BACKGROUND) if scheduler else chat_llm
+        print("🔬 DeepResearch 使用 LLM 驱动的迭代研究")
+    # 可选: 后台定期整理记忆、合并相似条目（MEMORY_CONSOLIDATE_INTERVAL 秒；
+    #       MEMORY_CONSOLIDATE_LLM=1 时用 LLM 改写合并结果，同样以后台优先级排队）
+    consolidator = None
+    consolidate_interval = os.getenv("MEMORY_CONSOLIDATE_INTERVAL")
+    if consolidate_interval:
+        # 整理用到 MinHash（可能导入 numpy），只在启用时导入，不拖慢启动
+        from agent.consolidation import MemoryConsolidator
+        consolidate_llm = None
+        if os.getenv("MEMORY_CONSOLIDATE_LLM") == "1":
+            consolidate_llm = scheduler.wrap(chat_llm, PRIORITY_BACKGROUND) if scheduler else chat_llm
+        consolidator = MemoryConsolidator(llm=consolidate_llm)
+        consolidator.start(
+            memory_manager.memories if memory_manager is not None else (lambda: [memory]),
+            interval=float(consolidate_interval)
+        )
+        print(f"🧹 每 {consolidate_interval}s 在后台整理记忆" + (" (LLM 合并)" if consolidate_llm else ""))
+    if scheduler:
+        chat_llm = scheduler.wrap(chat_llm, PRIORITY_INTERACTIVE)
+    
+    # 可选: 只把最相关的 top-k 个工具放进提示词（TOOL_TOP_K 环境变量）
+    tool_selector = None
+    top_k = os.getenv("TOOL_TOP_K")
+    if top_k:
+        tool_selector = ToolSelector(top_k=int(top_k), pinned=["Search", "Remember"])
+        print(f"🔎 启用工具筛选: 每轮最多 {top_k} 个相关工具 (固定: Search, Remember)")
+    
     # 5. 创建增强版 Agent
     agent = EnhancedChatAgent(
-        llm=llm,
+        llm=chat_llm,
         tools=tool_registry,
         memory=memory,
         max_history=5,
-        max_iterations=3
+        max_iterations=3,
+        tool_selector=tool_selector
     )
     
     print("\n" + "="*60)
@@ -226,11 +394,67 @@ def main():
             elif user_input.lower() == "tools":
                 print("\n可用工具列表:")
                 print("-" * 60)
+                cache_stats = tool_registry.get_cache_stats()
+                guard_stats = tool_registry.get_guard_stats()
+                lazy_stats = tool_registry.get_lazy_stats()
                 for tool in tool_registry.get_all_tools():
                     print(f"  • {tool.name}: {tool.description}")
+                    if tool.name in lazy_stats and lazy_stats[tool.name] is None:
+                        # 尚未加载的工具不为了展示元数据而实例化
+                        print("    状态: 未加载")
+                        continue
+                    meta = tool.metadata
+                    flags = [meta.latency_class]
+                    if meta.pure:
+                        flags.append("纯函数")
+                    if meta.side_effects:
+                        flags.append("有副作用")
+                    print(f"    属性: {', '.join(flags)}")
+                    if tool.name in cache_stats:
+                        stats = cache_stats[tool.name]
+                        print(
+                            f"    缓存: 命中 {stats['hits']} / 未命中 {stats['misses']} "
+                            f"(命中率 {stats['hit_rate']:.0%})"
+                        )
+                    if tool.name in guard_stats:
+                        guard = guard_stats[tool.name]
+                        timeout = f"{guard['timeout']:g}s" if guard['timeout'] is not None else "无"
+                        print(
+                            f"    熔断: {guard['state']} (失败 {guard['failures']}, 慢调用 {guard['slow_calls']}, "
+                            f"超时 {guard['timeouts']}, 拒绝 {guard['rejected'] + guard['rejected_bulkhead']}) "
+                            f"| 并发 {guard['in_flight']}/{guard['max_concurrent'] or '∞'} | 超时上限 {timeout}"
+                        )
                 print("-" * 60)
                 continue
             
+            elif user_input.lower() == "stats":
+                print_llm_stats(llm, scheduler)
+                if tool_selector is not None:
+                    sel = tool_selector.get_stats()
+                    print(
+                        f"  • 工具筛选: {sel['selections']} 次, 节省提示词约 {sel['saved_tokens']} tokens "
+                        f"({sel['saved_ratio']:.0%})"
+                    )
+                mem = memory.get_stats()
+                print(
+                    f"  • 记忆: {mem['preferences']} 条偏好, {mem['facts']} 条事实; "
+                    f"按相关性注入节省约 {mem['saved_tokens']} tokens ({mem['saved_ratio']:.0%})"
+                )
+                if consolidator is not None:
+                    cons = consolidator.get_stats()
+                    print(
+                        f"  • 记忆整理: {cons['runs']} 次, 合并 {cons['clusters']} 簇, 删除 {cons['removed']} 条 "
+                        f"({cons['tokens_before']} -> {cons['tokens_after']} tokens)"
+                    )
+                if memory_manager is not None:
+                    mgr = memory_manager.get_stats()
+                    print(
+                        f"  • 记忆缓存: {mgr['users']} 个用户, 命中率 {mgr['hit_rate']:.0%}, "
+                        f"淘汰 {mgr['evictions']} 次, 写回 {mgr['flushes']} 次 "
+                        f"(平均 {mgr['avg_flush_ms']:.1f}ms, 最长 {mgr['max_flush_ms']:.1f}ms)"
+                    )
+                continue
+            
             elif user_input.lower() == "help":
                 print_help()
                 continue
@@ -248,6 +472,19 @@ def main():
             print(f"\n❌ 发生错误: {str(e)}")
             import traceback
             traceback.print_exc()
+    
+    agent.close()
+    if consolidator is not None:
+        consolidator.stop()
+    if recorder is not None:
+        recorder.close()
+    if mcp_manager is not None:
+        mcp_manager.disconnect_all()
+    # 把尚未落盘的记忆记录写出
+    if memory_manager is not None:
+        memory_manager.close()
+    else:
+        memory.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 从任意目录运行 pytest 时都能导入项目内的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,102 @@
+import tools.cache as cache_module
+from tools.base import BaseTool
+from tools.cache import CACHE_FOREVER, NO_CACHE, CachePolicy, ToolResultCache
+from tools.registry import ToolRegistry
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _fake_clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_entry_expires_after_ttl(monkeypatch):
+    clock = _fake_clock(monkeypatch)
+    cache = ToolResultCache()
+    cache.put("Weather", "beijing", "sunny", CachePolicy(ttl=600))
+    cache.put("Calculator", "1 + 1", "2", CACHE_FOREVER)
+
+    clock.now += 599
+    assert cache.get("Weather", "beijing") == "sunny"
+    clock.now += 1
+    assert cache.get("Weather", "beijing") is None
+    clock.now += 10 ** 6
+    assert cache.get("Calculator", "1 + 1") == "2"
+
+    stats = cache.get_stats()["Weather"]
+    assert (stats["hits"], stats["misses"], stats["expired"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_no_cache_policy_is_not_stored():
+    cache = ToolResultCache()
+    cache.put("DateTime", "now", "12:00", NO_CACHE)
+    assert len(cache) == 0
+    assert not NO_CACHE.enabled and CACHE_FOREVER.enabled
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = ToolResultCache(max_entries=2)
+    cache.put("Search", "a", "A", CACHE_FOREVER)
+    cache.put("Search", "b", "B", CACHE_FOREVER)
+    cache.get("Search", "a")
+    cache.put("Search", "c", "C", CACHE_FOREVER)
+
+    assert cache.get("Search", "b") is None
+    assert cache.get("Search", "a") == "A"
+    assert cache.get_stats()["Search"]["evictions"] == 1
+
+
+def test_invalidate_by_tool():
+    cache = ToolResultCache()
+    cache.put("Search", "a", "A", CACHE_FOREVER)
+    cache.put("Weather", "a", "A", CACHE_FOREVER)
+    assert cache.invalidate("Search") == 1
+    assert cache.get("Weather", "a") == "A"
+    assert cache.invalidate() == 1
+
+
+class _Counting(BaseTool):
+    def __init__(self, name="counting", policy=CACHE_FOREVER):
+        super().__init__(name=name, description="counts calls")
+        self.cache_policy = policy
+        self.calls = 0
+
+    def run(self, query):
+        self.calls += 1
+        return f"{query} #{self.calls}"
+
+
+def test_registry_reuses_results_by_normalized_query():
+    registry = ToolRegistry(default_timeout=None)
+    tool = _Counting()
+    registry.register(tool)
+
+    assert registry.run_tool("counting", "a  b") == "a  b #1"
+    assert registry.run_tool("counting", " a b ") == "a  b #1"
+    assert tool.calls == 1
+    assert registry.get_cache_stats()["counting"]["hits"] == 1
+
+
+def test_registry_skips_cache_for_uncached_tools_and_invalidates_on_replace():
+    registry = ToolRegistry(default_timeout=None)
+    uncached = _Counting("uncached", NO_CACHE)
+    registry.register(uncached)
+    registry.run_tool("uncached", "x")
+    registry.run_tool("uncached", "x")
+    assert uncached.calls == 2
+
+    registry.register(_Counting())
+    registry.run_tool("counting", "x")
+    replacement = _Counting()
+    registry.register(replacement)
+    assert registry.run_tool("counting", "x") == "x #1"
+    assert replacement.calls == 1
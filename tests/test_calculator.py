@@ -0,0 +1,91 @@
+import pytest
+
+from tools.calculator import CalculatorTool, SafeEvaluator
+
+
+@pytest.mark.parametrize("expression", ["(-8) ** 0.5", "(-8) ** (1 / 3) + 1", "x ** 0.5"])
+def test_complex_results_are_rejected(expression):
+    with pytest.raises(ValueError, match="复数"):
+        SafeEvaluator().evaluate(expression, {"x": -2})
+
+
+def test_calculator_reports_complex_result_as_error():
+    result = CalculatorTool().run("(-8)**0.5")
+    assert result.startswith("错误: 计算结果为复数")
+
+
+def test_real_powers_still_work():
+    evaluator = SafeEvaluator()
+    assert evaluator.evaluate("8 ** 0.5") == pytest.approx(2.8284271247)
+    assert evaluator.evaluate("(-8) ** 3") == -512
+
+
+def test_cache_key_distinguishes_expressions_not_spellings():
+    tool = CalculatorTool()
+    assert tool.normalize_query("1 0") != tool.normalize_query("10")
+    assert tool.normalize_query("2+2") == tool.normalize_query(" 2 + (2) ")
+    assert tool.normalize_query('{"expression": "x+1", "variables": {"x": 2}}') == \
+        tool.normalize_query('{"variables": {"x": 2}, "expression": "x + 1"}')
+
+
+def test_registry_does_not_cache_errors():
+    from tools.registry import ToolRegistry
+
+    registry = ToolRegistry()
+    registry.register(CalculatorTool())
+
+    assert registry.run_tool("Calculator", "1 0").startswith("错误")
+    assert registry.run_tool("Calculator", "10") == "计算结果: 10 = 10"
+    assert registry.run_tool("Calculator", "2+2") == registry.run_tool("Calculator", "2 + 2") == "计算结果: 2 + 2 = 4"
+    assert registry.cache.get("Calculator", CalculatorTool().normalize_query("1 0")) is None
+
+
+def test_batch_rejects_malformed_variables():
+    tool = CalculatorTool()
+    assert tool.run('{"expression": "x", "variables": [1]}').startswith("错误: variables")
+    assert tool.run('{"expression": "x + y", "variables": {"x": [1, 2], "y": [1]}}').startswith("错误: 各变量")
+    assert tool.run('{"expression": "x", "variables": {"x": ["a"]}}').startswith("错误: 变量 x")
+
+
+def test_batch_broadcasts_scalar_variables():
+    tool = CalculatorTool()
+    assert tool.run('{"expression": "x * y", "variables": {"x": [1, 2], "y": 3}}') == "批量计算结果: x * y -> [3, 6]"
+
+
+def test_compiled_expressions_are_cached():
+    evaluator = SafeEvaluator()
+    assert evaluator.evaluate("x * 2 + y", {"x": 1, "y": 3}) == 5
+    assert evaluator.evaluate("x * 2 + y", {"x": 2, "y": 1}) == 5
+    info = evaluator.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_functions_and_constants():
+    evaluator = SafeEvaluator()
+    assert evaluator.evaluate("sqrt(16) + floor(2.7)") == 6
+    assert evaluator.evaluate("cos(pi)") == pytest.approx(-1)
+    with pytest.raises(ValueError):
+        evaluator.evaluate("__import__('os')")
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_batch_matches_row_by_row(use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    evaluator = SafeEvaluator()
+    columns = {"x": [1, 2, 3], "y": [4, 5, 6]}
+    expected = [evaluator.evaluate("sqrt(x ** 2 + y ** 2)", {"x": x, "y": y}) for x, y in zip(*columns.values())]
+
+    result = evaluator.evaluate_batch("sqrt(x ** 2 + y ** 2)", columns, use_numpy=use_numpy)
+    assert result == pytest.approx(expected)
+
+
+def test_batch_constant_expression_broadcasts_to_rows():
+    pytest.importorskip("numpy")
+    assert SafeEvaluator().evaluate_batch("2 + 3", {"x": [1, 2]}) == [5, 5]
+
+
+def test_batch_json_request():
+    result = CalculatorTool().run('{"expression": "x * 2 + y", "variables": {"x": [1, 2], "y": [3, 4]}}')
+    assert result == "批量计算结果: x * 2 + y -> [5, 8]"
+    assert CalculatorTool().run('{"expression": "x + 1", "variables": {"x": 2}}') == "计算结果: x + 1 = 3"
@@ -0,0 +1,86 @@
+import pytest
+
+from llm.base import BaseLLM
+from llm.cascade import CascadeLLM
+
+
+class _FixedLLM(BaseLLM):
+    """总是返回同一个回复，记录收到的消息"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = []
+
+    def generate(self, messages, stop=None):
+        self.calls.append(messages)
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+
+MESSAGES = [{"role": "system", "content": "You are helpful."}, {"role": "user", "content": "hi"}]
+
+
+def _cascade(small_reply, large_reply="large answer", **kwargs):
+    small, large = _FixedLLM(small_reply), _FixedLLM(large_reply)
+    cascade = CascadeLLM([("small", small), ("large", large)], **kwargs)
+    return cascade, small, large
+
+
+def test_confident_small_reply_is_accepted():
+    cascade, small, large = _cascade("small answer", known_tools=["Search"])
+    assert cascade.generate(MESSAGES) == "small answer"
+    assert not large.calls
+    stats = cascade.get_stats()
+    assert stats["small"]["accepted"] == 1 and stats["large"]["calls"] == 0
+
+
+@pytest.mark.parametrize("reply, reason", [
+    ("", "empty_response"),
+    ("ACTION: Search without brackets", "malformed_action"),
+    ("ACTION: Teleport[home]", "unknown_tool"),
+    ("Probably Paris.\nCONFIDENCE: 0.3", "low_confidence"),
+])
+def test_failed_check_escalates(reply, reason):
+    cascade, small, large = _cascade(reply, known_tools=lambda: ["Search"])
+    assert cascade.generate(MESSAGES) == "large answer"
+    assert cascade.escalation_reasons == {reason: 1}
+    assert cascade.get_stats()["small"]["escalated"] == 1
+
+
+def test_confidence_marker_is_stripped_from_accepted_reply():
+    cascade, _, _ = _cascade("Paris.\nCONFIDENCE: 0.9")
+    assert cascade.generate(MESSAGES) == "Paris."
+
+
+def test_error_escalates_but_last_tier_error_raises():
+    cascade, _, _ = _cascade(RuntimeError("boom"))
+    assert cascade.generate(MESSAGES) == "large answer"
+    assert cascade.escalation_reasons == {"error": 1}
+
+    cascade, _, _ = _cascade(RuntimeError("boom"), RuntimeError("down"))
+    with pytest.raises(RuntimeError, match="down"):
+        cascade.generate(MESSAGES)
+
+
+def test_last_tier_reply_is_always_accepted():
+    cascade, _, _ = _cascade("ACTION: Teleport[home]", "ACTION: Teleport[work]", known_tools=["Search"])
+    assert cascade.generate(MESSAGES) == "ACTION: Teleport[work]"
+
+
+def test_usage_includes_escalated_tiers():
+    cascade, _, _ = _cascade("ACTION: Teleport[home]", known_tools=["Search"])
+    small_only, _, _ = _cascade("ACTION: Search[home]", known_tools=["Search"])
+
+    escalated = cascade.generate_with_usage(MESSAGES)
+    direct = small_only.generate_with_usage(MESSAGES)
+    assert escalated.prompt_tokens == 2 * direct.prompt_tokens
+
+
+def test_confidence_instruction_only_for_non_final_tiers():
+    cascade, small, large = _cascade("", request_confidence=True)
+    cascade.generate(MESSAGES)
+    assert "CONFIDENCE" in small.calls[0][0]["content"]
+    assert "CONFIDENCE" not in large.calls[0][0]["content"]
+    # 不修改调用方的消息
+    assert "CONFIDENCE" not in MESSAGES[0]["content"]
@@ -0,0 +1,40 @@
+from agent.consolidation import MemoryConsolidator
+from agent.memory import Memory
+
+
+def _filler(n):
+    return [f"note number {i} about topic {chr(97 + i)}" for i in range(n)]
+
+
+def test_negated_entries_are_not_merged():
+    consolidator = MemoryConsolidator(min_entries=1)
+    entries = ["is not vegetarian"] + _filler(5) + ["is vegetarian"]
+    planned, clusters, _ = consolidator.plan(entries)
+    assert clusters == 0
+    assert planned == entries
+
+
+def test_antonym_prefix_entries_are_not_merged():
+    consolidator = MemoryConsolidator(min_entries=1)
+    assert consolidator.cluster(["likes python", "dislikes python"]) == []
+    assert consolidator.cluster(["喜欢吃辣", "不喜欢吃辣"]) == []
+
+
+def test_longer_entry_wins_only_when_it_covers_the_shorter():
+    consolidator = MemoryConsolidator(min_entries=1, threshold=0.6)
+    planned, clusters, _ = consolidator.plan(["likes python a lot", "likes python"])
+    assert clusters == 1
+    assert planned == ["likes python a lot"]
+
+    # 较旧的长条目不包含新条目的全部词时保留最新的一条
+    assert MemoryConsolidator._merge_by_rule(["prefers dark mode themes", "prefers light mode"]) == "prefers light mode"
+
+
+def test_consolidate_keeps_newest_opposite_fact(tmp_path):
+    memory = Memory(str(tmp_path / "memory.json"))
+    for text in ["is not vegetarian"] + _filler(10) + ["is vegetarian"]:
+        memory.add_fact(text)
+    MemoryConsolidator(min_entries=1).consolidate(memory)
+    facts = memory.data["facts"]
+    assert "is vegetarian" in facts
+    assert "is not vegetarian" in facts
@@ -0,0 +1,64 @@
+import pytest
+
+import tools.dedup as dedup_module
+from tools.dedup import MinHash, PassageDeduplicator, normalize_passage, shingles
+
+PASSAGE = "Python is a high-level, general-purpose programming language created by Guido van Rossum."
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+def test_normalize_strips_source_prefix_and_punctuation():
+    assert normalize_passage("[python_intro.txt:3]  Python, is  GREAT!") == "python is great"
+
+
+def test_minhash_estimates_jaccard():
+    minhash = MinHash(num_perm=256)
+    a = shingles(normalize_passage(PASSAGE), 3)
+    b = shingles(normalize_passage(PASSAGE.replace("Guido van Rossum", "a Dutch programmer")), 3)
+    estimate = MinHash.similarity(minhash.signature(a), minhash.signature(b))
+    assert estimate == pytest.approx(_jaccard(a, b), abs=0.1)
+
+
+def test_numpy_and_pure_python_signatures_match(monkeypatch):
+    pytest.importorskip("numpy")
+    values = shingles(normalize_passage(PASSAGE), 3)
+    with_numpy = MinHash().signature(values)
+    monkeypatch.setattr(dedup_module, "_np", None)
+    assert MinHash().signature(values) == with_numpy
+
+
+def test_drops_exact_and_near_duplicates_from_other_sources():
+    dedup = PassageDeduplicator(threshold=0.75)
+    passages = [
+        f"[a.txt:1] {PASSAGE}",
+        f"[b.txt:7] {PASSAGE}",
+        "[c.txt:2] Python is a high level general purpose programming language created by Guido van Rossum",
+        "Agents plan, act and observe in a loop until the task is done.",
+    ]
+    assert dedup.filter(passages) == [passages[0], passages[3]]
+
+    stats = dedup.get_stats()
+    assert (stats["kept"], stats["dropped"]) == (2, 2)
+    assert stats["bytes_saved"] == len(passages[1].encode("utf-8")) + len(passages[2].encode("utf-8"))
+    assert stats["tokens_saved"] > 0
+
+
+def test_distinct_passages_are_kept():
+    dedup = PassageDeduplicator()
+    passages = [
+        PASSAGE,
+        "Agents plan, act and observe in a loop until the task is done.",
+        "BM25 ranks documents by term frequency and inverse document frequency.",
+        "The user prefers concise answers written in Chinese.",
+        "天气晴朗，适合出门散步。",
+        "今天下雨，记得带伞。",
+    ]
+    assert dedup.filter(passages) == passages
+
+
+def test_bands_must_divide_signature_length():
+    with pytest.raises(ValueError):
+        PassageDeduplicator(num_perm=64, bands=10)
@@ -0,0 +1,179 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from llm.base import BaseLLM
+from tools.base import BaseTool
+from tools.deep_research import DeepResearchTool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _SlowSearch(BaseTool):
+    """记录并发数的搜索工具"""
+
+    def __init__(self, delay=0.0):
+        super().__init__(name="Search", description="search")
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def run(self, query):
+        with self._lock:
+            self.queries.append(query)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            return f"findings for {query}"
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def test_fan_out_caps_concurrency_and_keeps_order():
+    search = _SlowSearch(delay=0.05)
+    tool = DeepResearchTool(search, max_workers=2, dedup_threshold=None)
+
+    results = list(tool._fan_out([f"q{i}" for i in range(6)]))
+
+    assert [r[0] for r in results] == list(range(6))
+    assert all(status == "ok" for _, _, status, _ in results)
+    assert results[3][1] == "findings for q3"
+    assert search.max_active == 2
+
+
+def test_hung_search_does_not_block_interpreter_exit():
+    script = (
+        "import time\n"
+        "from tools.base import BaseTool\n"
+        "from tools.deep_research import DeepResearchTool\n"
+        "class Hang(BaseTool):\n"
+        "    def run(self, query):\n"
+        "        time.sleep(60)\n"
+        "report = DeepResearchTool(Hang('Search', 'hangs'), subtask_timeout=0.2).run('agents')\n"
+        "assert 'timed out' in report\n"
+    )
+    start = time.monotonic()
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True, timeout=30)
+    assert time.monotonic() - start < 10
+
+
+
+class _PickySearch(_SlowSearch):
+    """按查询内容失败或挂起"""
+
+    def run(self, query):
+        if "types" in query:
+            raise RuntimeError("index offline")
+        if "characteristics" in query:
+            time.sleep(1.0)
+        return super().run(query)
+
+
+def test_failed_and_timed_out_steps_give_partial_report():
+    tool = DeepResearchTool(_PickySearch(), subtask_timeout=0.2, dedup_threshold=None)
+    report = tool.run("agents")
+
+    assert "Findings: findings for what is an intelligent agent" in report
+    assert "(timed out after 0.2s)" in report
+    assert "(search failed: index offline)" in report
+    assert "[partial] 1 of 3 research steps succeeded" in report
+    assert not tool.is_cacheable(report)
+
+
+def test_queue_time_does_not_count_towards_timeout():
+    search = _SlowSearch(delay=0.1)
+    tool = DeepResearchTool(search, max_workers=1, subtask_timeout=0.15, dedup_threshold=None)
+
+    statuses = [status for _, _, status, _ in tool._fan_out(["a", "b", "c", "d"])]
+    assert statuses == ["ok"] * 4
+
+
+def test_closing_stream_skips_unstarted_searches():
+    search = _SlowSearch(delay=0.05)
+    tool = DeepResearchTool(search, max_workers=1, dedup_threshold=None)
+    calls = []
+    search.run = lambda query, run=search.run: calls.append(query) or run(query)
+
+    results = tool._fan_out([f"q{i}" for i in range(6)])
+    next(results)
+    results.close()
+    time.sleep(0.2)
+    assert len(calls) <= 2
+
+
+class _ScriptedLLM(BaseLLM):
+    """按提示词类型返回固定回复"""
+
+    def __init__(self, judge_reply, decompose_reply="what are agents\nhow do agents plan"):
+        # 每轮依次使用一个判断回复，用完后重复最后一个
+        self.judge_replies = list(judge_reply) if isinstance(judge_reply, list) else [judge_reply]
+        self.decompose_reply = decompose_reply
+        self.judged = 0
+
+    def generate(self, messages, stop=None):
+        prompt = messages[-1]["content"]
+        if prompt.startswith("Break the research topic"):
+            if isinstance(self.decompose_reply, Exception):
+                raise self.decompose_reply
+            return self.decompose_reply
+        if "For each numbered sub-question" in prompt:
+            self.judged += 1
+            return self.judge_replies[min(self.judged, len(self.judge_replies)) - 1]
+        return "summary"
+
+
+def _stop_reason(report):
+    return report.rsplit("stop: ", 1)[1].strip()
+
+
+def test_last_round_fully_answered_reports_covered():
+    llm = _ScriptedLLM("1: OK\n2: OK")
+    tool = DeepResearchTool(_SlowSearch(), llm=llm, max_rounds=1, dedup_threshold=None)
+    assert _stop_reason(tool.run("agents")) == "covered"
+
+
+def test_last_round_with_open_questions_reports_max_rounds():
+    llm = _ScriptedLLM("1: OK\n2: what planning algorithms do agents use")
+    tool = DeepResearchTool(_SlowSearch(), llm=llm, max_rounds=1, dedup_threshold=None)
+    report = tool.run("agents")
+    assert _stop_reason(report) == "max rounds"
+    assert "0 follow-up(s)" in report
+
+
+def test_only_under_answered_questions_are_deepened():
+    search = _SlowSearch()
+    llm = _ScriptedLLM(["1: OK\n2: what planning algorithms do agents use", "1: OK"])
+    tool = DeepResearchTool(search, llm=llm, max_rounds=3, dedup_threshold=None)
+    report = tool.run("agents")
+
+    assert search.queries == ["what are agents", "how do agents plan", "what planning algorithms do agents use"]
+    assert "Researching 'what planning algorithms do agents use' (follow-up to step 2)" in report
+    assert llm.judged == 2
+    assert _stop_reason(report) == "covered"
+
+
+def test_question_limit_stops_deepening():
+    llm = _ScriptedLLM("1: why\n2: how")
+    tool = DeepResearchTool(_SlowSearch(), llm=llm, max_rounds=3, max_questions=2, dedup_threshold=None)
+    assert _stop_reason(tool.run("agents")) == "max questions"
+
+
+def test_exhausted_token_budget_stops_before_judging():
+    llm = _ScriptedLLM("1: why\n2: how")
+    tool = DeepResearchTool(_SlowSearch(), llm=llm, budget_tokens=40, dedup_threshold=None)
+    report = tool.run("agents")
+    assert _stop_reason(report) == "budget"
+    assert llm.judged == 0
+
+
+def test_failed_decomposition_falls_back_to_fixed_questions():
+    search = _SlowSearch()
+    llm = _ScriptedLLM("1: OK\n2: OK\n3: OK", decompose_reply=RuntimeError("llm down"))
+    DeepResearchTool(search, llm=llm, dedup_threshold=None).run("python")
+    assert search.queries == DeepResearchTool(search)._generate_sub_questions("python")
@@ -0,0 +1,116 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tools.mcp_client import MCPClient
+from tools.mcp_stub_server import MCPStubServer
+from tools.mcp_transport import MCPConnectionError
+
+
+@pytest.fixture
+def server():
+    """python -m tools.mcp_stub_server --http 使用的同一个服务器，在本进程中运行以便读取统计"""
+    stub = MCPStubServer()
+    httpd = stub.make_http_server("127.0.0.1", 0, idle_timeout=0.5)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield stub, httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _connect(httpd, kind="http", **config):
+    port = httpd.server_address[1]
+    path = "/sse" if kind == "sse" else "/mcp"
+    client = MCPClient(dict({"name": kind, "type": kind, "url": f"http://127.0.0.1:{port}{path}", "timeout": 5}, **config))
+    assert client.connect()
+    return client
+
+
+def test_keep_alive_connection_is_reused(server):
+    stub, httpd = server
+    client = _connect(httpd)
+    for i in range(50):
+        assert client.call_tool("echo", {"text": str(i)}) == str(i)
+    pool = client.get_stats()["pool"]
+    assert pool["created"] == 1
+    assert pool["reused"] >= 50
+    assert stub.stats["http_connections"] == 1
+    client.disconnect()
+
+
+def test_max_connections_caps_concurrency(server):
+    stub, httpd = server
+    client = _connect(httpd, max_connections=2)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(6) as pool:
+        results = list(pool.map(lambda _: client.call_tool("sleep", {"seconds": "0.2"}), range(6)))
+    elapsed = time.perf_counter() - start
+    assert results == ["slept 0.2s"] * 6
+    stats = client.get_stats()["pool"]
+    assert stats["max_in_use"] == 2
+    assert stats["created"] == 2
+    assert stats["waits"] > 0
+    # 6 个请求、2 条连接：至少三轮
+    assert elapsed >= 0.55
+    client.disconnect()
+
+
+def test_stale_keep_alive_connection_is_retried(server):
+    stub, httpd = server
+    client = _connect(httpd)
+    assert client.call_tool("echo", {"text": "a"}) == "a"
+    time.sleep(0.8)  # 服务器关闭了空闲连接
+    assert client.call_tool("echo", {"text": "b"}) == "b"
+    pool = client.get_stats()["pool"]
+    assert pool["created"] == 2
+    assert pool["discarded"] >= 1
+    client.disconnect()
+
+
+def test_streamed_progress_and_early_close(server):
+    stub, httpd = server
+    client = _connect(httpd)
+    chunks = list(client.call_tool_stream("stream", {"count": 3, "interval": 0.01}))
+    assert chunks == ["line 1\n", "line 2\n", "line 3\n"]
+    assert "".join(chunks) == client.call_tool("stream", {"count": 3, "interval": 0.01})
+
+    stream = client.call_tool_stream("stream", {"count": 100, "interval": 0.02})
+    assert next(stream) == "line 1\n"
+    stream.close()
+    assert client.get_stats()["cancelled"] == 1
+    deadline = time.time() + 2
+    while stub.stats["cancelled"] + stub.stats["disconnects"] == 0 and time.time() < deadline:
+        time.sleep(0.02)
+    assert stub.stats["cancelled"] + stub.stats["disconnects"] >= 1
+    # 服务器没有把 100 行都产出
+    assert stub.stats["progress_sent"] < 50
+    client.disconnect()
+
+
+def test_expired_session_raises_connection_error(server):
+    stub, httpd = server
+    client = _connect(httpd)
+    assert client.call_tool("echo", {"text": "a"}) == "a"
+    httpd.sessions.clear()
+    with pytest.raises(MCPConnectionError):
+        client.call_tool("echo", {"text": "b"})
+    client.disconnect()
+
+
+def test_sse_transport(server):
+    stub, httpd = server
+    client = _connect(httpd, kind="sse")
+    assert client.call_tool("echo", {"text": "yo"}) == "yo"
+    assert list(client.call_tool_stream("stream", {"count": 2, "interval": 0.01})) == ["line 1\n", "line 2\n"]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: client.call_tool("sleep", {"seconds": "0.3"}), range(8)))
+    assert results == ["slept 0.3s"] * 8
+    # 响应都从同一条事件流返回，请求可以同时在途
+    assert time.perf_counter() - start < 1.0
+    assert client.get_stats()["max_in_flight"] >= 8
+    client.disconnect()
+    assert not client.connected
@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+import threading
+import time
+
+from tools.mcp_client import MCPManager, create_mcp_manager_from_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _server(name, delay=0.0, **extra):
+    command = f"sleep {delay}; exec {sys.executable} -m tools.mcp_stub_server"
+    return dict({"name": name, "type": "stdio", "command": "sh", "args": ["-c", command], "cwd": ROOT}, **extra)
+
+
+def test_servers_connect_concurrently_and_late_servers_are_reported(tmp_path):
+    config_file = tmp_path / "mcp_config.json"
+    config_file.write_text(json.dumps({"mcp_servers": [
+        _server("fast"),
+        _server("slow", delay=1.0, startup_timeout=0.3),
+        {"name": "missing", "type": "stdio", "command": "no-such-mcp-server"},
+    ]}))
+    late = threading.Event()
+    late_tools = []
+
+    def on_late_connect(client):
+        late_tools.extend(tool.name for tool in client.get_tools_as_agent_tools())
+        late.set()
+
+    start = time.perf_counter()
+    manager = create_mcp_manager_from_config(str(config_file), startup_timeout=5, on_late_connect=on_late_connect)
+    try:
+        # 启动不等待慢服务器
+        assert time.perf_counter() - start < 1.0
+        assert sorted(manager.clients) == ["fast"]
+        assert late.wait(5)
+        assert "slow_echo" in late_tools
+        stats = manager.get_stats()
+        assert stats["timed_out"] == 1 and stats["late_connected"] == 1 and stats["failed"] == 1
+    finally:
+        manager.disconnect_all()
+
+
+def test_lazy_mode_uses_cached_manifest(tmp_path):
+    manifest = str(tmp_path / "tools_cache.json")
+    manager = MCPManager(manifest_file=manifest)
+    assert manager.add_servers([_server("stub")]) == 1
+    manager.disconnect_all()
+
+    manager = MCPManager(manifest_file=manifest, lazy=True)
+    start = time.perf_counter()
+    assert manager.add_servers([_server("stub")]) == 1
+    assert time.perf_counter() - start < 0.1
+    client = manager.clients["stub"]
+    assert not client.connected
+    tools = {tool.name: tool for tool in manager.get_all_tools()}
+    assert tools["stub_echo"].run("hi") == "hi"
+    assert client.connected
+    assert manager.get_stats()["lazy_connected"] == 1
+    manager.disconnect_all()
@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from tools.mcp_transport import MCPConnectionError, MCPTimeoutError, StdioTransport
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _RecordingTransport(StdioTransport):
+    """记录发给服务器的每条消息"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent = []
+
+    def _send(self, message):
+        self.sent.append(message)
+        super()._send(message)
+
+
+@pytest.fixture
+def transport():
+    transport = _RecordingTransport(sys.executable, ["-m", "tools.mcp_stub_server"], cwd=ROOT, timeout=10, name="stub")
+    transport.start()
+    transport.request("initialize", {"protocolVersion": "2024-11-05", "capabilities": {}, "clientInfo": {"name": "test"}})
+    transport.notify("notifications/initialized")
+    yield transport
+    transport.close()
+
+
+def _call(transport, name, arguments, timeout=None):
+    result = transport.request("tools/call", {"name": name, "arguments": arguments}, timeout=timeout)
+    return result["content"][0]["text"]
+
+
+def test_pipelined_concurrent_calls(transport):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(10) as pool:
+        results = list(pool.map(lambda _: _call(transport, "sleep", {"seconds": "0.3"}), range(10)))
+    elapsed = time.perf_counter() - start
+    assert results == ["slept 0.3s"] * 10
+    # 10 个请求同时在一条管道上，总耗时接近单个请求
+    assert elapsed < 1.5
+    assert transport.get_stats()["max_in_flight"] >= 10
+
+
+def test_out_of_order_responses(transport):
+    finished = []
+    lock = threading.Lock()
+
+    def call(seconds):
+        text = _call(transport, "sleep", {"seconds": seconds})
+        with lock:
+            finished.append(text)
+
+    slow = threading.Thread(target=call, args=("0.5",))
+    slow.start()
+    time.sleep(0.05)
+    call("0.01")
+    slow.join()
+    assert finished == ["slept 0.01s", "slept 0.5s"]
+
+
+def test_timeout_sends_cancel_and_connection_survives(transport):
+    with pytest.raises(MCPTimeoutError):
+        _call(transport, "sleep", {"seconds": "1"}, timeout=0.2)
+    request_id = next(m["id"] for m in reversed(transport.sent) if m.get("method") == "tools/call")
+    cancels = [m for m in transport.sent if m.get("method") == "notifications/cancelled"]
+    assert cancels and cancels[-1]["params"]["requestId"] == request_id
+
+    assert transport.connected
+    assert _call(transport, "echo", {"text": "still here"}) == "still here"
+    assert transport.get_stats()["timeouts"] == 1
+
+
+def test_pending_calls_fail_when_server_exits(transport):
+    errors = []
+
+    def call():
+        try:
+            _call(transport, "sleep", {"seconds": "5"})
+        except MCPConnectionError as e:
+            errors.append(e)
+
+    worker = threading.Thread(target=call)
+    worker.start()
+    time.sleep(0.2)
+    transport._process.kill()
+    worker.join(3)
+    assert not worker.is_alive()
+    assert len(errors) == 1
+    assert not transport.connected
+    with pytest.raises(MCPConnectionError):
+        _call(transport, "echo", {"text": "x"})
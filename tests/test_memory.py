@@ -0,0 +1,65 @@
+from agent.memory import Memory
+
+
+def test_overwriting_profile_key_does_not_grow_estimate(tmp_path):
+    memory = Memory(str(tmp_path / "memory.json"))
+    memory.update_profile("name", "Alice")
+    size = memory.estimated_bytes
+
+    for _ in range(10):
+        memory.update_profile("name", "Bob")
+        memory.update_profile("name", "Alice")
+    assert memory.estimated_bytes == size
+
+    memory.update_profile("name", "A" * 100)
+    assert memory.estimated_bytes == size + 95
+
+
+def _memory(tmp_path, **kwargs):
+    memory = Memory(str(tmp_path / "memory.json"), **kwargs)
+    memory.update_profile("name", "Alice")
+    for fact in (
+        "works as a data engineer in Berlin",
+        "has a dog named Rex",
+        "is training for a marathon",
+        "allergic to peanuts",
+    ):
+        memory.add_fact(fact)
+    memory.add_preference("likes python")
+    memory.add_preference("prefers tea over coffee")
+    return memory
+
+
+def test_small_memory_is_injected_in_full(tmp_path):
+    memory = _memory(tmp_path)
+    assert memory.get_context("anything", top_k=10) == memory.get_context()
+
+
+def test_top_k_keeps_most_relevant_entries_in_order(tmp_path):
+    memory = _memory(tmp_path)
+    context = memory.get_context("what should my dog eat, I am allergic to peanuts", top_k=2)
+
+    assert context.startswith("User Profile: [name: Alice]")
+    assert "Known Facts: [has a dog named Rex; allergic to peanuts]" in context
+    assert "Berlin" not in context and "python" not in context
+
+
+def test_token_budget_limits_injected_entries(tmp_path):
+    memory = _memory(tmp_path)
+    memory.get_context("marathon training dog", token_budget=12)
+    stats = memory.stats
+    assert 0 < stats["injected_tokens"] <= 12 < stats["full_tokens"]
+
+
+def test_duplicates_are_ignored(tmp_path):
+    memory = _memory(tmp_path)
+    memory.add_fact("has a dog named Rex")
+    assert memory.data["facts"].count("has a dog named Rex") == 1
+
+
+def test_search_uses_vectors_when_configured(tmp_path):
+    def embed(texts):
+        return [[1.0, 0.0] if "coffee" in t or "tea" in t or "drink" in t else [0.0, 1.0] for t in texts]
+
+    memory = _memory(tmp_path, embed_fn=embed)
+    assert memory.search("favourite drink", k=1)[0][0] == "prefers tea over coffee"
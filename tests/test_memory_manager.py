@@ -0,0 +1,62 @@
+import time
+
+from agent.memory import Memory
+from agent.memory_manager import MemoryManager
+
+
+class _FlakyMemory(Memory):
+    """flush 失败指定次数后恢复"""
+
+    failures = 0
+
+    def flush(self):
+        if _FlakyMemory.failures:
+            _FlakyMemory.failures -= 1
+            raise OSError("disk full")
+        return super().flush()
+
+
+def test_failed_write_back_keeps_user_cached(tmp_path):
+    manager = MemoryManager(
+        factory=lambda user: _FlakyMemory(str(tmp_path / f"{user}.json"), autosave=False),
+        max_users=1
+    )
+    manager.get("alice").add_fact("lives in Berlin")
+    _FlakyMemory.failures = 1
+
+    manager.get("bob")  # 淘汰 alice，写回失败
+    assert "alice" in manager
+    assert manager.get("alice").dirty
+
+    manager.get("bob")  # 再次淘汰 alice，这次写回成功
+    assert "alice" not in manager
+    assert "lives in Berlin" in manager.get("alice").data["facts"]
+    manager.close()
+
+
+def test_flusher_writes_back_periodically(tmp_path):
+    manager = MemoryManager(base_dir=str(tmp_path))
+    memory = manager.get("alice")
+    manager.start_flusher(0.05)
+    memory.add_fact("likes tea")
+    deadline = time.time() + 2
+    while memory.dirty and time.time() < deadline:
+        time.sleep(0.02)
+    assert not memory.dirty
+    assert "likes tea" in Memory(str(tmp_path / "alice.json")).data["facts"]
+    manager.close()
+
+
+def test_byte_limit_evicts_least_recently_used(tmp_path):
+    manager = MemoryManager(base_dir=str(tmp_path), max_users=10, max_bytes=None)
+    for user in ("alice", "bob", "carol"):
+        manager.get(user).add_fact("x" * 200)
+    size = manager.get("carol").estimated_bytes
+
+    # 上限只容得下 carol 和空的 dave：从最久未使用的用户开始淘汰，直到不超出上限
+    manager.max_bytes = 2 * size + 10
+    manager.get("dave")
+    assert "alice" not in manager and "bob" not in manager
+    assert "carol" in manager and "dave" in manager
+    assert manager.get_stats()["evictions"] == 2
+    manager.close()
@@ -0,0 +1,54 @@
+import os
+import time
+
+from agent.memory_store import FSYNC_INTERVAL, WALBackend
+
+
+def _write_wal(path, lines):
+    with open(path, "wb") as f:
+        f.write(b"".join(lines))
+
+
+def test_replay_skips_corrupt_record_mid_file(tmp_path):
+    snapshot = str(tmp_path / "memory.json")
+    backend = WALBackend(snapshot)
+    _write_wal(backend.wal_path, [
+        b'{"op":"add_fact","value":"a"}\n',
+        b'{"op":"add_fa\n',
+        b'{"op":"add_fact","value":"b"}\n',
+    ])
+    size = os.path.getsize(backend.wal_path)
+
+    data = backend.load()
+
+    assert data["facts"] == ["a", "b"]
+    assert backend.stats["corrupt_records"] == 1
+    assert backend.stats["torn_records"] == 0
+    assert os.path.getsize(backend.wal_path) == size  # 中间损坏不截断
+
+
+def test_replay_truncates_only_unterminated_last_line(tmp_path):
+    snapshot = str(tmp_path / "memory.json")
+    backend = WALBackend(snapshot)
+    good = b'{"op":"add_fact","value":"a"}\n'
+    _write_wal(backend.wal_path, [good, b'{"op":"add_fact","val'])
+
+    data = backend.load()
+
+    assert data["facts"] == ["a"]
+    assert backend.stats["torn_records"] == 1
+    assert os.path.getsize(backend.wal_path) == len(good)
+
+
+def test_interval_policy_fsyncs_without_further_writes(tmp_path):
+    backend = WALBackend(str(tmp_path / "memory.json"), fsync=FSYNC_INTERVAL, fsync_interval=0.05)
+    data = backend.load()
+    backend.append("add_fact", {"value": "a"}, data)
+
+    deadline = time.monotonic() + 2
+    while backend.stats["fsyncs"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert backend.stats["fsyncs"] == 1
+    backend.close()
+    assert backend.stats["fsyncs"] == 1  # 没有新写入，close 不再重复 fsync
@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip("openai")
+
+from llm.openai_provider import OpenAILLM
+from llm.stub_server import StubServer
+
+
+@pytest.fixture
+def stub_factory():
+    servers = []
+
+    def start(**kwargs):
+        server = StubServer(port=0, responses=["hello world"], **kwargs)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def _llm(server):
+    return OpenAILLM(model="stub", api_key="test", base_url=server.base_url, max_retries=0)
+
+
+def test_streaming_usage(stub_factory):
+    server = stub_factory()
+    result = _llm(server).generate_with_usage([{"role": "user", "content": "hi"}])
+
+    assert result.text == "hello world"
+    assert not result.estimated
+    assert result.time_to_first_token is not None
+    assert server.stats["streamed"] == 1
+
+
+def test_falls_back_when_stream_options_rejected(stub_factory):
+    server = stub_factory(reject_stream_options=True)
+    llm = _llm(server)
+    messages = [{"role": "user", "content": "hi"}]
+
+    first = llm.generate_with_usage(messages)
+    second = llm.generate_with_usage(messages)
+
+    assert first.text == second.text == "hello world"
+    assert not first.estimated
+    assert first.time_to_first_token is None
+    assert not llm.stream_usage
+    # 第一次: 被拒绝的流式请求 + 非流式回退；第二次直接走非流式
+    assert server.stats["requests"] == 3
+    assert server.stats["streamed"] == 0
+
+
+def test_stream_closed_when_iteration_fails(stub_factory, monkeypatch):
+    server = stub_factory()
+    llm = _llm(server)
+    closed = []
+    create = llm.client.chat.completions.create
+
+    class _FailingStream:
+        def __init__(self, stream):
+            self._stream = stream
+
+        def __iter__(self):
+            yield next(iter(self._stream))
+            raise ConnectionError("stream interrupted")
+
+        def close(self):
+            closed.append(True)
+            self._stream.close()
+
+    monkeypatch.setattr(
+        llm.client.chat.completions, "create", lambda **kwargs: _FailingStream(create(**kwargs))
+    )
+    with pytest.raises(ConnectionError):
+        llm.generate_with_usage([{"role": "user", "content": "hi"}])
+    assert closed == [True]
@@ -0,0 +1,207 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from tools.base import BaseTool, ToolMetadata
+from tools.cache import CACHE_FOREVER
+from tools.catalog import BUILTIN_TOOLS
+from tools.registry import TRUNCATION_NOTICE, ToolRegistry, import_from_path
+
+
+class _Constant(BaseTool):
+    def __init__(self, name, value):
+        super().__init__(name=name, description="returns a constant")
+        self.value = value
+
+    def run(self, query):
+        return self.value
+
+
+def test_run_tool_uses_pinned_snapshot():
+    registry = ToolRegistry(default_timeout=None)
+    registry.register(_Constant("const", "old"))
+    snapshot = registry.snapshot()
+
+    registry.register(_Constant("const", "new"))
+    assert registry.run_tool("const", "") == "new"
+    assert registry.run_tool("const", "", snapshot=snapshot) == "old"
+    assert registry.run_tool(snapshot.get("const"), "") == "old"
+
+    registry.unregister("const")
+    with pytest.raises(KeyError):
+        registry.run_tool("const", "")
+    assert registry.run_tool("const", "", snapshot=snapshot) == "old"
+
+
+def test_agent_close_unsubscribes_from_registry():
+    from agent.core import EnhancedChatAgent
+    from llm.mock_provider import MockLLM
+
+    registry = ToolRegistry(default_timeout=None)
+    agent = EnhancedChatAgent(MockLLM(), tools=registry)
+    assert len(registry._listeners) == 1
+
+    agent.close()
+    agent.close()
+    assert registry._listeners == []
+    registry.register(_Constant("const", "x"))
+    assert "const" not in agent.tools
+
+
+def test_find_tools_does_not_materialize_builtin_tools():
+    registry = ToolRegistry()
+    for name in ("Calculator", "Weather", "DateTime", "WebSearch"):
+        registry.register_builtin(name)
+
+    assert [t.name for t in registry.find_tools(pure=True)] == ["Calculator", "WebSearch"]
+    assert registry.get_metadata("DateTime").pure is False
+    assert all(loaded is None for loaded in registry.get_lazy_stats().values())
+
+
+def test_materialize_with_new_description_publishes_snapshot():
+    registry = ToolRegistry(default_timeout=None)
+    seen = []
+    registry.subscribe(lambda snapshot: seen.append(snapshot))
+    lazy = registry.register_lazy("const", "placeholder", lambda: _Constant("const", "x"))
+    version = registry.version
+
+    registry.get_tool("const")
+
+    assert registry.version == version + 1
+    assert seen[-1].get("const") is lazy
+    assert lazy.description == "returns a constant"
+
+
+def test_metadata_defaults_are_conservative():
+    metadata = _Constant("const", "x").metadata
+    assert (metadata.pure, metadata.idempotent, metadata.side_effects) == (False, False, True)
+    assert [ToolMetadata(expected_latency=t).latency_class for t in (0.001, 0.5, 2.0)] == \
+        ["instant", "fast", "slow"]
+    assert ToolMetadata(expected_latency=0.5).to_dict()["latency_class"] == "fast"
+
+
+def test_find_tools_by_criteria_and_predicate():
+    class _Fast(_Constant):
+        metadata = ToolMetadata(expected_latency=0.001, pure=True, idempotent=True, side_effects=False)
+
+    class _Slow(_Constant):
+        metadata = ToolMetadata(expected_latency=5.0, cost_per_call=0.01)
+
+    registry = ToolRegistry()
+    for tool in (_Fast("fast", "x"), _Slow("slow", "y"), _Constant("plain", "z")):
+        registry.register(tool)
+
+    assert [t.name for t in registry.find_tools(pure=True)] == ["fast"]
+    assert [t.name for t in registry.find_tools(side_effects=True, latency_class="slow")] == ["slow", "plain"]
+    assert [t.name for t in registry.find_tools(lambda m: m.cost_per_call > 0)] == ["slow"]
+    assert registry.get_metadata("fast").latency_class == "instant"
+    assert registry.get_metadata("missing") is None
+
+
+def test_lazy_tool_loads_once_on_first_run():
+    registry = ToolRegistry(default_timeout=None)
+    built = []
+
+    def factory(value):
+        built.append(value)
+        return _Constant("const", value)
+
+    registry.register_lazy("const", "returns a constant", factory, "x")
+    assert built == []
+    assert "- const: returns a constant" in registry.get_tools_description()
+    assert registry.get_lazy_stats() == {"const": None}
+
+    threads = [threading.Thread(target=registry.run_tool, args=("const", "")) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert built == ["x"]
+    assert registry.get_lazy_stats()["const"] >= 0
+
+
+def test_builtin_registration_does_not_import_tool_modules():
+    code = (
+        "import sys\n"
+        "from tools.registry import ToolRegistry\n"
+        "registry = ToolRegistry()\n"
+        "registry.register_builtin('DateTime')\n"
+        "registry.get_tools_description(); registry.find_tools(pure=True)\n"
+        "assert 'tools.datetime_tool' not in sys.modules\n"
+        "assert registry.run_tool('DateTime', 'today')\n"
+        "assert 'tools.datetime_tool' in sys.modules\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "-c", code], cwd=root, check=True, timeout=60)
+
+
+@pytest.mark.parametrize("name", sorted(BUILTIN_TOOLS))
+def test_catalog_matches_tool_classes(name):
+    spec = BUILTIN_TOOLS[name]
+    tool_class = import_from_path(spec.factory)
+    assert tool_class.metadata is spec.metadata
+    assert tool_class.cache_policy is spec.cache_policy
+
+
+class _Chunks(BaseTool):
+    """逐块产出结果，记录产出了多少块、生成器是否被关闭"""
+
+    cache_policy = CACHE_FOREVER
+
+    def __init__(self, n=10):
+        super().__init__(name="chunks", description="streams chunks")
+        self.n = n
+        self.produced = 0
+        self.closed = False
+
+    def run(self, query):
+        return "".join(self.run_stream(query))
+
+    def run_stream(self, query):
+        try:
+            for i in range(self.n):
+                self.produced += 1
+                yield f"{i:02d}|"
+        finally:
+            self.closed = True
+
+
+def test_streaming_stops_at_observation_budget():
+    registry = ToolRegistry(default_timeout=None)
+    tool = _Chunks()
+    registry.register(tool)
+
+    assert registry.run_tool("chunks", "q", max_chars=8) == "00|01|02" + TRUNCATION_NOTICE
+    assert tool.produced == 3 and tool.closed
+    # 截断的结果不写入缓存
+    assert len(registry.cache) == 0
+
+    assert registry.run_tool("chunks", "q") == "".join(f"{i:02d}|" for i in range(10))
+    assert registry.run_tool("chunks", "q", max_chars=5) == "00|01" + TRUNCATION_NOTICE
+    assert tool.produced == 13  # 第二次截断来自缓存的完整结果
+
+
+def test_non_streaming_tool_is_truncated_after_run():
+    registry = ToolRegistry(default_timeout=None)
+    registry.register(_Constant("const", "x" * 20))
+    assert not registry.get_tool("const").supports_streaming
+    assert registry.run_tool("const", "", max_chars=5) == "xxxxx" + TRUNCATION_NOTICE
+    assert registry.run_tool("const", "", max_chars=50) == "x" * 20
+
+
+def test_search_stream_stops_reading_after_budget(tmp_path):
+    from tools.search import SearchTool
+
+    for i in range(3):
+        (tmp_path / f"doc{i}.txt").write_text("agent line\n" * 3, encoding="utf-8")
+    tool = SearchTool(str(tmp_path))
+    assert tool.supports_streaming
+    assert tool.run("agent").count("\n") == SearchTool.MAX_RESULTS - 1
+
+    stream = tool.run_stream("agent")
+    first = next(stream)
+    stream.close()
+    assert first.startswith("[doc") and first.endswith("agent line")
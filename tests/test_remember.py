@@ -0,0 +1,30 @@
+import threading
+import time
+
+from agent.memory import Memory
+from tools.registry import ToolRegistry
+
+
+class _SlowMemory(Memory):
+    def add_fact(self, fact):
+        time.sleep(0.05)
+        super().add_fact(fact)
+
+
+def test_concurrent_remember_calls_all_succeed(tmp_path):
+    memory = _SlowMemory(str(tmp_path / "memory.json"))
+    registry = ToolRegistry()
+    registry.register_builtin("Remember", memory)
+    results = []
+
+    def remember(i):
+        results.append(registry.run_tool("Remember", f"fact: item {i}"))
+
+    threads = [threading.Thread(target=remember, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(results) == [f"Saved fact: item {i}" for i in range(4)]
+    assert sorted(memory.data["facts"]) == [f"item {i}" for i in range(4)]
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+from llm.base import BaseLLM
+from llm.replay import RecordingLLM, ReplayLLM
+
+
+class _EchoLLM(BaseLLM):
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def generate(self, messages, stop=None):
+        time.sleep(self.delay)
+        return "echo: " + messages[-1]["content"]
+
+
+def _messages(text):
+    return [{"role": "user", "content": text}]
+
+
+@pytest.mark.parametrize("suffix", [".jsonl", ".jsonl.gz"])
+def test_record_then_replay(tmp_path, suffix):
+    path = str(tmp_path / f"session{suffix}")
+    recorder = RecordingLLM(_EchoLLM(), path)
+    recorder.generate(_messages("a"))
+    recorder.generate(_messages("b"))
+    recorder.close()
+
+    replay = ReplayLLM(path)
+    assert replay.generate(_messages("b")) == "echo: b"
+    assert replay.generate(_messages("a")) == "echo: a"
+    assert replay.get_stats()["hits"] == 2
+
+
+def test_recorder_keeps_one_handle_and_flushes(tmp_path, monkeypatch):
+    import llm.replay as replay_module
+
+    opened = []
+    real_open = replay_module._open_log
+    monkeypatch.setattr(replay_module, "_open_log", lambda *a: opened.append(a) or real_open(*a))
+    path = str(tmp_path / "session.jsonl")
+    recorder = RecordingLLM(_EchoLLM(), path)
+    for text in "abc":
+        recorder.generate(_messages(text))
+
+    assert len(opened) == 1
+    assert len(open(path, encoding="utf-8").readlines()) == 3  # 每条记录写入后已 flush
+    recorder.close()
+    recorder.close()
+
+
+def test_latency_scale_shortens_replay(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    recorder = RecordingLLM(_EchoLLM(delay=0.3), path)
+    recorder.generate(_messages("a"))
+    recorder.close()
+
+    replay = ReplayLLM(path, latency_mode="recorded", latency_scale=0.1)
+    start = time.perf_counter()
+    replay.generate(_messages("a"))
+    assert 0.025 < time.perf_counter() - start < 0.15
+
+
+def _record(path, texts, llm=None):
+    recorder = RecordingLLM(llm or _EchoLLM(), path)
+    for text in texts:
+        recorder.generate(_messages(text))
+    recorder.close()
+
+
+def test_repeated_request_replays_in_order_then_repeats_last(tmp_path):
+    class _Counter(BaseLLM):
+        calls = 0
+
+        def generate(self, messages, stop=None):
+            self.calls += 1
+            return f"reply {self.calls}"
+
+    path = str(tmp_path / "session.jsonl")
+    _record(path, ["a", "a"], llm=_Counter())
+
+    replay = ReplayLLM(path)
+    assert [replay.generate(_messages("a")) for _ in range(3)] == ["reply 1", "reply 2", "reply 2"]
+
+
+def test_sequential_mode_ignores_request(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    _record(path, ["a", "b"])
+
+    replay = ReplayLLM(path, match="sequential")
+    assert replay.generate(_messages("x")) == "echo: a"
+    assert replay.generate(_messages("y")) == "echo: b"
+    with pytest.raises(KeyError):
+        replay.generate(_messages("z"))
+
+
+def test_miss_uses_fallback(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    _record(path, ["a"])
+
+    with pytest.raises(KeyError):
+        ReplayLLM(path).generate(_messages("b"))
+
+    replay = ReplayLLM(path, fallback=_EchoLLM())
+    assert replay.generate(_messages("b")) == "echo: b"
+    assert replay.get_stats()["misses"] == 1
+
+
+def test_stop_sequences_are_part_of_the_key(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    recorder = RecordingLLM(_EchoLLM(), path)
+    recorder.generate(_messages("a"), stop=["\n"])
+    recorder.close()
+
+    replay = ReplayLLM(path)
+    assert replay.generate(_messages("a"), stop=["\n"]) == "echo: a"
+    with pytest.raises(KeyError):
+        replay.generate(_messages("a"))
+
+
+def test_sampled_latency_is_reproducible(tmp_path):
+    path = str(tmp_path / "session.jsonl")
+    _record(path, ["a", "b", "c"])
+
+    first = ReplayLLM(path, latency_mode="sampled", seed=7)
+    second = ReplayLLM(path, latency_mode="sampled", seed=7)
+    records = first._records
+    assert [first._delay(r) for r in records] == [second._delay(r) for r in records]
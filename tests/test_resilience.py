@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from tools.base import BaseTool, ToolMetadata
+from tools.mcp_client import MCPTool
+from tools.mcp_transport import MCPConnectionError
+from tools.registry import ToolRegistry
+from tools.resilience import _WORKERS, CircuitBreaker, CircuitOpenError, ToolGuard
+
+
+class _DeadServerClient:
+    def call_tool(self, tool_name, arguments):
+        raise MCPConnectionError("MCP 服务器 dead 已退出")
+
+
+class _Fast(BaseTool):
+    metadata = ToolMetadata(expected_latency=0.001, pure=True, side_effects=False)
+
+    def __init__(self):
+        super().__init__(name="fast", description="fast")
+
+    def run(self, query):
+        return query
+
+
+def test_error_results_open_the_breaker():
+    registry = ToolRegistry(failure_threshold=2, default_timeout=None)
+    registry.register(MCPTool("dead_echo", "echo", _DeadServerClient(), "echo"))
+    for _ in range(2):
+        assert registry.run_tool("dead_echo", "hi").startswith("MCP 工具调用失败")
+    with pytest.raises(CircuitOpenError):
+        registry.run_tool("dead_echo", "hi")
+
+
+def test_fast_tools_run_inline():
+    registry = ToolRegistry(default_timeout=30)
+    registry.register(_Fast())
+    assert registry.run_tool("fast", "x") == "x"
+    assert registry.get_guard_stats()["fast"]["timeout"] is None
+
+
+def test_timed_calls_reuse_worker_threads():
+    guard = ToolGuard("slowish", timeout=1.0)
+    before = _WORKERS.threads_started
+    for i in range(20):
+        assert guard.call(lambda v: v, i) == i
+    assert _WORKERS.threads_started - before <= 2
+
+
+def test_interrupted_probe_releases_half_open_slot():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    guard = ToolGuard("probe", timeout=None, breaker=breaker)
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        guard.call(interrupted)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert guard.call(lambda: "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
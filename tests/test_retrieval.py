@@ -0,0 +1,105 @@
+import threading
+
+from agent.retrieval import KeywordIndex, ToolSelector, tokenize
+from tools.base import BaseTool
+
+
+class _Tool(BaseTool):
+    def __init__(self, name, description):
+        super().__init__(name=name, description=description)
+
+    def run(self, query):
+        return ""
+
+
+def _tools(prefix, n=30):
+    return [_Tool(f"{prefix}{i}", f"tool number {i} for weather and maths") for i in range(n)]
+
+
+def test_select_during_concurrent_reindex():
+    selector = ToolSelector(top_k=3)
+    selector.index_tools(_tools("a"), version=1)
+    errors = []
+    stop = threading.Event()
+
+    def reindex():
+        version = 2
+        while not stop.is_set():
+            selector.index_tools(_tools("b" if version % 2 else "a"), version=version)
+            version += 1
+
+    def select():
+        try:
+            for _ in range(300):
+                selected = selector.select("weather maths")
+                assert len(selected) == 3
+                assert len({t.name[0] for t in selected}) == 1  # 不会混用新旧索引
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+
+    writer = threading.Thread(target=reindex)
+    readers = [threading.Thread(target=select) for _ in range(4)]
+    writer.start()
+    for t in readers:
+        t.start()
+    for t in readers:
+        t.join()
+    stop.set()
+    writer.join()
+
+    assert errors == []
+    assert selector.get_stats()["selections"] == 1200
+
+
+CATALOG = [
+    _Tool("Weather", "查询指定城市的天气信息"),
+    _Tool("Calculator", "Evaluate math expressions such as sqrt(2) * pi"),
+    _Tool("Translator", "Translate text between languages"),
+    _Tool("DateTime", "Get the current date and time"),
+]
+
+
+def test_tokenize_splits_camel_case_and_cjk():
+    assert tokenize("WebSearch the docs") == ["web", "search", "docs"]
+    assert tokenize("天气") == ["天", "气", "天气"]
+
+
+def test_bm25_prefers_rarer_and_denser_matches():
+    index = KeywordIndex()
+    index.add("a", "python agent python")
+    index.add("b", "python tutorial for beginners and experts alike")
+    index.add("c", "agent planning")
+    assert [doc for doc, _ in index.search("python")] == ["a", "b"]
+
+    index.remove("a")
+    assert "a" not in index and len(index) == 2
+    assert index.search("python agent")[0][0] in ("b", "c")
+
+
+def test_selector_picks_relevant_tools_and_pins():
+    selector = ToolSelector(top_k=1, pinned=["DateTime"])
+    selector.index_tools(CATALOG, version=3)
+
+    assert [t.name for t in selector.select("北京天气怎么样")] == ["DateTime", "Weather"]
+    assert [t.name for t in selector.select("translate this text")] == ["DateTime", "Translator"]
+    # 没有相关工具时只暴露固定工具
+    assert [t.name for t in selector.select("xyzzy")] == ["DateTime"]
+    assert selector.indexed_version == 3
+
+
+def test_selector_reports_saved_prompt_tokens():
+    selector = ToolSelector(top_k=1)
+    selector.index_tools(CATALOG)
+    selector.select("sqrt")
+    stats = selector.get_stats()
+    assert 0 < stats["selected_tokens"] < stats["full_tokens"]
+    assert stats["saved_ratio"] > 0.5
+
+
+def test_vector_scores_can_rank_without_keyword_overlap():
+    def embed(texts):
+        return [[1.0, 0.0] if "Calculator" in t or "arithmetic" in t else [0.0, 1.0] for t in texts]
+
+    selector = ToolSelector(top_k=1, embed_fn=embed, min_score=0.1)
+    selector.index_tools(CATALOG)
+    assert [t.name for t in selector.select("arithmetic")] == ["Calculator"]
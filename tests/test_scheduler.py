@@ -0,0 +1,103 @@
+import threading
+import time
+
+from llm.base import BaseLLM
+from llm.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, LLMScheduler, TokenBucket
+from llm.tokens import estimate_tokens
+
+
+class _StreamingLLM(BaseLLM):
+    model = "stream-model"
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def generate(self, messages, stop=None):
+        return "".join(self.chunks)
+
+    def generate_stream(self, messages, stop=None):
+        yield from self.chunks
+
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def test_stream_reconciles_tpm_estimate():
+    scheduler = LLMScheduler(tpm=100000, expected_completion_tokens=5000)
+    llm = scheduler.wrap(_StreamingLLM(["hello ", "world"]))
+    estimated = scheduler.estimate_request_tokens(MESSAGES)
+
+    assert "".join(llm.generate_stream(MESSAGES)) == "hello world"
+
+    actual = estimated - 5000 + estimate_tokens("hello world")
+    assert abs(scheduler.tpm_bucket.tokens - (100000 - actual)) < 50
+
+
+def test_abandoned_stream_is_reconciled():
+    scheduler = LLMScheduler(tpm=100000, expected_completion_tokens=5000)
+    stream = scheduler.wrap(_StreamingLLM(["a"] * 100)).generate_stream(MESSAGES)
+    next(stream)
+    stream.close()
+
+    # 预留的 5000 个生成 token 几乎全部退还
+    assert scheduler.tpm_bucket.tokens > 100000 - 100
+
+
+def test_scheduled_llm_forwards_model():
+    scheduler = LLMScheduler()
+    assert scheduler.wrap(_StreamingLLM([])).model == "stream-model"
+
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(capacity=10, refill_per_second=100)
+    bucket.consume(10)
+    assert bucket.wait_time(5) > 0
+    time.sleep(0.2)
+    assert bucket.wait_time(5) == 0
+    assert bucket.tokens == 10
+    # 超过容量的请求按容量计算，不会永远等待
+    assert bucket.wait_time(50) == 0
+
+
+def test_rpm_limit_delays_requests():
+    scheduler = LLMScheduler(rpm=600)
+    scheduler.rpm_bucket.tokens = 0
+    # 每秒补充 10 个令牌
+    assert scheduler.acquire() >= 0.08
+    assert scheduler.get_stats()["by_priority"][5]["requests"] == 1
+
+
+def test_tpm_limit_uses_request_tokens():
+    scheduler = LLMScheduler(tpm=6000)
+    assert scheduler.acquire(tokens=6000) < 0.05
+    # 每秒补充 100 个 token
+    assert scheduler.acquire(tokens=10) >= 0.08
+
+
+def test_interactive_requests_jump_the_queue():
+    scheduler = LLMScheduler(rpm=300)
+    scheduler.rpm_bucket.tokens = 0
+    order = []
+
+    def request(priority):
+        scheduler.acquire(priority)
+        order.append(priority)
+
+    background = threading.Thread(target=request, args=(PRIORITY_BACKGROUND,))
+    background.start()
+    while scheduler.get_stats()["queue_depth"] < 1:
+        time.sleep(0.001)
+    interactive = threading.Thread(target=request, args=(PRIORITY_INTERACTIVE,))
+    interactive.start()
+    background.join(5)
+    interactive.join(5)
+
+    assert order == [PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND]
+    assert scheduler.get_stats()["max_queue_depth"] == 2
+
+
+def test_usage_reconciles_tpm_estimate():
+    scheduler = LLMScheduler(tpm=100000, expected_completion_tokens=5000)
+    llm = scheduler.wrap(_StreamingLLM(["hello"]))
+    result = llm.generate_with_usage(MESSAGES)
+    assert abs(scheduler.tpm_bucket.tokens - (100000 - result.total_tokens)) < 50
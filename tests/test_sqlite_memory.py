@@ -0,0 +1,110 @@
+import sqlite3
+import threading
+
+import pytest
+
+from agent.sqlite_memory import SQLiteMemory
+
+
+def _has_fts5():
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+pytestmark = pytest.mark.skipif(not _has_fts5(), reason="SQLite 未编译 FTS5")
+
+
+@pytest.fixture
+def open_memory(tmp_path):
+    opened = []
+
+    def open_(user_id="alice", **kwargs):
+        memory = SQLiteMemory(str(tmp_path / "memory.db"), user_id=user_id, **kwargs)
+        opened.append(memory)
+        return memory
+
+    yield open_
+    for memory in opened:
+        memory.close()
+
+
+def test_writes_are_batched_and_read_back(open_memory):
+    memory = open_memory(batch_size=3, flush_interval=60)
+    memory.update_profile("name", "Alice")
+    memory.add_fact("lives in Berlin")
+    assert memory.dirty and memory.get_stats()["batches"] == 0
+
+    memory.add_preference("likes python")
+    assert not memory.dirty and memory.get_stats()["batches"] == 1
+
+    memory.add_fact("has a dog named Rex")
+    # 读取前先提交缓冲区
+    assert memory.data == {
+        "profile": {"name": "Alice"},
+        "preferences": ["likes python"],
+        "facts": ["lives in Berlin", "has a dog named Rex"],
+    }
+
+
+def test_users_share_the_database_but_not_memories(open_memory):
+    alice, bob = open_memory("alice"), open_memory("bob")
+    alice.add_fact("lives in Berlin")
+    bob.add_fact("lives in Paris")
+    alice.flush()
+    bob.flush()
+
+    assert alice.data["facts"] == ["lives in Berlin"]
+    assert [text for text, _ in bob.search("lives")] == ["lives in Paris"]
+
+
+def test_duplicates_from_concurrent_writers_are_stored_once(open_memory):
+    writers = [open_memory(batch_size=1) for _ in range(4)]
+    threads = [threading.Thread(target=w.add_fact, args=("allergic to peanuts",)) for w in writers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    reader = open_memory()
+    assert reader.data["facts"] == ["allergic to peanuts"]
+
+
+def test_context_uses_fts_ranking_within_budget(open_memory):
+    memory = open_memory()
+    memory.update_profile("name", "Alice")
+    for fact in ("works as a data engineer in Berlin", "has a dog named Rex", "is training for a marathon"):
+        memory.add_fact(fact)
+    memory.add_preference("喜欢喝绿茶")
+
+    context = memory.get_context("what breed is my dog", top_k=1)
+    assert context == "User Profile: [name: Alice]\nKnown Facts: [has a dog named Rex]"
+    assert memory.search("绿茶", k=1)[0][0] == "喜欢喝绿茶"
+
+    memory.get_context("dog marathon Berlin", token_budget=8)
+    stats = memory.get_stats()
+    assert stats["context_calls"] == 2 and stats["saved_tokens"] > 0
+
+
+def test_profile_overwrite_and_reopen(open_memory):
+    memory = open_memory()
+    memory.update_profile("city", "Berlin")
+    memory.update_profile("city", "Paris")
+    memory.close()
+
+    assert open_memory().data["profile"] == {"city": "Paris"}
+
+
+def test_replace_entries_checks_what_was_read(open_memory):
+    memory = open_memory()
+    memory.add_fact("likes tea")
+    memory.add_fact("likes green tea")
+    old = memory.data["facts"]
+    memory.add_fact("has a cat")
+
+    assert memory.replace_entries("facts", old, ["likes green tea"])
+    assert memory.data["facts"] == ["likes green tea", "has a cat"]
+    assert [text for text, _ in memory.search("tea")] == ["likes green tea"]
+    assert not memory.replace_entries("facts", old, ["likes tea"])
@@ -0,0 +1,91 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from llm.stub_server import LatencyDistribution, StubServer
+
+
+@pytest.fixture
+def stub_factory():
+    servers = []
+
+    def start(**kwargs):
+        kwargs.setdefault("responses", ["hello world"])
+        server = StubServer(port=0, **kwargs)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def _post(server, **body):
+    body.setdefault("messages", [{"role": "user", "content": "hi"}])
+    request = urllib.request.Request(
+        f"{server.base_url}/chat/completions",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    return urllib.request.urlopen(request, timeout=5)
+
+
+def test_models_endpoint(stub_factory):
+    server = stub_factory()
+    with urllib.request.urlopen(f"{server.base_url}/models", timeout=5) as response:
+        assert json.load(response)["data"][0]["id"] == "stub"
+
+
+def test_completion_cycles_scripted_replies_and_applies_stop(stub_factory):
+    server = stub_factory(responses=["first. Observation: x", "second"])
+    with _post(server, model="m", stop=["Observation:"]) as response:
+        payload = json.load(response)
+    assert payload["model"] == "m"
+    assert payload["choices"][0]["message"]["content"] == "first. "
+    assert payload["usage"]["total_tokens"] > 0
+
+    with _post(server) as response:
+        assert json.load(response)["choices"][0]["message"]["content"] == "second"
+
+
+def test_streaming_sends_chunks_and_usage(stub_factory):
+    server = stub_factory()
+    with _post(server, stream=True, stream_options={"include_usage": True}) as response:
+        events = [line[len(b"data: "):] for line in response.read().splitlines() if line.startswith(b"data: ")]
+
+    assert events[-1] == b"[DONE]"
+    chunks = [json.loads(e) for e in events[:-1]]
+    text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+    assert text == "hello world"
+    assert chunks[-1]["usage"]["completion_tokens"] > 0
+    assert server.stats["streamed"] == 1
+
+
+def test_injected_rate_limit(stub_factory):
+    server = stub_factory(error_429_rate=1.0)
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        _post(server)
+    assert excinfo.value.code == 429
+    assert excinfo.value.headers["Retry-After"] == "1"
+    assert server.stats["429"] == 1
+
+
+def test_rejects_stream_options_when_configured(stub_factory):
+    server = stub_factory(reject_stream_options=True)
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        _post(server, stream=True, stream_options={"include_usage": True})
+    assert excinfo.value.code == 400
+
+
+def test_latency_distributions():
+    assert LatencyDistribution("fixed:0.2").sample() == 0.2
+    samples = [LatencyDistribution("uniform:0.1,0.5", seed=1).sample() for _ in range(20)]
+    assert all(0.1 <= s <= 0.5 for s in samples)
+    assert LatencyDistribution("normal:0,1", seed=1).sample() >= 0
+    assert LatencyDistribution("lognormal:0.3,0.5", seed=3).sample() == \
+        LatencyDistribution("lognormal:0.3,0.5", seed=3).sample()
+    with pytest.raises(ValueError):
+        LatencyDistribution("pareto:1")
@@ -5,21 +5,45 @@ Tools Package - 所有可用工具的集合
 - 基础工具类 (BaseTool)
 - 工具注册器 (ToolRegistry)
 - 各种具体工具实现
+
+具体工具按需导入（PEP 562 模块级 __getattr__），
+`import tools` 不会加载 pytz 等只有个别工具才需要的依赖。
 """
 
+import importlib
+
 from .base import BaseTool
 from .registry import ToolRegistry, global_registry, register_tool
 
-# 导入所有工具
-from .search import SearchTool
-from .remember import RememberTool
-from .image_gen import ImageGenTool
-from .deep_research import DeepResearchTool
-from .calculator import CalculatorTool
-from .weather import WeatherTool, WeatherAPITool
-from .translator import TranslatorTool, LLMTranslatorTool
-from .datetime_tool import DateTimeTool
-from .web_search import WebSearchTool, DuckDuckGoSearchTool
+# 工具名称 -> 所在模块，首次访问时才导入
+_LAZY_TOOLS = {
+    'SearchTool': '.search',
+    'RememberTool': '.remember',
+    'ImageGenTool': '.image_gen',
+    'DeepResearchTool': '.deep_research',
+    'CalculatorTool': '.calculator',
+    'WeatherTool': '.weather',
+    'WeatherAPITool': '.weather',
+    'TranslatorTool': '.translator',
+    'LLMTranslatorTool': '.translator',
+    'DateTimeTool': '.datetime_tool',
+    'WebSearchTool': '.web_search',
+    'DuckDuckGoSearchTool': '.web_search',
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_TOOLS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_TOOLS))
+
 
 __all__ = [
     # 基础类
@@ -42,4 +66,3 @@ __all__ = [
     'WebSearchTool',
     'DuckDuckGoSearchTool',
 ]
-
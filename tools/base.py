@@ -1,6 +1,80 @@
 from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, Optional
+from .cache import CachePolicy, NO_CACHE
+
+
+class ToolMetadata:
+    """
+    工具元数据 - 描述工具的性能和安全属性，供调度、缓存、预取等模块做决策
+    
+    参数:
+        expected_latency: 预期单次执行耗时（秒）
+        pure: 是否为纯函数（相同输入总是得到相同输出，且无副作用）
+        idempotent: 重复执行是否安全（结果可能不同，但不会产生额外影响）
+        side_effects: 是否会修改外部状态（写文件、写记忆、调用付费服务等）
+        max_concurrency: 同时执行的最大数量（None 表示不限制）
+        output_size_hint: 预期输出的字符数
+        cost_per_call: 单次调用的估算成本（美元）
+        timeout: 硬超时（秒），None 表示使用注册器的默认超时
+    
+    默认值是保守的：未知工具视为非纯、非幂等、有副作用。
+    """
+    
+    INSTANT_THRESHOLD = 0.01
+    FAST_THRESHOLD = 1.0
+    
+    def __init__(
+        self,
+        expected_latency: float = 1.0,
+        pure: bool = False,
+        idempotent: bool = False,
+        side_effects: bool = True,
+        max_concurrency: Optional[int] = None,
+        output_size_hint: int = 1000,
+        cost_per_call: float = 0.0,
+        timeout: Optional[float] = None
+    ):
+        self.expected_latency = expected_latency
+        self.pure = pure
+        self.idempotent = idempotent
+        self.side_effects = side_effects
+        self.max_concurrency = max_concurrency
+        self.output_size_hint = output_size_hint
+        self.cost_per_call = cost_per_call
+        self.timeout = timeout
+    
+    @property
+    def latency_class(self) -> str:
+        """延迟等级: instant / fast / slow"""
+        if self.expected_latency < self.INSTANT_THRESHOLD:
+            return "instant"
+        if self.expected_latency < self.FAST_THRESHOLD:
+            return "fast"
+        return "slow"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "expected_latency": self.expected_latency,
+            "latency_class": self.latency_class,
+            "pure": self.pure,
+            "idempotent": self.idempotent,
+            "side_effects": self.side_effects,
+            "max_concurrency": self.max_concurrency,
+            "output_size_hint": self.output_size_hint,
+            "cost_per_call": self.cost_per_call,
+            "timeout": self.timeout,
+        }
+    
+    def __repr__(self) -> str:
+        return f"ToolMetadata({self.to_dict()})"
+
 
 class BaseTool(ABC):
+    # 缓存策略：默认不缓存，纯函数或变化缓慢的工具应在子类中声明
+    cache_policy: CachePolicy = NO_CACHE
+    # 性能与安全属性：子类应按实际情况声明
+    metadata: ToolMetadata = ToolMetadata()
+
     def __init__(self, name: str, description: str):
         self.name = name
         self.description = description
@@ -8,3 +82,34 @@ class BaseTool(ABC):
     @abstractmethod
     def run(self, query: str) -> str:
         pass
+
+    def run_stream(self, query: str) -> Iterator[str]:
+        """
+        流式执行：逐块产出结果，拼接后等于 run() 的完整输出
+
+        调用方可以在拿到足够内容后 close() 生成器，提前结束剩余工作。
+        默认实现一次性产出 run() 的结果；输出较大或分步执行的工具应重写该方法。
+        """
+        yield self.run(query)
+
+    @property
+    def supports_streaming(self) -> bool:
+        """是否真正实现了流式输出（重写了 run_stream）"""
+        return type(self).run_stream is not BaseTool.run_stream
+
+    def normalize_query(self, query: str) -> str:
+        """规范化参数，作为缓存键（默认去掉首尾空白并合并连续空白）"""
+        return " ".join(query.split())
+
+    def is_cacheable(self, result: str) -> bool:
+        """判断结果是否可以缓存（例如临时性错误不应缓存）"""
+        return True
+
+    def is_error(self, result: str) -> bool:
+        """
+        判断返回的结果是否表示工具自身故障（依赖的服务不可用、网络错误等）
+
+        自己捕获异常并返回错误文本的工具应重写该方法，熔断器才能把这些调用计为失败。
+        参数错误等调用方的问题不算故障。
+        """
+        return False
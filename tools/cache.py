@@ -0,0 +1,133 @@
+"""
+工具结果缓存
+
+- CachePolicy: 每个工具声明自己的缓存策略（永久 / 定时过期 / 不缓存）
+- ToolResultCache: 所有工具共享的有界 LRU 缓存，按 (工具名, 规范化参数) 作为键，并统计每个工具的命中率
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class CachePolicy:
+    """
+    缓存策略
+
+    参数:
+        ttl: 过期时间（秒）。None 表示永不过期，0 表示不缓存
+    """
+
+    def __init__(self, ttl: Optional[float] = 0):
+        self.ttl = ttl
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl is None or self.ttl > 0
+
+    def expires_at(self, now: float) -> Optional[float]:
+        return None if self.ttl is None else now + self.ttl
+
+    def __repr__(self) -> str:
+        if self.ttl is None:
+            return "CachePolicy(forever)"
+        if self.ttl == 0:
+            return "CachePolicy(never)"
+        return f"CachePolicy(ttl={self.ttl}s)"
+
+
+# 常用策略
+NO_CACHE = CachePolicy(ttl=0)
+CACHE_FOREVER = CachePolicy(ttl=None)
+
+
+class ToolResultCache:
+    """
+    有界 LRU 工具结果缓存（线程安全）
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        参数:
+            max_entries: 最大缓存条目数，超出后淘汰最久未使用的条目
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _tool_stats(self, tool_name: str) -> Dict[str, int]:
+        return self._stats.setdefault(
+            tool_name, {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        )
+
+    def get(self, tool_name: str, key: str) -> Optional[str]:
+        """查找缓存，未命中或已过期时返回 None"""
+        with self._lock:
+            stats = self._tool_stats(tool_name)
+            entry = self._entries.get((tool_name, key))
+            if entry is None:
+                stats["misses"] += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[(tool_name, key)]
+                stats["expired"] += 1
+                stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end((tool_name, key))
+            stats["hits"] += 1
+            return value
+
+    def put(self, tool_name: str, key: str, value: str, policy: CachePolicy) -> None:
+        """写入缓存"""
+        if not policy.enabled or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(tool_name, key)] = (value, policy.expires_at(time.monotonic()))
+            self._entries.move_to_end((tool_name, key))
+            while len(self._entries) > self.max_entries:
+                (evicted_tool, _), _ = self._entries.popitem(last=False)
+                self._tool_stats(evicted_tool)["evictions"] += 1
+
+    def invalidate(self, tool_name: Optional[str] = None) -> int:
+        """
+        清除缓存
+
+        参数:
+            tool_name: 只清除该工具的缓存；为 None 时清除全部
+
+        返回:
+            清除的条目数
+        """
+        with self._lock:
+            if tool_name is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+            keys = [k for k in self._entries if k[0] == tool_name]
+            for k in keys:
+                del self._entries[k]
+            return len(keys)
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        获取每个工具的缓存统计
+
+        返回:
+            {工具名: {hits, misses, expired, evictions, hit_rate}}
+        """
+        with self._lock:
+            result = {}
+            for tool_name, stats in self._stats.items():
+                entry = dict(stats)
+                lookups = stats["hits"] + stats["misses"]
+                entry["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+                result[tool_name] = entry
+            return result
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,59 +1,444 @@
 import ast
+import functools
+import json
+import math
 import operator
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Union
 from .base import BaseTool
+from .catalog import BUILTIN_TOOLS
 
-class CalculatorTool(BaseTool):
+# 允许的运算符
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.USub: operator.neg,  # 负号
+    ast.UAdd: operator.pos,
+}
+
+# 允许的数学函数: 名称 -> (标量实现, NumPy 实现的名称)
+FUNCTIONS = {
+    "sqrt": (math.sqrt, "sqrt"),
+    "exp": (math.exp, "exp"),
+    "log": (math.log, "log"),
+    "log10": (math.log10, "log10"),
+    "log2": (math.log2, "log2"),
+    "sin": (math.sin, "sin"),
+    "cos": (math.cos, "cos"),
+    "tan": (math.tan, "tan"),
+    "asin": (math.asin, "arcsin"),
+    "acos": (math.acos, "arccos"),
+    "atan": (math.atan, "arctan"),
+    "sinh": (math.sinh, "sinh"),
+    "cosh": (math.cosh, "cosh"),
+    "tanh": (math.tanh, "tanh"),
+    "abs": (abs, "abs"),
+    "floor": (math.floor, "floor"),
+    "ceil": (math.ceil, "ceil"),
+}
+
+# 数学常量
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+    "tau": math.tau,
+}
+
+# 允许出现在表达式中的 AST 节点类型
+ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name, ast.Load, ast.Call,
+) + tuple(OPERATORS.keys())
+
+LOG10_2 = math.log10(2)
+
+Number = Union[int, float]
+# 编译后的表达式: (变量绑定, 函数库) -> 结果
+CompiledExpr = Callable[[Mapping[str, Any], Mapping[str, Callable]], Any]
+
+SCALAR_LIB = {name: impl for name, (impl, _) in FUNCTIONS.items()}
+
+
+def _numpy_lib(np) -> Dict[str, Callable]:
+    lib = {name: getattr(np, np_name) for name, (_, np_name) in FUNCTIONS.items()}
+    # math.log(x, base) 的向量化版本
+    lib["log"] = lambda x, base=None: np.log(x) if base is None else np.log(x) / np.log(base)
+    return lib
+
+
+def _digits(value: Number) -> float:
+    """估算整数的十进制位数（浮点数有自己的溢出检查，返回 0）"""
+    if isinstance(value, int):
+        return value.bit_length() * LOG10_2
+    return 0.0
+
+
+class SafeEvaluator:
     """
-    计算器工具 - 执行数学计算
-    支持基本的四则运算、幂运算、括号等
+    有界的算术表达式求值引擎
+    
+    在计算前做静态和动态检查，病态表达式会快速失败而不是占满 CPU 和内存:
+    - 表达式长度、AST 深度和节点数限制
+    - 只允许数字常量（不允许字符串，避免 'a' * 10**9 这类内存炸弹）
+    - 乘法和幂运算在计算前估算结果位数，超过 max_digits 直接拒绝
+    
+    校验通过的 AST 会被编译成闭包并按表达式文本缓存，重复计算无需再解析。
+    同一个闭包既可以用标量（math）计算，也可以用 NumPy 数组批量计算。
     """
     
-    def __init__(self):
-        super().__init__(
-            name="Calculator",
-            description="执行数学计算。支持加减乘除、幂运算、括号等。例如: '2 + 2', '10 * (5 + 3)', '2 ** 8'"
-        )
-        
-        # 定义允许的运算符
-        self.operators = {
-            ast.Add: operator.add,
-            ast.Sub: operator.sub,
-            ast.Mult: operator.mul,
-            ast.Div: operator.truediv,
-            ast.FloorDiv: operator.floordiv,
-            ast.Mod: operator.mod,
-            ast.Pow: operator.pow,
-            ast.USub: operator.neg,  # 负号
+    def __init__(
+        self,
+        max_expression_length: int = 1000,
+        max_depth: int = 50,
+        max_nodes: int = 500,
+        max_digits: int = 4000,
+        compile_cache_size: int = 256
+    ):
+        """
+        参数:
+            max_expression_length: 表达式最大字符数
+            max_depth: AST 最大深度
+            max_nodes: AST 最大节点数
+            max_digits: 整数操作数和结果的最大十进制位数
+            compile_cache_size: 编译结果缓存的表达式数量
+        """
+        self.max_expression_length = max_expression_length
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_digits = max_digits
+        self.compile_cache_size = compile_cache_size
+        self._compile_cached = functools.lru_cache(maxsize=compile_cache_size)(self._compile)
+    
+    def limits(self) -> Dict[str, int]:
+        return {
+            "max_expression_length": self.max_expression_length,
+            "max_depth": self.max_depth,
+            "max_nodes": self.max_nodes,
+            "max_digits": self.max_digits,
         }
     
-    def _eval_expr(self, node):
-        """安全地评估 AST 节点"""
-        if isinstance(node, ast.Constant):  # Python 3.8+
-            return node.value
-        elif isinstance(node, ast.Num):  # Python 3.7-
-            return node.n
+    def parse(self, expression: str) -> ast.Expression:
+        """解析并校验表达式，返回 AST"""
+        if len(expression) > self.max_expression_length:
+            raise ValueError(f"表达式过长（超过 {self.max_expression_length} 个字符）")
+        
+        tree = ast.parse(expression, mode='eval')
+        
+        # 迭代遍历，避免校验本身递归过深
+        nodes = 0
+        stack = [(tree, 1)]
+        while stack:
+            node, depth = stack.pop()
+            nodes += 1
+            if nodes > self.max_nodes:
+                raise ValueError(f"表达式过于复杂（超过 {self.max_nodes} 个节点）")
+            if depth > self.max_depth:
+                raise ValueError(f"表达式嵌套过深（超过 {self.max_depth} 层）")
+            if not isinstance(node, ALLOWED_NODES):
+                raise ValueError(f"不支持的表达式类型: {type(node).__name__}")
+            if isinstance(node, ast.Constant):
+                if type(node.value) not in (int, float):
+                    raise ValueError(f"不支持的常量: {node.value!r}")
+                self._check_digits(node.value)
+            elif isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                    raise ValueError(f"不支持的函数: {ast.unparse(node.func)}")
+                if node.keywords:
+                    raise ValueError("函数调用不支持关键字参数")
+            stack.extend((child, depth + 1) for child in ast.iter_child_nodes(node))
+        
+        return tree
+    
+    def _check_value(self, name: str, value: Any) -> None:
+        """变量只能是数字（避免通过变量传入字符串等对象）"""
+        if type(value) not in (int, float):
+            raise ValueError(f"变量 {name} 的值必须是数字: {value!r}")
+        self._check_digits(value)
+    
+    def _check_digits(self, value: Number) -> None:
+        if isinstance(value, complex):
+            # 负数的小数次幂（如 (-8) ** 0.5）在 Python 中得到复数
+            raise ValueError("计算结果为复数，不支持（负数不能开非整数次幂）")
+        if _digits(value) > self.max_digits:
+            raise ValueError(f"数值过大（超过 {self.max_digits} 位）")
+    
+    def _check_binop(self, op_type: type, left: Number, right: Number) -> None:
+        """在计算前估算结果规模（只对 Python 整数有意义，数组和浮点数会溢出为 inf）"""
+        if op_type is ast.Mult:
+            if _digits(left) + _digits(right) > self.max_digits:
+                raise ValueError(f"计算结果过大（超过 {self.max_digits} 位）")
+        elif op_type is ast.Pow:
+            if isinstance(left, int) and isinstance(right, int) and right > 0 and abs(left) > 1:
+                estimated = right * math.log10(abs(left))
+                if estimated > self.max_digits:
+                    raise ValueError(f"计算结果过大（约 {estimated:.3g} 位，上限 {self.max_digits} 位）")
+    
+    def _compile_node(self, node: ast.AST) -> CompiledExpr:
+        """把已校验的 AST 节点编译成闭包"""
+        if isinstance(node, ast.Constant):
+            value = node.value
+            return lambda env, lib: value
+        
+        elif isinstance(node, ast.Name):
+            name = node.id
+            if name in CONSTANTS:
+                value = CONSTANTS[name]
+                return lambda env, lib: value
+            
+            def load(env, lib):
+                try:
+                    return env[name]
+                except KeyError:
+                    raise ValueError(f"未定义的变量: {name}")
+            return load
+        
         elif isinstance(node, ast.BinOp):
-            left = self._eval_expr(node.left)
-            right = self._eval_expr(node.right)
-            op = self.operators.get(type(node.op))
+            left = self._compile_node(node.left)
+            right = self._compile_node(node.right)
+            op_type = type(node.op)
+            op = OPERATORS.get(op_type)
             if op is None:
-                raise ValueError(f"不支持的运算符: {type(node.op).__name__}")
-            return op(left, right)
+                raise ValueError(f"不支持的运算符: {op_type.__name__}")
+            check_binop = self._check_binop
+            check_digits = self._check_digits
+            
+            if op_type in (ast.Mult, ast.Pow):
+                def guarded(env, lib):
+                    l, r = left(env, lib), right(env, lib)
+                    check_binop(op_type, l, r)
+                    result = op(l, r)
+                    check_digits(result)
+                    return result
+                return guarded
+            
+            def binop(env, lib):
+                result = op(left(env, lib), right(env, lib))
+                check_digits(result)
+                return result
+            return binop
+        
         elif isinstance(node, ast.UnaryOp):
-            operand = self._eval_expr(node.operand)
-            op = self.operators.get(type(node.op))
+            operand = self._compile_node(node.operand)
+            op = OPERATORS.get(type(node.op))
             if op is None:
                 raise ValueError(f"不支持的一元运算符: {type(node.op).__name__}")
-            return op(operand)
+            return lambda env, lib: op(operand(env, lib))
+        
+        elif isinstance(node, ast.Call):
+            fn_name = node.func.id
+            args = [self._compile_node(arg) for arg in node.args]
+            return lambda env, lib: lib[fn_name](*[arg(env, lib) for arg in args])
+        
         else:
             raise ValueError(f"不支持的表达式类型: {type(node).__name__}")
     
+    def _compile(self, expression: str) -> CompiledExpr:
+        return self._compile_node(self.parse(expression).body)
+    
+    def compile(self, expression: str) -> CompiledExpr:
+        """解析、校验并编译表达式（结果按表达式文本缓存）"""
+        return self._compile_cached(expression)
+    
+    def evaluate(self, expression: str, variables: Optional[Mapping[str, Number]] = None) -> Number:
+        """计算表达式"""
+        compiled = self.compile(expression)
+        variables = variables or {}
+        for name, value in variables.items():
+            self._check_value(name, value)
+        return compiled(variables, SCALAR_LIB)
+    
+    def evaluate_batch(
+        self,
+        expression: str,
+        columns: Mapping[str, Sequence[Number]],
+        use_numpy: bool = True
+    ) -> List[Number]:
+        """
+        对多组变量绑定批量计算同一个表达式
+        
+        参数:
+            expression: 表达式，如 "sqrt(x ** 2 + y ** 2)"
+            columns: 按列给出的变量值，如 {"x": [...], "y": [...]}，各列长度必须一致
+            use_numpy: 安装了 NumPy 时使用向量化计算（除零得到 inf/nan 而不是报错）
+        
+        返回:
+            每一行的计算结果
+        """
+        compiled = self.compile(expression)
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("各变量的取值个数必须一致")
+        rows = lengths.pop() if lengths else 1
+        
+        np = None
+        if use_numpy:
+            try:
+                import numpy as np
+            except ImportError:
+                np = None
+        
+        if np is not None:
+            env = {name: np.asarray(values, dtype=float) for name, values in columns.items()}
+            with np.errstate(all="ignore"):
+                result = compiled(env, _numpy_lib(np))
+            return np.broadcast_to(result, (rows,)).tolist()
+        
+        # 无 NumPy 时逐行计算，仍然复用同一个编译结果
+        for name, values in columns.items():
+            for value in values:
+                self._check_value(name, value)
+        names = list(columns.keys())
+        return [
+            compiled(dict(zip(names, row)), SCALAR_LIB)
+            for row in zip(*columns.values())
+        ] if names else [compiled({}, SCALAR_LIB)]
+    
+    def cache_info(self):
+        """编译缓存的命中统计"""
+        return self._compile_cached.cache_info()
+
+
+def _worker_evaluate(conn, expression: str, variables: Dict[str, Number], limits: Dict[str, int]) -> None:
+    """在子进程中计算表达式，并通过管道返回结果"""
+    try:
+        result = SafeEvaluator(**limits).evaluate(expression, variables)
+        conn.send(("ok", result))
+    except Exception as e:
+        conn.send(("error", type(e).__name__, str(e)))
+    finally:
+        conn.close()
+
+
+_EXCEPTION_TYPES = {
+    "ValueError": ValueError,
+    "ZeroDivisionError": ZeroDivisionError,
+    "OverflowError": OverflowError,
+    "SyntaxError": SyntaxError,
+}
+
+
+class CalculatorTool(BaseTool):
+    """
+    计算器工具 - 执行数学计算
+    支持四则运算、幂运算、括号、常用数学函数和变量，以及批量计算
+    
+    使用 SafeEvaluator 限制表达式复杂度；可选在子进程中计算并设置硬超时，
+    即使某个表达式逃过了静态检查，也不会拖垮服务其他用户的线程。
+    """
+    
+    cache_policy = BUILTIN_TOOLS["Calculator"].cache_policy
+    metadata = BUILTIN_TOOLS["Calculator"].metadata
+    
+    # 批量计算时在输出中最多展示的结果个数
+    MAX_DISPLAY_RESULTS = 20
+    
+    def __init__(
+        self,
+        max_digits: int = 4000,
+        max_depth: int = 50,
+        max_nodes: int = 500,
+        use_subprocess: bool = False,
+        timeout: float = 2.0
+    ):
+        """
+        参数:
+            max_digits: 整数操作数和结果的最大十进制位数
+            max_depth: AST 最大深度
+            max_nodes: AST 最大节点数
+            use_subprocess: 是否在子进程中计算（带硬超时）
+            timeout: 子进程计算的超时时间（秒）
+        """
+        super().__init__(
+            name="Calculator",
+            description=BUILTIN_TOOLS["Calculator"].description
+        )
+        
+        self.evaluator = SafeEvaluator(max_depth=max_depth, max_nodes=max_nodes, max_digits=max_digits)
+        self.use_subprocess = use_subprocess
+        self.timeout = timeout
+    
+    def _evaluate_in_subprocess(self, expression: str, variables: Dict[str, Number]) -> Any:
+        """在子进程中计算，超时后强制终止"""
+        # multiprocessing 导入较慢，只在启用子进程模式时加载
+        import multiprocessing
+        
+        parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=_worker_evaluate,
+            args=(child_conn, expression, variables, self.evaluator.limits()),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        
+        try:
+            if not parent_conn.poll(self.timeout):
+                raise TimeoutError(f"计算超时（超过 {self.timeout} 秒）")
+            message = parent_conn.recv()
+        finally:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+            parent_conn.close()
+        
+        if message[0] == "ok":
+            return message[1]
+        _, error_type, error_msg = message
+        raise _EXCEPTION_TYPES.get(error_type, RuntimeError)(error_msg)
+    
+    def evaluate(self, expression: str, variables: Optional[Dict[str, Number]] = None) -> Number:
+        """计算单个表达式（静态校验总在当前进程完成，快速拒绝明显的病态表达式）"""
+        self.evaluator.compile(expression)
+        if self.use_subprocess:
+            return self._evaluate_in_subprocess(expression, variables or {})
+        return self.evaluator.evaluate(expression, variables)
+    
+    def evaluate_batch(self, expression: str, columns: Mapping[str, Sequence[Number]]) -> List[Number]:
+        """对多组变量批量计算同一个表达式（有 NumPy 时向量化）"""
+        return self.evaluator.evaluate_batch(expression, columns)
+    
+    @staticmethod
+    def _format_number(value: Any) -> Any:
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+    
+    def _run_json(self, query: str) -> str:
+        """处理 JSON 格式的请求：带变量的单次计算或批量计算"""
+        request = json.loads(query)
+        expression = str(request.get("expression", "")).strip()
+        variables = request.get("variables") or {}
+        if not isinstance(variables, dict):
+            raise ValueError('variables 必须是对象，例如 {"x": 2} 或 {"x": [1, 2, 3]}')
+        for name, value in variables.items():
+            for item in (value if isinstance(value, list) else [value]):
+                self.evaluator._check_value(name, item)
+        
+        lengths = {len(v) for v in variables.values() if isinstance(v, list)}
+        if not lengths:
+            result = self._format_number(self.evaluate(expression, variables))
+            return f"计算结果: {self._canonical(expression)} = {result}"
+        if len(lengths) > 1:
+            raise ValueError(f"各变量的取值个数必须一致，得到: {sorted(lengths)}")
+        
+        # 标量变量广播到每一行
+        rows = lengths.pop()
+        columns = {k: v if isinstance(v, list) else [v] * rows for k, v in variables.items()}
+        results = [self._format_number(r) for r in self.evaluate_batch(expression, columns)]
+        shown = results[:self.MAX_DISPLAY_RESULTS]
+        suffix = f" ... (共 {len(results)} 个结果)" if len(results) > len(shown) else ""
+        return f"批量计算结果: {self._canonical(expression)} -> {shown}{suffix}"
+    
     def run(self, query: str) -> str:
         """
         执行数学计算
         
         参数:
-            query: 数学表达式字符串，如 "2 + 2" 或 "10 * (5 + 3)"
+            query: 数学表达式字符串，如 "2 + 2" 或 "10 * (5 + 3)"；
+                   或 JSON 请求 {"expression": ..., "variables": {...}}
         
         返回:
             计算结果的字符串表示
@@ -62,22 +447,59 @@ class CalculatorTool(BaseTool):
             # 清理输入
             query = query.strip()
             
-            # 使用 AST 安全解析表达式
-            tree = ast.parse(query, mode='eval')
-            result = self._eval_expr(tree.body)
+            if query.startswith("{"):
+                return self._run_json(query)
             
-            # 格式化输出
-            if isinstance(result, float) and result.is_integer():
-                result = int(result)
-            
-            return f"计算结果: {query} = {result}"
+            result = self._format_number(self.evaluate(query))
+            return f"计算结果: {self._canonical(query)} = {result}"
             
+        except json.JSONDecodeError:
+            return f"错误: 无效的 JSON 请求 '{query}'"
         except SyntaxError:
             return f"错误: 无效的数学表达式 '{query}'"
         except ZeroDivisionError:
             return "错误: 除数不能为零"
+        except OverflowError:
+            return "错误: 计算结果溢出"
+        except TimeoutError as e:
+            return f"错误: {str(e)}"
         except ValueError as e:
             return f"错误: {str(e)}"
         except Exception as e:
             return f"计算出错: {str(e)}"
+    
+    def _canonical(self, expression: str) -> str:
+        """
+        表达式的规范写法（由语法树还原），结果中回显的就是缓存键对应的写法
 
+        无法解析或过长的表达式原样返回
+        """
+        expression = expression.strip()
+        if len(expression) > self.evaluator.max_expression_length:
+            return expression
+        try:
+            return ast.unparse(ast.parse(expression, mode="eval"))
+        except (SyntaxError, ValueError, RecursionError):
+            return expression
+    
+    def normalize_query(self, query: str) -> str:
+        """
+        按解析后的表达式生成缓存键："2+2" 与 "2 + 2" 共用缓存，"1 0" 与 "10" 不会
+        
+        JSON 请求规范化其中的表达式并按键排序；无法解析的输入使用原文
+        """
+        query = query.strip()
+        if not query.startswith("{"):
+            return self._canonical(query)
+        try:
+            request = json.loads(query)
+        except json.JSONDecodeError:
+            return query
+        if not isinstance(request, dict):
+            return query
+        request = dict(request, expression=self._canonical(str(request.get("expression", ""))))
+        return json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    
+    def is_cacheable(self, result: str) -> bool:
+        """错误（包括偶发的子进程超时）不缓存"""
+        return not result.startswith(("错误", "计算出错"))
@@ -0,0 +1,176 @@
+"""
+内置工具目录 - 每个内置工具的名称、描述、元数据和缓存策略的唯一来源
+
+工具类从这里读取自己的描述、元数据和缓存策略；注册器延迟注册内置工具时
+(ToolRegistry.register_builtin) 也从这里读取。生成提示词、按元数据查询工具都不需要
+导入工具模块，也就不会加载 pytz、multiprocessing 等依赖。
+"""
+
+from typing import Dict
+from .base import ToolMetadata
+from .cache import CACHE_FOREVER, NO_CACHE, CachePolicy
+
+
+class ToolSpec:
+    """
+    一个内置工具的静态描述
+
+    参数:
+        name: 工具名称
+        factory: "module:Class" 形式的导入路径
+        description: 工具描述（用于提示词）
+        metadata: 性能与安全属性
+        cache_policy: 缓存策略
+    """
+
+    __slots__ = ("name", "factory", "description", "metadata", "cache_policy")
+
+    def __init__(
+        self,
+        name: str,
+        factory: str,
+        description: str,
+        metadata: ToolMetadata,
+        cache_policy: CachePolicy = NO_CACHE
+    ):
+        self.name = name
+        self.factory = factory
+        self.description = description
+        self.metadata = metadata
+        self.cache_policy = cache_policy
+
+    def __repr__(self) -> str:
+        return f"ToolSpec({self.name!r}, {self.factory!r})"
+
+
+_SPECS = [
+    ToolSpec(
+        "Search", "tools.search:SearchTool",
+        "在本地文档中搜索关键字。当你需要回答有关特定主题（如 Python 或 Agent）的问题时很有用。",
+        ToolMetadata(
+            expected_latency=0.01, pure=True, idempotent=True, side_effects=False,
+            output_size_hint=600
+        ),
+        # 本地文档很少变化，缓存 5 分钟
+        CachePolicy(ttl=300)
+    ),
+    ToolSpec(
+        "Remember", "tools.remember:RememberTool",
+        "Save important information about the user. Format: [category: content]. "
+        "Categories: profile, preference, fact. Example: [preference: likes python]",
+        # 写入记忆：重复保存同一条信息不会产生额外影响。不设并发上限：舱壁满时会直接拒绝，
+        # 写入就会丢失；Memory 自己加锁串行化写入，并发调用只是排队等待
+        ToolMetadata(
+            expected_latency=0.005, pure=False, idempotent=True, side_effects=True,
+            output_size_hint=100
+        ),
+        # 有副作用（写入记忆），不缓存
+        NO_CACHE
+    ),
+    ToolSpec(
+        "Calculator", "tools.calculator:CalculatorTool",
+        "执行数学计算。支持加减乘除、幂运算、括号和 sqrt/log/exp/sin/cos/tan 等函数。"
+        "例如: '2 + 2', '10 * (5 + 3)', 'sqrt(2) * pi'。"
+        "批量计算使用 JSON: {\"expression\": \"x * 2 + y\", \"variables\": {\"x\": [1, 2], \"y\": [3, 4]}}",
+        ToolMetadata(
+            expected_latency=0.001, pure=True, idempotent=True, side_effects=False,
+            output_size_hint=100
+        ),
+        # 纯函数，结果可以永久缓存
+        CACHE_FOREVER
+    ),
+    ToolSpec(
+        "Weather", "tools.weather:WeatherTool",
+        "查询指定城市的天气信息。输入城市名称，例如: '北京', 'Shanghai', 'New York'",
+        # 模拟数据是随机的，因此不是纯函数；但查询本身没有副作用
+        ToolMetadata(
+            expected_latency=0.001, pure=False, idempotent=True, side_effects=False,
+            output_size_hint=200
+        ),
+        # 天气变化较慢，缓存 10 分钟
+        CachePolicy(ttl=600)
+    ),
+    ToolSpec(
+        "WeatherAPI", "tools.weather:WeatherAPITool",
+        "使用真实天气API查询天气信息。输入城市名称。",
+        ToolMetadata(
+            expected_latency=0.8, pure=False, idempotent=True, side_effects=False,
+            max_concurrency=4, output_size_hint=300
+        ),
+        CachePolicy(ttl=600)
+    ),
+    ToolSpec(
+        "DateTime", "tools.datetime_tool:DateTimeTool",
+        "获取当前日期时间或进行时间计算。命令: 'now'(当前时间), 'today'(今天日期), "
+        "'timezone:Asia/Shanghai'(指定时区时间)",
+        ToolMetadata(
+            expected_latency=0.001, pure=False, idempotent=True, side_effects=False,
+            output_size_hint=200
+        ),
+        # 结果随时间变化，不缓存
+        NO_CACHE
+    ),
+    ToolSpec(
+        "Translator", "tools.translator:TranslatorTool",
+        "翻译文本。格式: '[源语言]->[目标语言] 文本内容'。例如: 'en->zh Hello World' 或 'zh->en 你好世界'",
+        ToolMetadata(
+            expected_latency=0.001, pure=True, idempotent=True, side_effects=False,
+            output_size_hint=300
+        ),
+        # 词典查找是纯函数
+        CACHE_FOREVER
+    ),
+    ToolSpec(
+        "LLMTranslator", "tools.translator:LLMTranslatorTool",
+        "使用 LLM 进行高质量翻译。格式同 Translator 工具。",
+        ToolMetadata(
+            expected_latency=2.0, pure=False, idempotent=True, side_effects=False,
+            max_concurrency=4, output_size_hint=500, cost_per_call=0.0005
+        ),
+        # 避免重复翻译相同内容消耗 token
+        CachePolicy(ttl=3600)
+    ),
+    ToolSpec(
+        "ImageGen", "tools.image_gen:ImageGenTool",
+        "Generate an image based on a text description. Use this when the user asks to draw, "
+        "generate, or create an image. Input: description of the image.",
+        # 真实的图像生成服务耗时长、按次计费，且每次生成新的图片
+        ToolMetadata(
+            expected_latency=10.0, pure=False, idempotent=False, side_effects=True,
+            max_concurrency=2, output_size_hint=200, cost_per_call=0.04, timeout=60.0
+        )
+    ),
+    ToolSpec(
+        "DeepResearch", "tools.deep_research:DeepResearchTool",
+        "Perform a deep research on a complex topic. It automatically breaks down the topic into "
+        "sub-questions, searches for each, and summarizes the findings. Use this for broad or complex queries.",
+        ToolMetadata(
+            expected_latency=3.0, pure=False, idempotent=True, side_effects=False,
+            max_concurrency=2, output_size_hint=3000, timeout=60.0
+        ),
+        # 研究报告代价高，相同主题缓存 30 分钟
+        CachePolicy(ttl=1800)
+    ),
+    ToolSpec(
+        "WebSearch", "tools.web_search:WebSearchTool",
+        "在互联网上搜索信息。输入搜索关键词，返回相关结果。",
+        ToolMetadata(
+            expected_latency=0.001, pure=True, idempotent=True, side_effects=False,
+            output_size_hint=600
+        ),
+        CachePolicy(ttl=3600)
+    ),
+    ToolSpec(
+        "DuckDuckGoSearch", "tools.web_search:DuckDuckGoSearchTool",
+        "使用 DuckDuckGo 搜索互联网信息（免费，无需 API Key）",
+        # 真实网络请求，限制并发以免被 DuckDuckGo 限流
+        ToolMetadata(
+            expected_latency=1.5, pure=False, idempotent=True, side_effects=False,
+            max_concurrency=2, output_size_hint=1500, timeout=15.0
+        ),
+        # 网络搜索结果缓存 30 分钟
+        CachePolicy(ttl=1800)
+    ),
+]
+
+BUILTIN_TOOLS: Dict[str, ToolSpec] = {spec.name: spec for spec in _SPECS}
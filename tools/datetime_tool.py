@@ -1,16 +1,20 @@
 from datetime import datetime, timedelta
 import pytz
 from .base import BaseTool
+from .catalog import BUILTIN_TOOLS
 
 class DateTimeTool(BaseTool):
     """
     日期时间工具 - 获取当前时间、日期，进行时间计算
     """
     
+    cache_policy = BUILTIN_TOOLS["DateTime"].cache_policy
+    metadata = BUILTIN_TOOLS["DateTime"].metadata
+    
     def __init__(self):
         super().__init__(
             name="DateTime",
-            description="获取当前日期时间或进行时间计算。命令: 'now'(当前时间), 'today'(今天日期), 'timezone:Asia/Shanghai'(指定时区时间)"
+            description=BUILTIN_TOOLS["DateTime"].description
         )
     
     def run(self, query: str) -> str:
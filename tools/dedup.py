@@ -0,0 +1,184 @@
+"""
+近似重复段落去重 - MinHash + LSH
+
+多个子问题的检索结果经常包含相同或几乎相同的段落，直接拼接会让报告和发给 LLM 的提示词膨胀。
+PassageDeduplicator 按顺序接收段落，丢弃与已保留段落相似度（Jaccard）不低于阈值的段落，
+并统计丢弃数量以及节省的字节数和 token 数。
+
+- 完全相同的段落（规范化后）通过哈希集合直接判断
+- 其余段落计算 MinHash 签名，按 LSH 分桶只与同桶的候选段落比较，避免两两比较
+"""
+
+import hashlib
+import random
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from llm.tokens import estimate_tokens
+
+# 2^31 - 1，梅森素数，用于通用哈希 (a * x + b) mod p；
+# 乘积不超过 2^62，numpy 的 uint64 运算不会溢出，两种实现得到相同的签名
+_MERSENNE_PRIME = (1 << 31) - 1
+_MAX_HASH = _MERSENNE_PRIME
+
+try:
+    import numpy as _np
+except ImportError:  # numpy 是可选依赖，没有时使用纯 Python 实现
+    _np = None
+
+# SearchTool 结果行的来源前缀，如 "[python_intro.txt:3] "，比较内容时忽略
+_SOURCE_PREFIX_RE = re.compile(r"^\s*\[[^\]]*\]\s*")
+_PUNCT_RE = re.compile(r"[^\w\s]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_passage(text: str) -> str:
+    """规范化段落：去掉来源前缀和标点、合并空白、转小写"""
+    text = _PUNCT_RE.sub(" ", _SOURCE_PREFIX_RE.sub("", text))
+    return _SPACE_RE.sub(" ", text).strip().lower()
+
+
+def shingles(text: str, size: int) -> Set[int]:
+    """字符 n-gram 集合（对中英文都适用），每个 n-gram 映射为 31 位整数"""
+    if len(text) <= size:
+        grams = [text]
+    else:
+        grams = [text[i:i + size] for i in range(len(text) - size + 1)]
+    return {
+        int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little") & _MAX_HASH
+        for g in grams
+    }
+
+
+class MinHash:
+    """
+    MinHash 签名生成器
+
+    参数:
+        num_perm: 哈希函数（排列）个数，越多估计越准、计算越慢
+        seed: 随机种子，同一种子生成的签名才可以互相比较
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        self.num_perm = num_perm
+        rng = random.Random(seed)
+        self._params = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+        if _np is not None:
+            self._a = _np.array([a for a, _ in self._params], dtype=_np.uint64)[:, None]
+            self._b = _np.array([b for _, b in self._params], dtype=_np.uint64)[:, None]
+
+    def signature(self, shingles: Iterable[int]) -> Tuple[int, ...]:
+        values = list(shingles)
+        if not values:
+            return tuple([_MAX_HASH] * self.num_perm)
+        if _np is not None:
+            hashed = (self._a * _np.array(values, dtype=_np.uint64)[None, :] + self._b) % _MERSENNE_PRIME
+            return tuple(int(x) for x in hashed.min(axis=1))
+        return tuple(
+            min((a * v + b) % _MERSENNE_PRIME for v in values)
+            for a, b in self._params
+        )
+
+    @staticmethod
+    def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        """估计两个签名对应集合的 Jaccard 相似度"""
+        if not sig_a:
+            return 0.0
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class PassageDeduplicator:
+    """
+    段落去重器（线程安全）
+
+    用法:
+        dedup = PassageDeduplicator(threshold=0.75)
+        kept = dedup.filter(passages)
+        dedup.get_stats()  # {"kept": ..., "dropped": ..., "bytes_saved": ..., "tokens_saved": ...}
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.75,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 3,
+        seed: int = 1
+    ):
+        """
+        参数:
+            threshold: Jaccard 相似度阈值，达到该值视为重复
+            num_perm: MinHash 签名长度
+            bands: LSH 分段数（num_perm 必须能被整除）；段越多召回越高、候选越多
+            shingle_size: 字符 n-gram 长度
+            seed: MinHash 随机种子
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) 必须能被 bands ({bands}) 整除")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self._minhash = MinHash(num_perm=num_perm, seed=seed)
+        self._lock = threading.Lock()
+
+        self._exact: Set[str] = set()
+        self._signatures: List[Tuple[int, ...]] = []
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(bands)]
+
+        self.stats = {"kept": 0, "dropped": 0, "bytes_saved": 0, "tokens_saved": 0}
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        return [signature[b * self.rows:(b + 1) * self.rows] for b in range(self.bands)]
+
+    def _find_duplicate(self, signature: Tuple[int, ...], keys: List[Tuple[int, ...]]) -> Optional[int]:
+        candidates: Set[int] = set()
+        for band, key in enumerate(keys):
+            candidates.update(self._buckets[band].get(key, ()))
+        for index in candidates:
+            if MinHash.similarity(signature, self._signatures[index]) >= self.threshold:
+                return index
+        return None
+
+    def add(self, passage: str) -> bool:
+        """
+        加入一个段落
+
+        返回:
+            True 表示是新段落（已保留），False 表示与已有段落重复（已丢弃）
+        """
+        normalized = normalize_passage(passage)
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+        with self._lock:
+            duplicate = digest in self._exact
+            if not duplicate and normalized:
+                signature = self._minhash.signature(shingles(normalized, self.shingle_size))
+                keys = self._band_keys(signature)
+                duplicate = self._find_duplicate(signature, keys) is not None
+                if not duplicate:
+                    index = len(self._signatures)
+                    self._signatures.append(signature)
+                    for band, key in enumerate(keys):
+                        self._buckets[band].setdefault(key, []).append(index)
+
+            if duplicate:
+                self.stats["dropped"] += 1
+                self.stats["bytes_saved"] += len(passage.encode("utf-8"))
+                self.stats["tokens_saved"] += estimate_tokens(passage)
+                return False
+
+            self._exact.add(digest)
+            self.stats["kept"] += 1
+            return True
+
+    def filter(self, passages: Iterable[str]) -> List[str]:
+        """按顺序过滤一组段落，返回保留的段落"""
+        return [p for p in passages if self.add(p)]
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
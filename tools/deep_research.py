@@ -1,18 +1,126 @@
-from typing import List
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FuturesTimeout
+from typing import Dict, Iterator, List, Optional, Tuple
+from llm.base import BaseLLM
+from llm.tokens import estimate_messages_tokens, estimate_tokens
 from .base import BaseTool
-from .search import SearchTool
+from .catalog import BUILTIN_TOOLS
+from .dedup import PassageDeduplicator
+from .resilience import run_in_background
+
+# 有子任务失败或超时时写入结论，这样的报告不缓存
+PARTIAL_MARKER = "[partial]"
+
+DECOMPOSE_PROMPT = """Break the research topic below into at most {count} focused sub-questions that together cover it.
+Reply with one sub-question per line and nothing else.
+
+Topic: {topic}"""
+
+JUDGE_PROMPT = """Research topic: {topic}
+
+For each numbered sub-question below, decide whether its findings answer it.
+Reply with exactly one line per sub-question:
+- "<number>: OK" if the findings answer it
+- "<number>: <a narrower follow-up question>" if it is still under-answered
+
+{findings}"""
+
+SUMMARY_PROMPT = """Write a concise research summary about "{topic}" using only the findings below.
+Mention which sub-questions remain open, if any.
+
+{findings}"""
+
+_QUESTION_PREFIX_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)、:])\s*")
+_JUDGE_LINE_RE = re.compile(r"^\s*(\d+)\s*[:.)、]\s*(.+?)\s*$")
+_COVERED_WORDS = {"ok", "covered", "answered", "yes", "done"}
+
+
+class ResearchBudget:
+    """
+    研究预算：墙钟时间 + LLM token
+
+    参数:
+        max_seconds: 最长研究时间（秒）
+        max_tokens: LLM 调用可使用的 token 总数（提示词 + 生成）
+        summary_reserve: 为最终总结预留的 token 数，剩余 token 低于该值后不再继续深入
+    """
+
+    def __init__(self, max_seconds: float = 30.0, max_tokens: int = 8000, summary_reserve: int = 1500):
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.summary_reserve = summary_reserve
+        self.started_at = time.perf_counter()
+        self.tokens_used = 0
+
+    def spend(self, tokens: int) -> None:
+        self.tokens_used += tokens
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    @property
+    def remaining_seconds(self) -> float:
+        return max(0.0, self.max_seconds - self.elapsed)
+
+    @property
+    def remaining_tokens(self) -> int:
+        return max(0, self.max_tokens - self.tokens_used)
+
+    def can_deepen(self) -> bool:
+        """是否还有预算进行下一轮（扣除总结预留）"""
+        return self.remaining_seconds > 0 and self.remaining_tokens > self.summary_reserve
+
 
 class DeepResearchTool(BaseTool):
-    def __init__(self, search_tool: SearchTool):
+    cache_policy = BUILTIN_TOOLS["DeepResearch"].cache_policy
+    metadata = BUILTIN_TOOLS["DeepResearch"].metadata
+
+    def __init__(
+        self,
+        search_tool: BaseTool,
+        max_workers: int = 4,
+        subtask_timeout: float = 10.0,
+        llm: Optional[BaseLLM] = None,
+        max_rounds: int = 3,
+        max_questions: int = 12,
+        budget_seconds: float = 30.0,
+        budget_tokens: int = 8000,
+        dedup_threshold: Optional[float] = 0.75
+    ):
+        """
+        参数:
+            search_tool: 执行子问题搜索的工具（本地搜索、网络搜索或 MCP 工具）
+            max_workers: 同时执行的子问题搜索数
+            subtask_timeout: 单个子问题搜索的超时时间（秒，从该子任务开始执行时计时）
+            llm: 可选的 LLM。提供后由 LLM 分解问题、判断覆盖度、只对回答不足的子问题继续深入，
+                 并流式生成总结；为 None 时使用固定的子问题和模板结论
+            max_rounds: LLM 模式下最多的搜索轮数
+            max_questions: LLM 模式下最多搜索的子问题总数
+            budget_seconds: LLM 模式下的墙钟时间预算（秒）
+            budget_tokens: LLM 模式下的 token 预算
+            dedup_threshold: 段落去重的相似度阈值（MinHash 估计的 Jaccard），
+                             与之前子任务结果近似重复的段落会被丢弃；None 表示不去重
+        """
         super().__init__(
             name="DeepResearch",
-            description="Perform a deep research on a complex topic. It automatically breaks down the topic into sub-questions, searches for each, and summarizes the findings. Use this for broad or complex queries."
+            description=BUILTIN_TOOLS["DeepResearch"].description
         )
         self.search_tool = search_tool
+        self.max_workers = max_workers
+        self.subtask_timeout = subtask_timeout
+        self.llm = llm
+        self.max_rounds = max_rounds
+        self.max_questions = max_questions
+        self.budget_seconds = budget_seconds
+        self.budget_tokens = budget_tokens
+        self.dedup_threshold = dedup_threshold
 
     def _generate_sub_questions(self, topic: str) -> List[str]:
-        # 在真实场景中，这里会调用 LLM 来分解问题
-        # 模拟：针对不同 topic 生成固定的子问题
+        # 未配置 LLM 时的模拟分解：针对不同 topic 生成固定的子问题
         topic = topic.lower()
         if "agent" in topic:
             return [
@@ -34,32 +142,338 @@ class DeepResearchTool(BaseTool):
             ]
 
     def run(self, query: str) -> str:
-        report = []
-        report.append(f"=== Deep Research Report: {query} ===\n")
-        
+        return "".join(self.run_stream(query))
+
+    def run_stream(self, query: str) -> Iterator[str]:
+        """
+        逐步产出研究报告：先输出计划，按计划顺序输出每个子任务的发现，最后输出结论和耗时
+
+        子问题在线程池中并发搜索，单个子任务失败或超时不影响其他子任务（报告标记为部分结果）。
+        调用方关闭生成器后，尚未开始的子任务会被取消。
+        """
+        if self.llm is not None:
+            yield from self._run_llm_stream(query)
+        else:
+            yield from self._run_fixed_stream(query)
+
+    # ------------------------------------------------------------------
+    # 子任务并发执行
+    # ------------------------------------------------------------------
+
+    def _search(self, index: int, question: str, started: Dict[int, float]) -> Tuple[str, float]:
+        started[index] = time.perf_counter()
+        result = self.search_tool.run(question)
+        return result, time.perf_counter() - started[index]
+
+    def _wait(self, future: Future, index: int, started: Dict[int, float], timeout: float) -> Tuple[str, float]:
+        """等待子任务完成；超时从子任务真正开始执行时计算，排队时间不计入"""
+        while True:
+            start = started.get(index)
+            remaining = timeout if start is None else start + timeout - time.perf_counter()
+            try:
+                return future.result(timeout=max(remaining, 0))
+            except FuturesTimeout:
+                start = started.get(index)
+                if start is not None and time.perf_counter() - start >= timeout:
+                    raise
+
+    def _fan_out(
+        self,
+        questions: List[str],
+        timeout: Optional[float] = None
+    ) -> Iterator[Tuple[int, Optional[str], str, Optional[float]]]:
+        """
+        并发搜索一组子问题，按输入顺序产出 (序号, 搜索结果或 None, 状态, 耗时)
+
+        状态为 "ok" / "timeout" / "error: ..."。生成器被关闭时取消尚未开始的子任务。
+
+        搜索在共享的守护工作线程中执行，同时最多 max_workers 个：超时后仍卡住的搜索
+        不会阻止进程退出（ThreadPoolExecutor 的线程会在解释器退出时被 join）。
+        """
+        timeout = self.subtask_timeout if timeout is None else timeout
+        started: Dict[int, float] = {}
+        futures: List[Future] = [Future() for _ in questions]
+        waiting = deque(range(len(questions)))
+        lock = threading.Lock()
+
+        def launch_next() -> None:
+            with lock:
+                if not waiting:
+                    return
+                i = waiting.popleft()
+            run_in_background(lambda: run(i))
+
+        def run(i: int) -> None:
+            future = futures[i]
+            # 已被取消（生成器关闭）的子任务直接跳过
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self._search(i, questions[i], started))
+                except BaseException as e:
+                    future.set_exception(e)
+            launch_next()
+
+        for _ in range(max(1, min(self.max_workers, len(questions)))):
+            launch_next()
+        try:
+            for i, future in enumerate(futures):
+                try:
+                    result, step_time = self._wait(future, i, started, timeout)
+                    yield i, result, "ok", step_time
+                except FuturesTimeout:
+                    # 不再等待超时的搜索，补一个并发名额给排队中的子任务
+                    launch_next()
+                    yield i, None, "timeout", None
+                except Exception as e:
+                    step_time = time.perf_counter() - started[i] if i in started else None
+                    yield i, None, f"error: {e}", step_time
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _describe_failure(self, status: str, timeout: float) -> str:
+        if status == "timeout":
+            return f"(timed out after {timeout:g}s)"
+        return f"(search {status.replace('error', 'failed', 1)})"
+
+    @staticmethod
+    def _format_timing(step_time: Optional[float], status: str, step: int) -> str:
+        elapsed = f"{step_time * 1000:.0f}ms" if step_time is not None else "-"
+        return f"step{step} {elapsed} {status.split(':', 1)[0]}"
+
+    def _new_deduplicator(self) -> Optional[PassageDeduplicator]:
+        if self.dedup_threshold is None:
+            return None
+        return PassageDeduplicator(threshold=self.dedup_threshold)
+
+    @staticmethod
+    def _dedup(search_result: str, dedup: Optional[PassageDeduplicator]) -> Tuple[Optional[str], int]:
+        """
+        去掉与之前子任务结果重复的段落（按行）
+
+        返回:
+            (去重后的结果，全部重复时为 None, 原始段落数)
+        """
+        passages = [line for line in search_result.splitlines() if line.strip()]
+        if dedup is None:
+            return search_result, len(passages)
+        kept = dedup.filter(passages)
+        return ("\n".join(kept) if kept else None), len(passages)
+
+    @staticmethod
+    def _dedup_line(dedup: Optional[PassageDeduplicator]) -> List[str]:
+        if dedup is None:
+            return []
+        stats = dedup.get_stats()
+        return [
+            f"[Dedup] dropped {stats['dropped']} duplicate passage(s), "
+            f"saved {stats['bytes_saved']} bytes (~{stats['tokens_saved']} tokens)"
+        ]
+
+    # ------------------------------------------------------------------
+    # 固定分解模式
+    # ------------------------------------------------------------------
+
+    def _run_fixed_stream(self, query: str) -> Iterator[str]:
+        total_start = time.perf_counter()
+
         # 1. 分解任务
         sub_questions = self._generate_sub_questions(query)
-        report.append(f"Research Plan (Sub-tasks):")
-        for q in sub_questions:
-            report.append(f"- {q}")
-        report.append("\n")
-        
-        # 2. 执行子任务（多次搜索）
-        aggregated_info = []
-        for i, question in enumerate(sub_questions):
-            report.append(f"--- Step {i+1}: Researching '{question}' ---")
-            search_result = self.search_tool.run(question)
-            
-            # 简化输出，避免报告过长
-            # 提取搜索结果的前 100 个字符作为摘要
-            summary = search_result.replace("\n", " ")[:150] + "..."
-            report.append(f"Findings: {summary}\n")
-            aggregated_info.append(search_result)
-            
+        plan_time = time.perf_counter() - total_start
+        plan = [f"=== Deep Research Report: {query} ===\n", "Research Plan (Sub-tasks):"]
+        plan.extend(f"- {q}" for q in sub_questions)
+        plan.append("\n")
+        yield "\n".join(plan)
+
+        # 2. 并发执行子任务，按计划顺序汇总
+        timings: List[str] = []
+        failed = 0
+        dedup = self._new_deduplicator()
+        for i, search_result, status, step_time in self._fan_out(sub_questions):
+            if search_result is not None:
+                unique, total_passages = self._dedup(search_result, dedup)
+                if unique is None:
+                    summary = f"(all {total_passages} passages duplicate earlier findings)"
+                else:
+                    # 简化输出，避免报告过长
+                    # 提取搜索结果的前 150 个字符作为摘要
+                    summary = unique.replace("\n", " ")[:150] + "..."
+            else:
+                failed += 1
+                summary = self._describe_failure(status, self.subtask_timeout)
+            timings.append(self._format_timing(step_time, status, i + 1))
+            yield f"\n--- Step {i+1}: Researching '{sub_questions[i]}' ---\nFindings: {summary}\n"
+
         # 3. 归纳结论 (Mock)
-        # 真实场景会把 aggregated_info 发给 LLM 进行总结
-        report.append("=== Final Conclusion ===")
-        report.append(f"Based on {len(sub_questions)} research steps, we have gathered comprehensive information about '{query}'.")
-        report.append("The documents cover definitions, characteristics, and use cases as detailed above.")
-        
-        return "\n".join(report)
+        total = len(sub_questions)
+        conclusion = ["=== Final Conclusion ==="]
+        if failed:
+            conclusion.append(
+                f"{PARTIAL_MARKER} {total - failed} of {total} research steps succeeded; "
+                f"the findings about '{query}' are incomplete."
+            )
+        else:
+            conclusion.append(
+                f"Based on {total} research steps, we have gathered comprehensive information about '{query}'."
+            )
+        conclusion.append("The documents cover definitions, characteristics, and use cases as detailed above.")
+        conclusion.extend(self._dedup_line(dedup))
+        total_time = time.perf_counter() - total_start
+        conclusion.append(
+            f"[Timing] plan {plan_time * 1000:.0f}ms | {' | '.join(timings)} | total {total_time * 1000:.0f}ms"
+        )
+        yield "\n" + "\n".join(conclusion)
+
+    # ------------------------------------------------------------------
+    # LLM 驱动的迭代加深模式
+    # ------------------------------------------------------------------
+
+    def _ask(self, prompt: str, budget: ResearchBudget) -> str:
+        result = self.llm.generate_with_usage([{"role": "user", "content": prompt}])
+        budget.spend(result.total_tokens)
+        return result.text
+
+    def _decompose(self, topic: str, budget: ResearchBudget) -> List[str]:
+        """让 LLM 分解问题；失败或解析不到问题时退回固定分解"""
+        count = min(4, self.max_questions)
+        try:
+            text = self._ask(DECOMPOSE_PROMPT.format(count=count, topic=topic), budget)
+        except Exception:
+            return self._generate_sub_questions(topic)
+        questions = []
+        for line in text.splitlines():
+            question = _QUESTION_PREFIX_RE.sub("", line).strip()
+            if question and question not in questions:
+                questions.append(question)
+        return questions[:count] or self._generate_sub_questions(topic)
+
+    @staticmethod
+    def _findings_block(steps: List[Dict], indices: List[int], chars: int) -> str:
+        lines = []
+        for n, index in enumerate(indices, 1):
+            step = steps[index]
+            findings = (step["result"] or "(no findings)").replace("\n", " ")[:chars]
+            lines.append(f"{n}. {step['question']}\nFindings: {findings}")
+        return "\n\n".join(lines)
+
+    def _judge(self, topic: str, steps: List[Dict], indices: List[int], budget: ResearchBudget) -> Dict[int, str]:
+        """
+        判断覆盖度
+
+        返回:
+            {步骤序号: 追问问题}，只包含回答不足的子问题；LLM 调用失败时视为全部已覆盖
+        """
+        prompt = JUDGE_PROMPT.format(topic=topic, findings=self._findings_block(steps, indices, 400))
+        try:
+            text = self._ask(prompt, budget)
+        except Exception:
+            return {}
+        follow_ups: Dict[int, str] = {}
+        for line in text.splitlines():
+            match = _JUDGE_LINE_RE.match(line)
+            if not match:
+                continue
+            n, verdict = int(match.group(1)), match.group(2).strip().strip('"')
+            if 1 <= n <= len(indices) and verdict.lower().rstrip(".") not in _COVERED_WORDS:
+                follow_ups[indices[n - 1]] = verdict
+        return follow_ups
+
+    def _run_llm_stream(self, query: str) -> Iterator[str]:
+        budget = ResearchBudget(self.budget_seconds, self.budget_tokens, summary_reserve=self.budget_tokens // 4)
+
+        # 1. 分解任务
+        questions = self._decompose(query, budget)
+        plan_time = budget.elapsed
+        plan = [f"=== Deep Research Report: {query} ===\n", "Research Plan (Sub-tasks):"]
+        plan.extend(f"- {q}" for q in questions)
+        plan.append("\n")
+        yield "\n".join(plan)
+
+        # 2. 逐轮搜索 -> 判断覆盖度 -> 只对回答不足的子问题追问
+        steps: List[Dict] = []
+        timings: List[str] = []
+        failed = 0
+        dedup = self._new_deduplicator()
+        pending: List[Tuple[str, Optional[int]]] = [(q, None) for q in questions]
+        stop_reason = "covered"
+        for round_no in range(1, self.max_rounds + 1):
+            round_indices = []
+            timeout = min(self.subtask_timeout, max(budget.remaining_seconds, 0.1))
+            batch = [question for question, _ in pending]
+            for i, search_result, status, step_time in self._fan_out(batch, timeout=timeout):
+                question, parent = pending[i]
+                unique, total_passages = (None, 0) if search_result is None else self._dedup(search_result, dedup)
+                steps.append({"question": question, "result": unique, "parent": parent})
+                index = len(steps) - 1
+                round_indices.append(index)
+                if search_result is not None and unique is None:
+                    summary = f"(all {total_passages} passages duplicate earlier findings)"
+                elif search_result is not None:
+                    summary = unique.replace("\n", " ")[:150] + "..."
+                else:
+                    failed += 1
+                    summary = self._describe_failure(status, timeout)
+                timings.append(self._format_timing(step_time, status, index + 1))
+                label = f" (follow-up to step {parent + 1})" if parent is not None else ""
+                yield f"\n--- Step {index + 1}: Researching '{question}'{label} ---\nFindings: {summary}\n"
+
+            if not budget.can_deepen():
+                stop_reason = "budget"
+                break
+            # 最后一轮也判断覆盖度：全部回答时停止原因是 "covered" 而不是轮数上限
+            follow_ups = self._judge(query, steps, round_indices, budget)
+            last_round = round_no == self.max_rounds
+            room = 0 if last_round else self.max_questions - len(steps)
+            pending = [(q, index) for index, q in sorted(follow_ups.items())][:max(room, 0)]
+            yield (
+                f"\n[Coverage] round {round_no}: {len(round_indices) - len(follow_ups)}/{len(round_indices)} "
+                f"answered; {len(pending)} follow-up(s)\n"
+            )
+            if not follow_ups:
+                stop_reason = "covered"
+                break
+            if last_round:
+                stop_reason = "max rounds"
+                break
+            if not pending:
+                stop_reason = "max questions"
+                break
+            if not budget.can_deepen():
+                stop_reason = "budget"
+                break
+
+        # 3. 流式生成总结（在剩余 token 内尽量多地放入发现）
+        yield "\n=== Final Conclusion ===\n"
+        all_indices = list(range(len(steps)))
+        chars = 600
+        messages = [{"role": "user", "content": SUMMARY_PROMPT.format(
+            topic=query, findings=self._findings_block(steps, all_indices, chars))}]
+        while chars > 100 and estimate_messages_tokens(messages) > budget.remaining_tokens:
+            chars //= 2
+            messages[0]["content"] = SUMMARY_PROMPT.format(
+                topic=query, findings=self._findings_block(steps, all_indices, chars))
+
+        summary_failed = False
+        budget.spend(estimate_messages_tokens(messages))
+        try:
+            for chunk in self.llm.generate_stream(messages):
+                budget.spend(estimate_tokens(chunk))
+                yield chunk
+        except Exception as e:
+            summary_failed = True
+            yield f"{PARTIAL_MARKER} Summary generation failed ({e}); see the findings above."
+
+        total = len(steps)
+        footer = []
+        if failed and not summary_failed:
+            footer.append(f"{PARTIAL_MARKER} {total - failed} of {total} research steps succeeded.")
+        footer.extend(self._dedup_line(dedup))
+        footer.append(
+            f"[Timing] plan {plan_time * 1000:.0f}ms | {' | '.join(timings)} | "
+            f"total {budget.elapsed * 1000:.0f}ms | ~{budget.tokens_used} llm tokens | stop: {stop_reason}"
+        )
+        yield "\n" + "\n".join(footer)
+
+    def is_cacheable(self, result: str) -> bool:
+        """部分子任务失败的报告不缓存"""
+        return PARTIAL_MARKER not in result
@@ -1,10 +1,13 @@
 from .base import BaseTool
+from .catalog import BUILTIN_TOOLS
 
 class ImageGenTool(BaseTool):
+    metadata = BUILTIN_TOOLS["ImageGen"].metadata
+
     def __init__(self):
         super().__init__(
             name="ImageGen",
-            description="Generate an image based on a text description. Use this when the user asks to draw, generate, or create an image. Input: description of the image."
+            description=BUILTIN_TOOLS["ImageGen"].description
         )
 
     def run(self, query: str) -> str:
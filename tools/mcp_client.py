@@ -8,11 +8,41 @@ MCP 是一个开放协议，允许 AI 应用连接到外部数据源和工具。
 - MCP Python SDK: https://github.com/modelcontextprotocol/python-sdk
 
 本实现提供了一个简化的 MCP 客户端包装器，用于连接外部 MCP 服务器。
+stdio、Streamable HTTP 和旧版 HTTP+SSE 传输直接实现 JSON-RPC（见 tools/mcp_transport.py），不依赖 mcp SDK。
+同一服务器的所有 MCPTool 共享一个 MCPClient，也就共享它的传输层（stdio 管道或 HTTP 连接池）。
+
+启动优化（MCPManager）:
+- 多个服务器并发连接，每个服务器有自己的启动超时；超时的服务器在后台继续连接，连上后再注册工具
+- 延迟模式（lazy）：工具列表来自上次连接时保存的清单缓存，第一次调用工具时才启动进程 / 建立连接
 """
 
+import hashlib
 import json
-from typing import Dict, List, Any, Optional
-from .base import BaseTool
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Iterator, List, Any, Optional
+from .base import BaseTool, ToolMetadata
+from .mcp_transport import (
+    HTTPTransport, MCPConnectionError, MCPError, MCPToolError, MCPTransport, SSETransport, StdioTransport
+)
+
+# 客户端声明的协议版本
+PROTOCOL_VERSION = "2024-11-05"
+CLIENT_INFO = {"name": "enhanced-chat-agent", "version": "1.0"}
+
+# MCPTool 返回的表示服务器或连接故障的错误前缀（熔断器计为失败）
+MCP_FAILURE_PREFIXES = ("MCP 工具调用失败", "错误: 未连接到 MCP 服务器")
+
+# 不影响服务器提供哪些工具的配置项，不参与清单缓存的指纹
+_NON_FINGERPRINT_KEYS = {"description", "lazy", "startup_timeout", "timeout", "max_connections"}
+
+
+def config_fingerprint(server_config: Dict[str, Any]) -> str:
+    """服务器配置的指纹；配置改变（命令、参数、URL 等）后缓存的工具清单失效"""
+    relevant = {k: v for k, v in server_config.items() if k not in _NON_FINGERPRINT_KEYS}
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
 
 
 class MCPTool(BaseTool):
@@ -20,7 +50,17 @@ class MCPTool(BaseTool):
     MCP 工具包装器 - 将 MCP 服务器的能力包装为 Agent 工具
     """
     
-    def __init__(self, name: str, description: str, mcp_client, tool_name: str):
+    # 外部工具的行为未知，使用保守的默认值（非纯、有副作用）
+    metadata = ToolMetadata(expected_latency=1.0, max_concurrency=4, timeout=30.0)
+    
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        mcp_client,
+        tool_name: str,
+        input_schema: Optional[Dict[str, Any]] = None
+    ):
         """
         初始化 MCP 工具
         
@@ -29,18 +69,58 @@ class MCPTool(BaseTool):
             description: 工具描述
             mcp_client: MCP 客户端实例
             tool_name: MCP 服务器中的工具名称
+            input_schema: 工具参数的 JSON Schema（来自 tools/list）
         """
         super().__init__(name=name, description=description)
         self.mcp_client = mcp_client
         self.tool_name = tool_name
+        self.input_schema = input_schema or {}
+    
+    def build_arguments(self, query: str) -> Dict[str, Any]:
+        """
+        把 Agent 传来的文本转换为工具参数
+        
+        - 文本是 JSON 对象时直接作为参数
+        - 否则放进 schema 中唯一的必填参数（或唯一的参数）；无法判断时使用 "query"
+        """
+        text = query.strip()
+        if text.startswith("{"):
+            try:
+                arguments = json.loads(text)
+                if isinstance(arguments, dict):
+                    return arguments
+            except ValueError:
+                pass
+        properties = self.input_schema.get("properties") or {}
+        required = self.input_schema.get("required") or []
+        if len(required) == 1:
+            return {required[0]: query}
+        if len(properties) == 1:
+            return {next(iter(properties)): query}
+        return {"query": query}
     
     def run(self, query: str) -> str:
         """调用 MCP 服务器的工具"""
         try:
-            result = self.mcp_client.call_tool(self.tool_name, {"query": query})
+            result = self.mcp_client.call_tool(self.tool_name, self.build_arguments(query))
             return result
+        except MCPToolError as e:
+            return f"MCP 工具返回错误: {str(e)}"
         except Exception as e:
             return f"MCP 工具调用失败: {str(e)}"
+    
+    def run_stream(self, query: str) -> Iterator[str]:
+        """边收到服务器的进度通知边产出结果；提前关闭时服务器会收到取消通知"""
+        try:
+            yield from self.mcp_client.call_tool_stream(self.tool_name, self.build_arguments(query))
+        except MCPToolError as e:
+            yield f"MCP 工具返回错误: {str(e)}"
+        except Exception as e:
+            yield f"MCP 工具调用失败: {str(e)}"
+    
+    def is_error(self, result: str) -> bool:
+        """服务器不可用、超时或协议错误计为失败；工具自己报告的错误（isError）不算"""
+        return result.startswith(MCP_FAILURE_PREFIXES) or "\nMCP 工具调用失败: " in result
 
 
 class MCPClient:
@@ -63,20 +143,34 @@ class MCPClient:
             server_config: 服务器配置字典
                 {
                     "name": "服务器名称",
-                    "type": "stdio" | "http",  # 连接类型
+                    "type": "stdio" | "http" | "sse",  # 连接类型（http 为 Streamable HTTP，sse 为旧版 HTTP+SSE）
                     "command": "服务器启动命令",  # stdio 类型时使用
-                    "url": "服务器 URL",  # http 类型时使用
+                    "args": [],  # 命令参数
+                    "url": "服务器 URL",  # http / sse 类型时使用
+                    "headers": {},  # http / sse 类型的额外请求头（如 Authorization）
+                    "max_connections": 4,  # http / sse 类型的最大并发连接数
                     "env": {},  # 环境变量
+                    "timeout": 30,  # 请求超时（秒）
+                    "lazy": false,  # 延迟模式：使用缓存的工具清单，首次调用时才连接（由 MCPManager 处理）
+                    "startup_timeout": 10,  # 启动时等待连接的最长时间（秒，由 MCPManager 处理）
                 }
         """
         self.config = server_config
         self.server_name = server_config.get("name", "unknown")
         self.connection_type = server_config.get("type", "stdio")
+        self.timeout = float(server_config.get("timeout", 30))
         self.connected = False
         self.available_tools = []
+        self.server_info: Dict[str, Any] = {}
         
-        # 实际的 MCP 连接对象（需要 mcp SDK）
-        self._mcp_connection = None
+        # 延迟模式：工具列表来自缓存清单，首次调用工具时才连接
+        self.lazy = False
+        # 连接成功后的回调（MCPManager 用它更新清单缓存）
+        self.on_connect: Optional[Callable[["MCPClient"], None]] = None
+        self._connect_lock = threading.Lock()
+        
+        # 传输层连接（JSON-RPC）
+        self._mcp_connection: Optional[MCPTransport] = None
     
     def connect(self) -> bool:
         """
@@ -88,7 +182,7 @@ class MCPClient:
         try:
             if self.connection_type == "stdio":
                 return self._connect_stdio()
-            elif self.connection_type == "http":
+            elif self.connection_type in ("http", "sse"):
                 return self._connect_http()
             else:
                 print(f"不支持的连接类型: {self.connection_type}")
@@ -98,43 +192,119 @@ class MCPClient:
             return False
     
     def _connect_stdio(self) -> bool:
-        """通过 stdio 连接到服务器"""
+        """通过 stdio 连接到服务器：启动子进程并保持运行，完成握手后获取工具列表"""
+        command = self.config.get("command")
+        if not command:
+            print("stdio 连接失败: 需要提供 command")
+            return False
+        print(f"[MCP] 尝试连接到服务器: {self.server_name} (stdio)")
+        transport = StdioTransport(
+            command,
+            args=self.config.get("args", []),
+            env=self.config.get("env", {}),
+            cwd=self.config.get("cwd"),
+            timeout=self.timeout,
+            name=self.server_name
+        )
         try:
-            # 实际实现需要使用 mcp Python SDK
-            # from mcp import ClientSession, StdioServerParameters
-            # from mcp.client.stdio import stdio_client
-            
-            # server_params = StdioServerParameters(
-            #     command=self.config.get("command"),
-            #     args=self.config.get("args", []),
-            #     env=self.config.get("env", {})
-            # )
-            # 
-            # self._mcp_connection = await stdio_client(server_params)
-            # self.connected = True
-            
-            # 目前返回模拟结果
-            print(f"[MCP] 尝试连接到服务器: {self.server_name} (stdio)")
-            print(f"[MCP] 提示: 完整的 MCP 实现需要安装 mcp SDK")
-            print(f"[MCP] 命令: pip install mcp")
-            self.connected = False
+            transport.start()
+        except OSError as e:
+            print(f"stdio 连接失败: 无法启动 {command}: {e}")
             return False
-            
-        except Exception as e:
-            print(f"stdio 连接失败: {str(e)}")
+        return self._initialize(transport)
+    
+    def _initialize(self, transport: MCPTransport) -> bool:
+        """MCP 握手（initialize + notifications/initialized）并获取工具列表"""
+        try:
+            result = transport.request("initialize", {
+                "protocolVersion": PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": CLIENT_INFO,
+            })
+            transport.notify("notifications/initialized")
+            self.server_info = result.get("serverInfo", {}) if isinstance(result, dict) else {}
+            self._mcp_connection = transport
+            self.available_tools = self._fetch_tools()
+        except MCPError as e:
+            print(f"[MCP] 与服务器 {self.server_name} 握手失败: {e}")
+            transport.close()
+            self._mcp_connection = None
+            return False
+        self.connected = True
+        print(f"[MCP] 已连接到服务器: {self.server_name}，提供 {len(self.available_tools)} 个工具")
+        if self.on_connect is not None:
+            try:
+                self.on_connect(self)
+            except Exception as e:
+                print(f"[MCP] 服务器 {self.server_name} 的连接回调失败: {e}")
+        return True
+    
+    def load_manifest(self, manifest: Dict[str, Any]) -> None:
+        """
+        从缓存的清单加载工具列表并进入延迟模式（不连接服务器）
+        
+        参数:
+            manifest: manifest_entry() 的返回值
+        """
+        self.available_tools = list(manifest.get("tools", []))
+        self.server_info = dict(manifest.get("server_info", {}))
+        self.lazy = True
+    
+    def manifest_entry(self) -> Dict[str, Any]:
+        """当前工具列表的清单（用于缓存）"""
+        return {
+            "fingerprint": config_fingerprint(self.config),
+            "server_info": self.server_info,
+            "tools": self.available_tools,
+            "saved_at": time.time(),
+        }
+    
+    def ensure_connected(self) -> bool:
+        """
+        确保已连接；延迟模式下第一次调用时才真正连接（多个线程同时调用时只连接一次）
+        
+        返回:
+            是否已连接
+        """
+        if self.connected:
+            return True
+        if not self.lazy:
             return False
+        with self._connect_lock:
+            if not self.connected:
+                print(f"[MCP] 首次使用服务器 {self.server_name} 的工具，正在连接...")
+                self.connect()
+        return self.connected
+    
+    def _fetch_tools(self) -> List[Dict[str, Any]]:
+        """通过 tools/list 获取全部工具（处理分页）"""
+        tools: List[Dict[str, Any]] = []
+        cursor = None
+        while True:
+            result = self._mcp_connection.request("tools/list", {"cursor": cursor} if cursor else {})
+            tools.extend(result.get("tools", []))
+            cursor = result.get("nextCursor")
+            if not cursor:
+                return tools
     
     def _connect_http(self) -> bool:
-        """通过 HTTP 连接到服务器"""
+        """通过 HTTP 连接到服务器（Streamable HTTP 或旧版 HTTP+SSE），完成握手后获取工具列表"""
         try:
             url = self.config.get("url")
             if not url:
                 raise ValueError("HTTP 连接需要提供 url")
             
-            print(f"[MCP] 尝试连接到服务器: {self.server_name} (HTTP: {url})")
-            print(f"[MCP] 提示: HTTP MCP 连接尚未实现")
-            self.connected = False
-            return False
+            print(f"[MCP] 尝试连接到服务器: {self.server_name} ({self.connection_type.upper()}: {url})")
+            transport_cls = SSETransport if self.connection_type == "sse" else HTTPTransport
+            transport = transport_cls(
+                url,
+                headers=self.config.get("headers", {}),
+                timeout=self.timeout,
+                max_connections=int(self.config.get("max_connections", 4)),
+                name=self.server_name
+            )
+            transport.start()
+            return self._initialize(transport)
             
         except Exception as e:
             print(f"HTTP 连接失败: {str(e)}")
@@ -147,19 +317,11 @@ class MCPClient:
         返回:
             工具信息列表
         """
-        if not self.connected:
+        if not self.connected and not self.lazy:
             print("[MCP] 未连接到服务器")
             return []
         
-        try:
-            # 实际实现:
-            # tools = await self._mcp_connection.list_tools()
-            # return tools
-            
-            return self.available_tools
-        except Exception as e:
-            print(f"获取工具列表失败: {str(e)}")
-            return []
+        return self.available_tools
     
     def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> str:
         """
@@ -172,26 +334,77 @@ class MCPClient:
         返回:
             工具执行结果
         """
-        if not self.connected:
+        if not self.ensure_connected() or self._mcp_connection is None:
             return "错误: 未连接到 MCP 服务器"
         
+        # 可以从多个线程同时调用，请求在同一个连接上流水线发送
+        result = self._mcp_connection.request("tools/call", {"name": tool_name, "arguments": arguments})
+        text = self._content_to_text(result.get("content", []))
+        if result.get("isError"):
+            raise MCPToolError(text or f"工具 {tool_name} 执行失败")
+        return text
+    
+    def call_tool_stream(self, tool_name: str, arguments: Dict[str, Any]) -> Iterator[str]:
+        """
+        流式调用工具：先产出服务器进度通知中的文本，最后产出最终结果中尚未产出的部分
+        
+        服务器按 "进度文本拼接起来是最终结果的前缀" 的约定发送进度时，产出的内容拼接后等于 call_tool() 的结果；
+        不满足该约定时，最终结果另起一行完整产出。调用方提前关闭生成器时服务器会收到取消通知。
+        """
+        if not self.ensure_connected() or self._mcp_connection is None:
+            yield "错误: 未连接到 MCP 服务器"
+            return
+        
+        streamed: List[str] = []
+        stream = self._mcp_connection.request_stream("tools/call", {"name": tool_name, "arguments": arguments})
         try:
-            # 实际实现:
-            # result = await self._mcp_connection.call_tool(tool_name, arguments)
-            # return result.content
-            
-            return f"模拟结果: 调用工具 {tool_name}，参数: {arguments}"
-        except Exception as e:
-            return f"调用工具失败: {str(e)}"
+            for kind, payload in stream:
+                if kind == "progress":
+                    text = payload.get("message")
+                    if text:
+                        streamed.append(text)
+                        yield text
+                    continue
+                text = self._content_to_text(payload.get("content", []))
+                if payload.get("isError"):
+                    raise MCPToolError(text or f"工具 {tool_name} 执行失败")
+                prefix = "".join(streamed)
+                rest = text[len(prefix):] if text.startswith(prefix) else "\n" + text
+                if rest:
+                    yield rest
+        finally:
+            # 提前关闭时立即结束底层请求（释放连接并通知服务器取消）
+            stream.close()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """传输层统计（HTTP 传输包含连接池的创建 / 复用次数）"""
+        if self._mcp_connection is None:
+            return {}
+        return self._mcp_connection.get_stats()
+    
+    @staticmethod
+    def _content_to_text(content: List[Dict[str, Any]]) -> str:
+        """把 MCP 的内容块列表转换为文本"""
+        parts = []
+        for block in content:
+            block_type = block.get("type")
+            if block_type == "text":
+                parts.append(block.get("text", ""))
+            elif block_type == "resource":
+                resource = block.get("resource", {})
+                parts.append(resource.get("text") or f"[resource: {resource.get('uri', '')}]")
+            else:
+                parts.append(f"[{block_type}]")
+        return "\n".join(parts)
     
     def disconnect(self):
         """断开与服务器的连接"""
         if self._mcp_connection:
             try:
-                # await self._mcp_connection.close()
-                pass
-            except:
+                self._mcp_connection.close()
+            except (MCPConnectionError, OSError):
                 pass
+            self._mcp_connection = None
         self.connected = False
         print(f"[MCP] 已断开与服务器 {self.server_name} 的连接")
     
@@ -202,7 +415,7 @@ class MCPClient:
         返回:
             BaseTool 列表
         """
-        if not self.connected:
+        if not self.connected and not self.lazy:
             print("[MCP] 未连接到服务器，无法获取工具")
             return []
         
@@ -216,7 +429,8 @@ class MCPClient:
                 name=f"{self.server_name}_{tool_name}",
                 description=tool_desc,
                 mcp_client=self,
-                tool_name=tool_name
+                tool_name=tool_name,
+                input_schema=tool_info.get("inputSchema")
             )
             agent_tools.append(mcp_tool)
         
@@ -226,10 +440,110 @@ class MCPClient:
 class MCPManager:
     """
     MCP 管理器 - 管理多个 MCP 客户端连接
+    
+    - add_servers 并发连接所有服务器，启动耗时约等于最慢的那个（且不超过其启动超时），而不是各服务器之和
+    - 启动超时的服务器在后台继续连接，连上后加入管理器并调用 on_late_connect（如把工具注册到注册器）
+    - 延迟模式的服务器使用清单缓存中的工具列表，首次调用工具时才连接；没有可用缓存时照常连接并写入缓存
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        startup_timeout: float = 10.0,
+        lazy: bool = False,
+        manifest_file: Optional[str] = None,
+        on_late_connect: Optional[Callable[[MCPClient], None]] = None
+    ):
+        """
+        参数:
+            startup_timeout: 默认的每个服务器启动超时（秒），可在服务器配置中用 startup_timeout 覆盖
+            lazy: 默认是否使用延迟模式，可在服务器配置中用 lazy 覆盖
+            manifest_file: 工具清单缓存文件（None 表示不缓存，延迟模式也会立即连接）
+            on_late_connect: 启动超时后在后台连上的服务器的回调（如注册它的工具）。
+                             必须在 add_servers 之前设置，否则启动后不久连上的服务器会错过回调
+        """
         self.clients: Dict[str, MCPClient] = {}
+        self.startup_timeout = startup_timeout
+        self.lazy = lazy
+        self.manifest_file = manifest_file
+        self.on_late_connect = on_late_connect
+        
+        self._lock = threading.Lock()
+        self._closed = False
+        self._manifest: Dict[str, Dict[str, Any]] = self._load_manifest()
+        self.stats = {
+            "connected": 0, "failed": 0, "timed_out": 0, "late_connected": 0,
+            "lazy": 0, "lazy_connected": 0, "startup_ms": 0.0,
+        }
+    
+    # ---- 清单缓存 ----
+    
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        if not self.manifest_file or not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data.get("servers", {}) if isinstance(data, dict) else {}
+        except (OSError, ValueError) as e:
+            print(f"[MCP Manager] 读取工具清单缓存失败，将重新连接: {e}")
+            return {}
+    
+    def _save_manifest(self, client: MCPClient) -> None:
+        """连接成功后更新该服务器的清单并写回缓存文件"""
+        if not self.manifest_file:
+            return
+        with self._lock:
+            self._manifest[client.server_name] = client.manifest_entry()
+            data = {"servers": dict(self._manifest)}
+            # 先写临时文件再替换，多个服务器同时连上时不会写出半个文件
+            tmp_path = f"{self.manifest_file}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, self.manifest_file)
+            except OSError as e:
+                print(f"[MCP Manager] 写入工具清单缓存失败: {e}")
+    
+    def _cached_manifest(self, server_config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        entry = self._manifest.get(server_config.get("name"))
+        if entry and entry.get("fingerprint") == config_fingerprint(server_config) and entry.get("tools"):
+            return entry
+        return None
+    
+    def _on_client_connect(self, client: MCPClient) -> None:
+        if client.lazy:
+            with self._lock:
+                self.stats["lazy_connected"] += 1
+        self._save_manifest(client)
+    
+    # ---- 添加服务器 ----
+    
+    def _new_client(self, server_config: Dict[str, Any]) -> MCPClient:
+        client = MCPClient(server_config)
+        client.on_connect = self._on_client_connect
+        return client
+    
+    def _add_client(self, client: MCPClient) -> bool:
+        with self._lock:
+            if self._closed:
+                return False
+            self.clients[client.server_name] = client
+        return True
+    
+    def _try_lazy(self, server_config: Dict[str, Any]) -> Optional[MCPClient]:
+        """延迟模式且有可用的清单缓存时，创建不连接的客户端"""
+        if not server_config.get("lazy", self.lazy):
+            return None
+        manifest = self._cached_manifest(server_config)
+        if manifest is None:
+            return None
+        client = self._new_client(server_config)
+        client.load_manifest(manifest)
+        self._add_client(client)
+        with self._lock:
+            self.stats["lazy"] += 1
+        print(f"[MCP Manager] 延迟连接服务器: {client.server_name}（从缓存清单加载 {len(client.available_tools)} 个工具）")
+        return client
     
     def add_server(self, server_config: Dict[str, Any]) -> bool:
         """
@@ -246,15 +560,106 @@ class MCPManager:
             print("错误: 服务器配置必须包含 name 字段")
             return False
         
-        client = MCPClient(server_config)
-        if client.connect():
-            self.clients[server_name] = client
+        if self._try_lazy(server_config) is not None:
+            return True
+        client = self._new_client(server_config)
+        if client.connect() and self._add_client(client):
+            with self._lock:
+                self.stats["connected"] += 1
             print(f"[MCP Manager] 成功添加服务器: {server_name}")
             return True
         else:
+            with self._lock:
+                self.stats["failed"] += 1
             print(f"[MCP Manager] 添加服务器失败: {server_name}")
             return False
     
+    def _connect_in_background(self, client: MCPClient) -> "Future[bool]":
+        # 使用守护线程而不是线程池：卡住的服务器不会阻止进程退出
+        future: "Future[bool]" = Future()
+        
+        def run():
+            try:
+                future.set_result(client.connect())
+            except BaseException as e:
+                future.set_exception(e)
+        
+        threading.Thread(target=run, name=f"mcp-connect-{client.server_name}", daemon=True).start()
+        return future
+    
+    def _finish_late(self, client: MCPClient, future: "Future[bool]") -> None:
+        """启动超时的服务器在后台连接完成"""
+        if future.exception() is not None or not future.result():
+            with self._lock:
+                self.stats["failed"] += 1
+            print(f"[MCP Manager] 添加服务器失败: {client.server_name}")
+            return
+        if not self._add_client(client):
+            # 管理器已经关闭
+            client.disconnect()
+            return
+        with self._lock:
+            self.stats["late_connected"] += 1
+        print(f"[MCP Manager] 服务器 {client.server_name} 在后台连接成功")
+        if self.on_late_connect is not None:
+            try:
+                self.on_late_connect(client)
+            except Exception as e:
+                print(f"[MCP Manager] 处理服务器 {client.server_name} 的后台连接失败: {e}")
+    
+    def add_servers(self, server_configs: List[Dict[str, Any]]) -> int:
+        """
+        并发添加多个服务器，每个服务器最多等待其启动超时
+        
+        参数:
+            server_configs: 服务器配置列表
+        
+        返回:
+            启动期间可用的服务器数（包括延迟模式的服务器）
+        """
+        start = time.perf_counter()
+        pending = []
+        ready = 0
+        for server_config in server_configs:
+            if not server_config.get("name"):
+                print("错误: 服务器配置必须包含 name 字段")
+                continue
+            if self._try_lazy(server_config) is not None:
+                ready += 1
+                continue
+            client = self._new_client(server_config)
+            timeout = float(server_config.get("startup_timeout", self.startup_timeout))
+            pending.append((client, self._connect_in_background(client), start + timeout))
+        
+        # 所有连接同时开始，按各自的截止时间等待
+        for client, future, deadline in pending:
+            try:
+                connected = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+            except FutureTimeoutError:
+                with self._lock:
+                    self.stats["timed_out"] += 1
+                print(f"[MCP Manager] 服务器 {client.server_name} 启动超时，继续在后台连接")
+                future.add_done_callback(lambda f, c=client: self._finish_late(c, f))
+                continue
+            except Exception as e:
+                print(f"连接 MCP 服务器失败: {str(e)}")
+                connected = False
+            if connected and self._add_client(client):
+                ready += 1
+                with self._lock:
+                    self.stats["connected"] += 1
+                print(f"[MCP Manager] 成功添加服务器: {client.server_name}")
+            else:
+                with self._lock:
+                    self.stats["failed"] += 1
+                print(f"[MCP Manager] 添加服务器失败: {client.server_name}")
+        
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.stats["startup_ms"] = elapsed
+        print(f"[MCP Manager] {ready}/{len(server_configs)} 个服务器可用，启动耗时 {elapsed:.0f}ms")
+        return ready
+    
     def get_all_tools(self) -> List[BaseTool]:
         """
         获取所有已连接服务器提供的工具
@@ -262,16 +667,34 @@ class MCPManager:
         返回:
             所有工具的列表
         """
+        with self._lock:
+            clients = list(self.clients.values())
         all_tools = []
-        for client in self.clients.values():
+        for client in clients:
             all_tools.extend(client.get_tools_as_agent_tools())
         return all_tools
     
     def disconnect_all(self):
-        """断开所有服务器连接"""
-        for client in self.clients.values():
-            client.disconnect()
-        self.clients.clear()
+        """断开所有服务器连接（之后在后台连上的服务器会被立即断开）"""
+        with self._lock:
+            self._closed = True
+            clients = list(self.clients.values())
+            self.clients.clear()
+        for client in clients:
+            if client.connected:
+                client.disconnect()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取启动统计
+        
+        返回:
+            {servers, connected, failed, timed_out, late_connected, lazy, lazy_connected, startup_ms}
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["servers"] = len(self.clients)
+        return stats
 
 
 # MCP 服务器配置示例
@@ -298,29 +721,61 @@ EXAMPLE_MCP_SERVERS = {
         "command": "mcp-server-sqlite",
         "args": ["path/to/database.db"],
         "description": "SQLite 数据库访问服务器"
+    },
+    "stub": {
+        "name": "stub",
+        "type": "stdio",
+        "command": "python",
+        "args": ["-m", "tools.mcp_stub_server"],
+        "description": "本地替身服务器（echo / add / sleep / fail / stream），用于测试"
+    },
+    "stub_http": {
+        "name": "stub_http",
+        "type": "http",
+        "url": "http://127.0.0.1:8765/mcp",
+        "max_connections": 4,
+        "timeout": 30,
+        "description": "HTTP 方式的本地替身服务器（先运行 python -m tools.mcp_stub_server --http）"
     }
 }
 
 
-def create_mcp_manager_from_config(config_file: str) -> MCPManager:
+def create_mcp_manager_from_config(
+    config_file: str,
+    lazy: Optional[bool] = None,
+    startup_timeout: Optional[float] = None,
+    manifest_file: Optional[str] = None,
+    on_late_connect: Optional[Callable[[MCPClient], None]] = None
+) -> MCPManager:
     """
-    从配置文件创建 MCP 管理器
+    从配置文件创建 MCP 管理器（并发连接所有服务器）
     
     参数:
         config_file: JSON 配置文件路径
+        lazy: 默认是否使用延迟模式（None 时读取配置文件顶层的 "lazy"，默认 False）
+        startup_timeout: 每个服务器的默认启动超时（None 时读取配置文件顶层的 "startup_timeout"，默认 10 秒）
+        manifest_file: 工具清单缓存文件（默认与配置文件同目录的 <配置文件名>.tools_cache.json）
+        on_late_connect: 启动超时后在后台连上的服务器的回调，在开始连接之前设置
     
     返回:
         MCPManager 实例
     """
-    manager = MCPManager()
+    manager = MCPManager(
+        startup_timeout=startup_timeout if startup_timeout is not None else 10.0,
+        lazy=bool(lazy),
+        manifest_file=manifest_file or os.path.splitext(config_file)[0] + ".tools_cache.json",
+        on_late_connect=on_late_connect
+    )
     
     try:
         with open(config_file, 'r', encoding='utf-8') as f:
             config = json.load(f)
         
-        servers = config.get("mcp_servers", [])
-        for server_config in servers:
-            manager.add_server(server_config)
+        if lazy is None:
+            manager.lazy = bool(config.get("lazy", False))
+        if startup_timeout is None:
+            manager.startup_timeout = float(config.get("startup_timeout", manager.startup_timeout))
+        manager.add_servers(config.get("mcp_servers", []))
         
         return manager
     except Exception as e:
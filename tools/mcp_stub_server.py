@@ -0,0 +1,500 @@
+"""
+本地 MCP 替身服务器 - 用于测试 MCPClient，无需安装真实的 MCP 服务器
+
+特性:
+- 实现 initialize、ping、tools/list、tools/call 和 notifications/cancelled
+- stdio 传输：每行一条 JSON-RPC 消息；每个请求在独立线程中处理，响应按完成顺序（可能乱序）写回
+- HTTP 传输（--http）：
+  - Streamable HTTP: POST /mcp，返回 JSON；请求带 progressToken 且客户端接受 SSE 时以事件流返回进度和结果
+  - 旧版 HTTP+SSE: GET /sse 建立事件流，POST /messages?session_id=... 提交请求
+  - 使用 HTTP/1.1 keep-alive，统计接受的 TCP 连接数，用于观察客户端的连接复用
+- 内置工具: echo、add、sleep（用于观察流水线并发）、fail（返回工具错误）、
+  stream（逐行输出，每行发送一条进度通知）
+- 可配置每次调用的额外延迟分布
+
+用法:
+    python -m tools.mcp_stub_server --latency uniform:0.05,0.2
+    python -m tools.mcp_stub_server --http --port 8765
+
+    mcp_config.json:
+    {"name": "stub", "type": "stdio", "command": "python", "args": ["-m", "tools.mcp_stub_server"]}
+    {"name": "stub_http", "type": "http", "url": "http://127.0.0.1:8765/mcp"}
+    {"name": "stub_sse", "type": "sse", "url": "http://127.0.0.1:8765/sse"}
+"""
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, BinaryIO, Callable, Dict, Optional, Set
+from urllib.parse import parse_qs, urlsplit
+
+# 以脚本方式运行时也能导入项目内的模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm.stub_server import LatencyDistribution
+
+PROTOCOL_VERSION = "2024-11-05"
+
+Notify = Callable[[Dict[str, Any]], None]
+
+STUB_TOOLS = [
+    {
+        "name": "echo",
+        "description": "Echo the given text back",
+        "inputSchema": {"type": "object", "properties": {"text": {"type": "string"}}, "required": ["text"]},
+    },
+    {
+        "name": "add",
+        "description": "Add two numbers",
+        "inputSchema": {
+            "type": "object",
+            "properties": {"a": {"type": "number"}, "b": {"type": "number"}},
+            "required": ["a", "b"],
+        },
+    },
+    {
+        "name": "sleep",
+        "description": "Sleep for the given number of seconds, then report it",
+        "inputSchema": {"type": "object", "properties": {"seconds": {"type": "string"}}, "required": ["seconds"]},
+    },
+    {
+        "name": "fail",
+        "description": "Always fail with the given message",
+        "inputSchema": {"type": "object", "properties": {"message": {"type": "string"}}, "required": ["message"]},
+    },
+    {
+        "name": "stream",
+        "description": "Produce `count` lines, one every `interval` seconds, reporting each line as progress",
+        "inputSchema": {
+            "type": "object",
+            "properties": {"count": {"type": "integer"}, "interval": {"type": "number"}},
+        },
+    },
+]
+
+
+class MCPStubServer:
+    """
+    MCP 替身服务器（与传输无关的请求处理部分）
+    """
+
+    def __init__(self, latency: str = "fixed:0", seed: Optional[int] = None):
+        """
+        参数:
+            latency: 每次工具调用的额外延迟分布（格式同 llm.stub_server.LatencyDistribution）
+            seed: 随机种子
+        """
+        self.latency = LatencyDistribution(latency, seed=seed)
+        self._lock = threading.Lock()
+        self._cancelled: Set[Any] = set()
+        # 正在处理的请求 id；只记录针对它们的取消通知，迟到的取消不会影响之后复用同一 id 的请求
+        self._running: Set[Any] = set()
+        self.stats = {
+            "requests": 0, "tool_calls": 0, "cancelled": 0, "max_concurrent": 0,
+            "progress_sent": 0, "http_connections": 0, "disconnects": 0,
+        }
+        self._active = 0
+
+    def _is_cancelled(self, request_id: Any) -> bool:
+        with self._lock:
+            return request_id in self._cancelled
+
+    def _call_tool(
+        self,
+        name: str,
+        arguments: Dict[str, Any],
+        request_id: Any = None,
+        progress: Optional[Callable[[int, int, str], None]] = None
+    ) -> Dict[str, Any]:
+        delay = self.latency.sample()
+        if delay:
+            time.sleep(delay)
+        if name == "echo":
+            text = str(arguments.get("text", ""))
+        elif name == "add":
+            text = str(float(arguments["a"]) + float(arguments["b"]))
+        elif name == "sleep":
+            seconds = float(arguments["seconds"])
+            time.sleep(seconds)
+            text = f"slept {seconds:g}s"
+        elif name == "stream":
+            count = int(arguments.get("count", 5))
+            interval = float(arguments.get("interval", 0.05))
+            lines = []
+            for i in range(1, count + 1):
+                # 客户端取消或断开后不再继续产出
+                if self._is_cancelled(request_id):
+                    break
+                line = f"line {i}\n"
+                lines.append(line)
+                if progress is not None:
+                    progress(i, count, line)
+                if i < count:
+                    time.sleep(interval)
+            text = "".join(lines)
+        elif name == "fail":
+            return {"content": [{"type": "text", "text": str(arguments.get("message", "failed"))}], "isError": True}
+        else:
+            raise KeyError(name)
+        return {"content": [{"type": "text", "text": text}], "isError": False}
+
+    def handle(self, message: Dict[str, Any], notify: Optional[Notify] = None) -> Optional[Dict[str, Any]]:
+        """
+        处理一条 JSON-RPC 消息
+
+        参数:
+            message: JSON-RPC 消息
+            notify: 发送通知的函数；请求带 progressToken 时用它发送 notifications/progress
+
+        返回:
+            响应消息；通知或已取消的请求返回 None
+        """
+        method = message.get("method")
+        request_id = message.get("id")
+        params = message.get("params") or {}
+
+        if request_id is None:
+            if method == "notifications/cancelled":
+                with self._lock:
+                    if params.get("requestId") in self._running:
+                        self._cancelled.add(params.get("requestId"))
+            return None
+
+        with self._lock:
+            self.stats["requests"] += 1
+            self._active += 1
+            self._running.add(request_id)
+            self.stats["max_concurrent"] = max(self.stats["max_concurrent"], self._active)
+        try:
+            if method == "initialize":
+                result: Any = {
+                    "protocolVersion": PROTOCOL_VERSION,
+                    "capabilities": {"tools": {}},
+                    "serverInfo": {"name": "mcp-stub-server", "version": "0.1"},
+                }
+            elif method == "ping":
+                result = {}
+            elif method == "tools/list":
+                result = {"tools": STUB_TOOLS}
+            elif method == "tools/call":
+                with self._lock:
+                    self.stats["tool_calls"] += 1
+                token = (params.get("_meta") or {}).get("progressToken")
+                progress = None
+                if token is not None and notify is not None:
+                    def progress(done: int, total: int, text: str) -> None:
+                        notify({"jsonrpc": "2.0", "method": "notifications/progress", "params": {
+                            "progressToken": token, "progress": done, "total": total, "message": text,
+                        }})
+                        with self._lock:
+                            self.stats["progress_sent"] += 1
+                try:
+                    result = self._call_tool(
+                        params.get("name"), params.get("arguments") or {}, request_id, progress
+                    )
+                except KeyError as e:
+                    return _error(request_id, -32602, f"Unknown tool or missing argument: {e}")
+                except (TypeError, ValueError) as e:
+                    return _error(request_id, -32602, f"Invalid arguments: {e}")
+            else:
+                return _error(request_id, -32601, f"Method not found: {method}")
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._running.discard(request_id)
+                cancelled = request_id in self._cancelled
+                self._cancelled.discard(request_id)
+
+        if cancelled:
+            with self._lock:
+                self.stats["cancelled"] += 1
+            return None
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def serve_stdio(self, stdin: BinaryIO, stdout: BinaryIO, max_workers: int = 32) -> None:
+        """从 stdin 读取请求、并发处理，把响应写到 stdout，直到 stdin 关闭"""
+        write_lock = threading.Lock()
+
+        def send(message: Dict[str, Any]) -> None:
+            data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+            with write_lock:
+                stdout.write(data)
+                stdout.flush()
+
+        def respond(message: Dict[str, Any]) -> None:
+            response = self.handle(message, send)
+            if response is not None:
+                send(response)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for line in iter(stdin.readline, b""):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    with write_lock:
+                        stdout.write((json.dumps(_error(None, -32700, "Parse error")) + "\n").encode("utf-8"))
+                        stdout.flush()
+                    continue
+                if message.get("method") == "notifications/cancelled":
+                    # 取消通知立即处理，不排在慢请求后面
+                    self.handle(message)
+                else:
+                    pool.submit(respond, message)
+
+
+    def make_http_server(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        max_workers: int = 32,
+        idle_timeout: Optional[float] = None
+    ) -> "_StubHTTPServer":
+        """
+        创建 HTTP 服务器（调用方负责 serve_forever / shutdown）
+
+        参数:
+            port: 监听端口（0 表示随机端口，实际端口见 server_address）
+            idle_timeout: keep-alive 连接空闲多久后由服务器关闭（秒，None 表示不关闭），
+                          用于观察客户端对失效连接的重试
+        """
+        return _StubHTTPServer((host, port), self, max_workers, idle_timeout)
+
+
+def _error(request_id: Any, code: int, message: str) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, stub: MCPStubServer, max_workers: int, idle_timeout: Optional[float] = None):
+        super().__init__(address, _StubHTTPHandler)
+        self.stub = stub
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        # Streamable HTTP 会话，以及旧版 SSE 会话 id -> 待推送的消息队列
+        self.sessions: Set[str] = set()
+        self.sse_sessions: Dict[str, "queue.Queue[Optional[Dict[str, Any]]]"] = {}
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def server_close(self) -> None:
+        with self.lock:
+            for outbox in self.sse_sessions.values():
+                outbox.put(None)
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+class _StubHTTPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 头部和正文分两次写出，不关闭 Nagle 算法时会与客户端的延迟确认叠加出约 40ms 的延迟
+    disable_nagle_algorithm = True
+    server: _StubHTTPServer
+
+    def setup(self) -> None:
+        # StreamRequestHandler 用 timeout 设置套接字超时，空闲的 keep-alive 连接读超时后关闭
+        self.timeout = self.server.idle_timeout
+        super().setup()
+        with self.server.stub._lock:
+            self.server.stub.stats["http_connections"] += 1
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    # ---- 响应工具 ----
+
+    def _send_json(self, status: int, body: Any = None, headers: Optional[Dict[str, str]] = None) -> None:
+        data = b"" if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_event_stream(self, headers: Optional[Dict[str, str]] = None) -> None:
+        # 分块传输，流结束后连接仍可复用
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _write_event(self, message: Any, event: str = "message") -> None:
+        data = message if isinstance(message, str) else json.dumps(message, ensure_ascii=False)
+        self._write_chunk(f"event: {event}\ndata: {data}\n\n".encode("utf-8"))
+
+    def _read_json(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def _client_gone(self) -> None:
+        self.close_connection = True
+        with self.server.stub._lock:
+            self.server.stub.stats["disconnects"] += 1
+
+    # ---- Streamable HTTP ----
+
+    def do_POST(self) -> None:
+        parts = urlsplit(self.path)
+        if parts.path == "/messages":
+            self._post_legacy(parse_qs(parts.query).get("session_id", [""])[0])
+            return
+        if parts.path != "/mcp":
+            self._send_json(404)
+            return
+        try:
+            message = self._read_json()
+        except ValueError:
+            self._send_json(400, _error(None, -32700, "Parse error"))
+            return
+        stub = self.server.stub
+
+        headers: Dict[str, str] = {}
+        if message.get("method") == "initialize":
+            session_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.sessions.add(session_id)
+            headers["Mcp-Session-Id"] = session_id
+        else:
+            session_id = self.headers.get("Mcp-Session-Id")
+            if not session_id:
+                self._send_json(400, _error(message.get("id"), -32600, "Missing Mcp-Session-Id"))
+                return
+            with self.server.lock:
+                known = session_id in self.server.sessions
+            if not known:
+                self._send_json(404, _error(message.get("id"), -32600, "Unknown session"))
+                return
+
+        if "id" not in message:
+            stub.handle(message)
+            self._send_json(202)
+            return
+
+        params = message.get("params") or {}
+        wants_stream = (
+            "text/event-stream" in (self.headers.get("Accept") or "")
+            and (params.get("_meta") or {}).get("progressToken") is not None
+        )
+        if not wants_stream:
+            self._send_json(200, stub.handle(message), headers)
+            return
+
+        self._start_event_stream(headers)
+        try:
+            response = stub.handle(message, self._write_event)
+            if response is not None:
+                self._write_event(response)
+            self._write_chunk(b"")
+        except OSError:
+            # 客户端提前关闭了连接：写进度时失败，工具随之停止
+            self._client_gone()
+
+    def do_DELETE(self) -> None:
+        session_id = self.headers.get("Mcp-Session-Id")
+        with self.server.lock:
+            known = session_id in self.server.sessions
+            self.server.sessions.discard(session_id)
+        self._send_json(200 if known else 404)
+
+    # ---- 旧版 HTTP+SSE ----
+
+    def do_GET(self) -> None:
+        if urlsplit(self.path).path != "/sse":
+            self._send_json(404)
+            return
+        session_id = uuid.uuid4().hex
+        outbox: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        with self.server.lock:
+            self.server.sse_sessions[session_id] = outbox
+        self._start_event_stream()
+        try:
+            self._write_event(f"/messages?session_id={session_id}", event="endpoint")
+            while True:
+                try:
+                    message = outbox.get(timeout=15)
+                except queue.Empty:
+                    self._write_chunk(b": keep-alive\n\n")
+                    continue
+                if message is None:
+                    self._write_chunk(b"")
+                    break
+                self._write_event(message)
+        except OSError:
+            self._client_gone()
+        finally:
+            with self.server.lock:
+                self.server.sse_sessions.pop(session_id, None)
+        self.close_connection = True
+
+    def _post_legacy(self, session_id: str) -> None:
+        with self.server.lock:
+            outbox = self.server.sse_sessions.get(session_id)
+        if outbox is None:
+            self._send_json(404)
+            return
+        try:
+            message = self._read_json()
+        except ValueError:
+            self._send_json(400)
+            return
+        stub = self.server.stub
+        if "id" not in message:
+            stub.handle(message, outbox.put)
+        else:
+            def respond() -> None:
+                response = stub.handle(message, outbox.put)
+                if response is not None:
+                    outbox.put(response)
+            self.server.pool.submit(respond)
+        self._send_json(202)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 MCP 替身服务器")
+    parser.add_argument("--latency", default="fixed:0", help="每次工具调用的额外延迟分布，如 uniform:0.05,0.2")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--http", action="store_true", help="以 HTTP 方式提供服务（默认 stdio）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--idle-timeout", type=float, default=None, help="关闭空闲 keep-alive 连接的时间（秒）")
+    args = parser.parse_args()
+
+    server = MCPStubServer(latency=args.latency, seed=args.seed)
+    if not args.http:
+        print("[MCP Stub] serving on stdio", file=sys.stderr)
+        server.serve_stdio(sys.stdin.buffer, sys.stdout.buffer)
+        return
+
+    httpd = server.make_http_server(args.host, args.port, idle_timeout=args.idle_timeout)
+    host, port = httpd.server_address[:2]
+    print(f"[MCP Stub] serving on http://{host}:{port}/mcp (legacy SSE: /sse)", file=sys.stderr)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
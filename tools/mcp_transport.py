@@ -0,0 +1,833 @@
+"""
+MCP 传输层 - JSON-RPC 2.0
+
+- StdioTransport: 启动一次 MCP 服务器子进程并保持运行，每行一条 JSON-RPC 消息。
+  专用读线程按 id 把响应分发给等待中的请求，因此同一条管道上可以同时有多个请求在途（流水线），
+  响应可以乱序返回。请求超时后会发送 notifications/cancelled 通知服务器放弃该请求。
+- HTTPTransport: Streamable HTTP。每个请求 POST 到服务器端点，服务器返回 JSON 或 SSE 事件流
+  （流中可以先发送进度通知再发送响应）。连接来自按服务器划分的 keep-alive 连接池，限制并发连接数。
+- SSETransport: 旧版 HTTP+SSE。GET 建立一条长期的事件流，服务器通过 "endpoint" 事件告知 POST 地址，
+  所有响应都从事件流返回，与 stdio 一样由读线程按 id 分发。
+
+request_stream() 在请求中附带 progressToken，逐个产出服务器的进度通知 ("progress", params)，
+最后产出 ("result", result)；调用方提前关闭生成器时会通知服务器取消该请求。
+
+用法:
+    transport = StdioTransport("python", ["-m", "tools.mcp_stub_server"])
+    transport.start()
+    result = transport.request("tools/list", {})
+    transport.close()
+"""
+
+import http.client
+import itertools
+import json
+import os
+import queue
+import socket
+import subprocess
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+StreamItem = Tuple[str, Any]
+
+
+class MCPError(Exception):
+    """MCP 调用失败（服务器返回的 JSON-RPC 错误或工具错误）"""
+
+    def __init__(self, message: str, code: Optional[int] = None, data: Any = None):
+        super().__init__(message)
+        self.code = code
+        self.data = data
+
+
+class MCPConnectionError(MCPError):
+    """与 MCP 服务器的连接不可用或已断开"""
+
+
+class MCPTimeoutError(MCPError):
+    """MCP 请求超时"""
+
+
+class MCPToolError(MCPError):
+    """工具执行完成但报告了错误（tools/call 结果中 isError 为 true），服务器本身正常"""
+
+
+class MCPTransport:
+    """
+    传输层接口：发送 JSON-RPC 请求和通知
+    """
+
+    def start(self) -> None:
+        raise NotImplementedError
+
+    def request(self, method: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> Any:
+        """发送请求并等待结果；服务器返回错误时抛出 MCPError"""
+        for kind, payload in self.request_stream(method, params, timeout, progress=False):
+            if kind == "result":
+                return payload
+        raise MCPConnectionError(f"MCP 请求 {method} 没有收到响应")
+
+    def request_stream(
+        self,
+        method: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        progress: bool = True
+    ) -> Iterator[StreamItem]:
+        """
+        发送请求，逐个产出 ("progress", 通知参数)，最后产出 ("result", 结果)
+
+        参数:
+            progress: 是否请求进度通知（在 params._meta 中附带 progressToken）
+        """
+        raise NotImplementedError
+
+    def notify(self, method: str, params: Optional[Dict[str, Any]] = None) -> None:
+        """发送通知（无响应）"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    @property
+    def connected(self) -> bool:
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {}
+
+
+def _error_from_response(error: Dict[str, Any]) -> MCPError:
+    return MCPError(
+        f"[{error.get('code')}] {error.get('message', 'unknown error')}",
+        code=error.get("code"),
+        data=error.get("data")
+    )
+
+
+def _build_request(request_id: int, method: str, params: Optional[Dict[str, Any]], progress: bool) -> Dict[str, Any]:
+    message: Dict[str, Any] = {"jsonrpc": "2.0", "id": request_id, "method": method}
+    if progress:
+        params = dict(params or {})
+        meta = dict(params.get("_meta") or {})
+        # 用请求 id 作为 progressToken，进度通知可以直接按 id 分发
+        meta["progressToken"] = request_id
+        params["_meta"] = meta
+    if params is not None:
+        message["params"] = params
+    return message
+
+
+def _encode(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class _MultiplexedTransport(MCPTransport):
+    """
+    在一条长连接上收发消息的传输（stdio / 旧版 SSE）：读线程调用 _dispatch 按 id 把消息放入对应请求的队列
+
+    子类实现 _send(message)，并在连接断开时调用 _fail_pending。
+    """
+
+    def __init__(self, timeout: float = 30.0, name: str = "mcp"):
+        self.timeout = timeout
+        self.name = name
+        self._pending_lock = threading.Lock()
+        self._pending: Dict[int, "queue.Queue[StreamItem]"] = {}
+        self._ids = itertools.count(1)
+        self._closed = False
+        self.stats = {"requests": 0, "errors": 0, "timeouts": 0, "cancelled": 0, "max_in_flight": 0}
+
+    def _send(self, message: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        method = message.get("method")
+        if method is not None:
+            if "id" in message:
+                # 服务器发来的请求：只支持 ping，其余回复 "方法不存在"
+                if method == "ping":
+                    reply: Dict[str, Any] = {"jsonrpc": "2.0", "id": message["id"], "result": {}}
+                else:
+                    reply = {"jsonrpc": "2.0", "id": message["id"], "error": {
+                        "code": -32601, "message": f"Method not found: {method}"
+                    }}
+                try:
+                    self._send(reply)
+                except MCPConnectionError:
+                    pass
+            elif method == "notifications/progress":
+                params = message.get("params") or {}
+                with self._pending_lock:
+                    target = self._pending.get(params.get("progressToken"))
+                if target is not None:
+                    target.put(("progress", params))
+            return
+
+        with self._pending_lock:
+            target = self._pending.get(message.get("id"))
+        # 找不到说明是已超时或已取消的请求的迟到响应
+        if target is not None:
+            target.put(("response", message))
+
+    def _fail_pending(self, error: MCPError) -> None:
+        with self._pending_lock:
+            pending = list(self._pending.values())
+        for target in pending:
+            target.put(("error", error))
+
+    def notify(self, method: str, params: Optional[Dict[str, Any]] = None) -> None:
+        message: Dict[str, Any] = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        self._send(message)
+
+    def _cancel(self, request_id: int, reason: str) -> None:
+        try:
+            self.notify("notifications/cancelled", {"requestId": request_id, "reason": reason})
+        except MCPConnectionError:
+            pass
+
+    def request_stream(
+        self,
+        method: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        progress: bool = True
+    ) -> Iterator[StreamItem]:
+        request_id = next(self._ids)
+        inbox: "queue.Queue[StreamItem]" = queue.Queue()
+        with self._pending_lock:
+            self._pending[request_id] = inbox
+            self.stats["requests"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], len(self._pending))
+
+        deadline = time.monotonic() + (timeout if timeout is not None else self.timeout)
+        finished = False
+        try:
+            self._send(_build_request(request_id, method, params, progress))
+            while True:
+                try:
+                    kind, payload = inbox.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    with self._pending_lock:
+                        self.stats["timeouts"] += 1
+                    self._cancel(request_id, "timeout")
+                    finished = True
+                    raise MCPTimeoutError(f"MCP 请求 {method} 超时") from None
+                if kind == "progress":
+                    yield kind, payload
+                    continue
+                finished = True
+                if kind == "error":
+                    raise payload
+                if "error" in payload:
+                    raise _error_from_response(payload["error"])
+                yield "result", payload.get("result")
+                return
+        except MCPError:
+            with self._pending_lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            if not finished:
+                # 调用方提前关闭了生成器（如输出已达到预算），通知服务器不必继续
+                with self._pending_lock:
+                    self.stats["cancelled"] += 1
+                self._cancel(request_id, "client closed stream")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            stats = dict(self.stats)
+            stats["in_flight"] = len(self._pending)
+        stats["connected"] = self.connected
+        return stats
+
+
+class StdioTransport(_MultiplexedTransport):
+    """
+    基于子进程 stdin/stdout 的 JSON-RPC 传输（线程安全）
+    """
+
+    def __init__(
+        self,
+        command: str,
+        args: Optional[List[str]] = None,
+        env: Optional[Dict[str, str]] = None,
+        cwd: Optional[str] = None,
+        timeout: float = 30.0,
+        name: str = "mcp"
+    ):
+        """
+        参数:
+            command: 服务器启动命令
+            args: 命令参数
+            env: 追加的环境变量（在当前进程环境变量基础上覆盖）
+            cwd: 工作目录
+            timeout: 默认请求超时（秒）
+            name: 服务器名称（用于日志和线程名）
+        """
+        super().__init__(timeout=timeout, name=name)
+        self.command = command
+        self.args = list(args or [])
+        self.env = env or {}
+        self.cwd = cwd
+
+        self._process: Optional[subprocess.Popen] = None
+        # 读线程读到 EOF（服务器已关闭 stdout 或退出）；此时进程可能还没被回收，poll() 仍返回 None
+        self._eof = False
+        self._write_lock = threading.Lock()
+        # 服务器 stderr 的最后几行，连接断开时附在错误信息中
+        self._stderr_tail: deque = deque(maxlen=20)
+
+    # ---- 生命周期 ----
+
+    def start(self) -> None:
+        if self._process is not None:
+            return
+        env = dict(os.environ)
+        env.update(self.env)
+        # 找不到命令时 Popen 抛出 FileNotFoundError，由调用方处理
+        self._process = subprocess.Popen(
+            [self.command] + self.args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            cwd=self.cwd,
+            bufsize=0
+        )
+        threading.Thread(target=self._read_loop, name=f"mcp-{self.name}-reader", daemon=True).start()
+        threading.Thread(target=self._stderr_loop, name=f"mcp-{self.name}-stderr", daemon=True).start()
+
+    @property
+    def connected(self) -> bool:
+        return self._process is not None and not self._eof and not self._closed and self._process.poll() is None
+
+    def close(self, timeout: float = 2.0) -> None:
+        """关闭 stdin 让服务器自行退出，超时后终止进程"""
+        self._closed = True
+        process = self._process
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.terminate()
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self._fail_pending(MCPConnectionError(f"MCP 服务器 {self.name} 的连接已关闭"))
+
+    # ---- 读线程 ----
+
+    def _read_loop(self) -> None:
+        stdout = self._process.stdout
+        for line in iter(stdout.readline, b""):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                # 有些服务器会往 stdout 打印日志，忽略非 JSON 行
+                continue
+            if isinstance(message, list):
+                for item in message:
+                    self._dispatch(item)
+            else:
+                self._dispatch(message)
+
+        self._eof = True
+        detail = " | ".join(self._stderr_tail)
+        self._fail_pending(MCPConnectionError(
+            f"MCP 服务器 {self.name} 已退出" + (f": {detail}" if detail else "")
+        ))
+
+    def _stderr_loop(self) -> None:
+        for line in iter(self._process.stderr.readline, b""):
+            self._stderr_tail.append(line.decode("utf-8", "replace").rstrip())
+
+    # ---- 发送 ----
+
+    def _send(self, message: Dict[str, Any]) -> None:
+        data = _encode(message) + b"\n"
+        with self._write_lock:
+            if not self.connected:
+                raise MCPConnectionError(f"MCP 服务器 {self.name} 未连接")
+            try:
+                self._process.stdin.write(data)
+                self._process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                raise MCPConnectionError(f"写入 MCP 服务器 {self.name} 失败: {e}") from e
+
+
+# ----------------------------------------------------------------------
+# HTTP
+# ----------------------------------------------------------------------
+
+# keep-alive 连接被服务器关闭后第一次使用时的典型异常，可以换一条新连接重试
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class HTTPConnectionPool:
+    """
+    单个服务器的 keep-alive 连接池（线程安全）
+
+    最多同时使用 max_connections 条连接，超出时等待空闲连接；
+    响应读完且服务器没有要求关闭的连接会放回池中复用。
+    """
+
+    def __init__(self, url: str, max_connections: int = 4, timeout: float = 30.0):
+        """
+        参数:
+            url: 服务器地址（只使用协议、主机和端口）
+            max_connections: 最大并发连接数
+            timeout: 建立连接和每次读取的超时（秒），也是等待空闲连接的最长时间
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"不支持的 URL: {url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.max_connections = max_connections
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._lock = threading.Lock()
+        self._idle: List[http.client.HTTPConnection] = []
+        self._in_use = 0
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "waits": 0, "max_in_use": 0}
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        取得一条连接
+
+        返回:
+            (连接, 是否为复用的连接)
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats["waits"] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                raise MCPTimeoutError(f"等待 {self.host} 的空闲连接超时（最多 {self.max_connections} 条）")
+        with self._lock:
+            self._in_use += 1
+            self.stats["max_in_use"] = max(self.stats["max_in_use"], self._in_use)
+            if self._idle:
+                self.stats["reused"] += 1
+                return self._idle.pop(), True
+            self.stats["created"] += 1
+        return self._new_connection(), False
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool) -> None:
+        """归还连接；不可复用的连接直接关闭"""
+        with self._lock:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append(conn)
+            else:
+                self.stats["discarded"] += 1
+        if not reusable:
+            conn.close()
+        self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["in_use"] = self._in_use
+            stats["idle"] = len(self._idle)
+        stats["max_connections"] = self.max_connections
+        return stats
+
+
+def _iter_sse(response: http.client.HTTPResponse) -> Iterator[Tuple[str, str]]:
+    """解析 SSE 事件流，逐个产出 (事件类型, 数据)"""
+    event, data = "message", []
+    for raw in iter(response.readline, b""):
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue
+        else:
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+    if data:
+        yield event, "\n".join(data)
+
+
+class HTTPTransport(MCPTransport):
+    """
+    Streamable HTTP 传输（线程安全）
+
+    每个请求占用池中的一条连接直到响应读完，因此 max_connections 就是该服务器的最大并发请求数。
+    服务器在 initialize 响应中返回 Mcp-Session-Id 时，后续请求都会带上它。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 30.0,
+        max_connections: int = 4,
+        name: str = "mcp"
+    ):
+        """
+        参数:
+            url: MCP 端点地址（如 http://127.0.0.1:8765/mcp）
+            headers: 额外的请求头（如 Authorization）
+            timeout: 请求超时（秒）
+            max_connections: 该服务器的最大并发连接数
+            name: 服务器名称
+        """
+        self.url = url
+        parts = urlsplit(url)
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.name = name
+        self.pool = HTTPConnectionPool(url, max_connections=max_connections, timeout=timeout)
+        self.session_id: Optional[str] = None
+        self.protocol_version: Optional[str] = None
+
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"requests": 0, "errors": 0, "timeouts": 0, "cancelled": 0, "streamed": 0}
+
+    def start(self) -> None:
+        # 连接在第一次请求时按需建立
+        self._closed = False
+
+    @property
+    def connected(self) -> bool:
+        return not self._closed
+
+    def _request_headers(self) -> Dict[str, str]:
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json, text/event-stream",
+        }
+        if self.session_id:
+            headers["Mcp-Session-Id"] = self.session_id
+        if self.protocol_version:
+            headers["MCP-Protocol-Version"] = self.protocol_version
+        headers.update(self.headers)
+        return headers
+
+    def _open(
+        self,
+        http_method: str,
+        body: Optional[bytes],
+        timeout: Optional[float] = None
+    ) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        """发送 HTTP 请求；复用的连接已被服务器关闭时换一条新连接重试一次"""
+        if self._closed:
+            raise MCPConnectionError(f"MCP 服务器 {self.name} 的连接已关闭")
+        timeout = timeout if timeout is not None else self.timeout
+        for attempt in range(2):
+            conn, reused = self.pool.acquire()
+            # 每个请求可以有自己的超时，作用于连接和每次读取
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            try:
+                conn.request(http_method, self.path, body=body, headers=self._request_headers())
+                return conn, conn.getresponse()
+            except _STALE_CONNECTION_ERRORS as e:
+                self.pool.release(conn, False)
+                if reused and attempt == 0:
+                    continue
+                raise MCPConnectionError(f"连接 MCP 服务器 {self.name} 失败: {e}") from e
+            except TimeoutError as e:
+                self.pool.release(conn, False)
+                raise MCPTimeoutError(f"MCP 服务器 {self.name} 响应超时") from e
+            except (OSError, http.client.HTTPException) as e:
+                self.pool.release(conn, False)
+                raise MCPConnectionError(f"连接 MCP 服务器 {self.name} 失败: {e}") from e
+        raise MCPConnectionError(f"连接 MCP 服务器 {self.name} 失败")
+
+    def _check_status(self, response: http.client.HTTPResponse) -> None:
+        if response.status == 404 and self.session_id:
+            raise MCPConnectionError(f"MCP 服务器 {self.name} 的会话已失效")
+        if response.status >= 400:
+            detail = response.read(500).decode("utf-8", "replace")
+            raise MCPError(f"HTTP {response.status}: {detail}", code=response.status)
+
+    def notify(self, method: str, params: Optional[Dict[str, Any]] = None) -> None:
+        message: Dict[str, Any] = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        conn, response = self._open("POST", _encode(message))
+        reusable = False
+        try:
+            self._check_status(response)
+            response.read()
+            reusable = not response.will_close
+        finally:
+            self.pool.release(conn, reusable)
+
+    def request_stream(
+        self,
+        method: str,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        progress: bool = True
+    ) -> Iterator[StreamItem]:
+        request_id = next(self._ids)
+        with self._lock:
+            self.stats["requests"] += 1
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = time.monotonic() + timeout
+
+        try:
+            conn, response = self._open("POST", _encode(_build_request(request_id, method, params, progress)), timeout)
+        except MCPError:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+
+        reusable = False
+        # 请求没有正常结束时通知服务器取消的原因（None 表示不需要取消）
+        cancel_reason: Optional[str] = "client closed stream"
+        try:
+            self._check_status(response)
+            session_id = response.getheader("Mcp-Session-Id")
+            if session_id:
+                self.session_id = session_id
+
+            content_type = response.getheader("Content-Type", "")
+            if content_type.startswith("text/event-stream"):
+                with self._lock:
+                    self.stats["streamed"] += 1
+                messages = (json.loads(data) for event, data in _iter_sse(response) if event == "message")
+            else:
+                body = json.loads(response.read() or b"null")
+                messages = iter(body if isinstance(body, list) else [body])
+
+            for message in messages:
+                if time.monotonic() > deadline:
+                    raise TimeoutError
+                if not isinstance(message, dict):
+                    continue
+                if message.get("method") == "notifications/progress":
+                    yield "progress", message.get("params") or {}
+                    continue
+                if message.get("id") != request_id:
+                    continue
+                cancel_reason = None
+                if "error" in message:
+                    raise _error_from_response(message["error"])
+                result = message.get("result")
+                # 读完剩余的流，连接才能复用
+                for _ in messages:
+                    pass
+                reusable = not response.will_close
+                yield "result", result
+                return
+            cancel_reason = None
+            raise MCPConnectionError(f"MCP 服务器 {self.name} 没有返回请求 {method} 的响应")
+        except TimeoutError as e:
+            cancel_reason = "timeout"
+            with self._lock:
+                self.stats["timeouts"] += 1
+            raise MCPTimeoutError(f"MCP 请求 {method} 超时") from e
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            cancel_reason = None
+            with self._lock:
+                self.stats["errors"] += 1
+            raise MCPConnectionError(f"读取 MCP 服务器 {self.name} 的响应失败: {e}") from e
+        except MCPError:
+            cancel_reason = None
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            # 没有读完的连接不能复用，关闭它也让服务器停止推送
+            self.pool.release(conn, reusable)
+            if cancel_reason is not None:
+                if cancel_reason != "timeout":
+                    with self._lock:
+                        self.stats["cancelled"] += 1
+                try:
+                    self.notify("notifications/cancelled", {"requestId": request_id, "reason": cancel_reason})
+                except MCPError:
+                    pass
+
+    def close(self) -> None:
+        """结束会话（尽力而为）并关闭连接池"""
+        if self._closed:
+            return
+        if self.session_id:
+            try:
+                conn, response = self._open("DELETE", None)
+                response.read()
+                self.pool.release(conn, False)
+            except MCPError:
+                pass
+        self._closed = True
+        self.pool.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["pool"] = self.pool.get_stats()
+        stats["connected"] = self.connected
+        return stats
+
+
+class SSETransport(_MultiplexedTransport):
+    """
+    旧版 HTTP+SSE 传输：一条 GET 事件流接收所有消息，请求通过连接池 POST 到服务器告知的端点
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 30.0,
+        max_connections: int = 4,
+        name: str = "mcp"
+    ):
+        """
+        参数:
+            url: 事件流地址（如 http://127.0.0.1:8765/sse）
+            headers: 额外的请求头
+            timeout: 请求超时（秒）
+            max_connections: POST 请求的最大并发连接数
+            name: 服务器名称
+        """
+        super().__init__(timeout=timeout, name=name)
+        self.url = url
+        self.headers = headers or {}
+        self.pool = HTTPConnectionPool(url, max_connections=max_connections, timeout=timeout)
+        self.endpoint: Optional[str] = None
+
+        self._stream_conn: Optional[http.client.HTTPConnection] = None
+        self._endpoint_ready = threading.Event()
+        self._stream_alive = False
+
+    def start(self) -> None:
+        if self._stream_conn is not None:
+            return
+        parts = urlsplit(self.url)
+        conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        # 事件流长期空闲，不设读超时
+        self._stream_conn = conn_cls(parts.hostname, parts.port, timeout=self.timeout)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        headers = {"Accept": "text/event-stream"}
+        headers.update(self.headers)
+        try:
+            self._stream_conn.request("GET", path, headers=headers)
+            response = self._stream_conn.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            raise MCPConnectionError(f"连接 MCP 服务器 {self.name} 失败: {e}") from e
+        if response.status != 200:
+            raise MCPConnectionError(f"MCP 服务器 {self.name} 拒绝建立事件流: HTTP {response.status}")
+        self._stream_conn.sock.settimeout(None)
+        self._stream_alive = True
+        threading.Thread(target=self._read_loop, args=(response,), name=f"mcp-{self.name}-sse", daemon=True).start()
+        if not self._endpoint_ready.wait(self.timeout) or self.endpoint is None:
+            self.close()
+            raise MCPConnectionError(f"MCP 服务器 {self.name} 没有发送 endpoint 事件")
+
+    @property
+    def connected(self) -> bool:
+        return self._stream_alive and not self._closed
+
+    def _read_loop(self, response: http.client.HTTPResponse) -> None:
+        try:
+            for event, data in _iter_sse(response):
+                if event == "endpoint":
+                    self.endpoint = urljoin(self.url, data.strip())
+                    self._endpoint_ready.set()
+                elif event == "message":
+                    try:
+                        message = json.loads(data)
+                    except ValueError:
+                        continue
+                    for item in message if isinstance(message, list) else [message]:
+                        self._dispatch(item)
+        except (OSError, http.client.HTTPException, ValueError):
+            pass
+        finally:
+            self._stream_conn.close()
+        self._stream_alive = False
+        self._endpoint_ready.set()
+        self._fail_pending(MCPConnectionError(f"MCP 服务器 {self.name} 的事件流已断开"))
+
+    def _send(self, message: Dict[str, Any]) -> None:
+        if not self.connected or self.endpoint is None:
+            raise MCPConnectionError(f"MCP 服务器 {self.name} 未连接")
+        parts = urlsplit(self.endpoint)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        headers = {"Content-Type": "application/json"}
+        headers.update(self.headers)
+        body = _encode(message)
+        for attempt in range(2):
+            conn, reused = self.pool.acquire()
+            reusable = False
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                reusable = not response.will_close
+            except _STALE_CONNECTION_ERRORS as e:
+                if reused and attempt == 0:
+                    continue
+                raise MCPConnectionError(f"发送到 MCP 服务器 {self.name} 失败: {e}") from e
+            except (OSError, http.client.HTTPException) as e:
+                raise MCPConnectionError(f"发送到 MCP 服务器 {self.name} 失败: {e}") from e
+            finally:
+                self.pool.release(conn, reusable)
+            if response.status >= 400:
+                raise MCPError(f"HTTP {response.status}", code=response.status)
+            return
+
+    def close(self) -> None:
+        self._closed = True
+        sock = self._stream_conn.sock if self._stream_conn is not None else None
+        if sock is not None:
+            # 只关闭套接字的读写，读线程读到 EOF 后自行关闭连接（避免两个线程同时操作同一个响应对象）
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.pool.close()
+        self._fail_pending(MCPConnectionError(f"MCP 服务器 {self.name} 的连接已关闭"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats["pool"] = self.pool.get_stats()
+        return stats
@@ -1,5 +1,152 @@
-from typing import Dict, List, Optional, Type
-from .base import BaseTool
+import importlib
+import threading
+import time
+import weakref
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple, Type, Union
+from .base import BaseTool, ToolMetadata
+from .cache import CachePolicy, ToolResultCache
+from .catalog import BUILTIN_TOOLS
+from .resilience import CircuitBreaker, ToolGuard
+
+# 观察结果超出预算被截断时追加的提示
+TRUNCATION_NOTICE = "\n...[输出已截断]"
+
+# 工厂可以是可调用对象，也可以是 "模块路径:属性名" 形式的导入路径
+ToolFactory = Union[Callable[..., BaseTool], str]
+
+
+def import_from_path(path: str) -> Any:
+    """按 "package.module:Attr" 导入对象"""
+    module_name, _, attr = path.partition(":")
+    if not attr:
+        raise ValueError(f"导入路径格式应为 'module:Attr'，得到: {path}")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class LazyTool(BaseTool):
+    """
+    延迟实例化的工具代理
+    
+    注册时只保存名称、描述和工厂；第一次执行（或通过 get_tool 获取）时才导入模块并构造真实工具。
+    元数据和缓存策略可以在注册时提供，否则在首次访问时实例化真实工具来读取。
+    实例化后描述与注册时不同时调用 on_description_change，注册器据此发布新快照。
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        factory: ToolFactory,
+        args: Tuple = (),
+        kwargs: Optional[Dict[str, Any]] = None,
+        metadata: Optional[ToolMetadata] = None,
+        cache_policy: Optional[CachePolicy] = None
+    ):
+        super().__init__(name=name, description=description)
+        self._factory = factory
+        self._args = args
+        self._kwargs = kwargs or {}
+        self._metadata = metadata
+        self._cache_policy = cache_policy
+        self._instance: Optional[BaseTool] = None
+        self._lock = threading.Lock()
+        self.load_time: Optional[float] = None
+        self.on_description_change: Optional[Callable[["LazyTool"], None]] = None
+    
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+    
+    def materialize(self) -> BaseTool:
+        """导入并构造真实工具（线程安全，只执行一次）"""
+        if self._instance is not None:
+            return self._instance
+        changed = False
+        with self._lock:
+            if self._instance is None:
+                start = time.perf_counter()
+                factory = import_from_path(self._factory) if isinstance(self._factory, str) else self._factory
+                instance = factory(*self._args, **self._kwargs)
+                self.load_time = time.perf_counter() - start
+                changed = instance.description != self.description
+                self.description = instance.description
+                self._instance = instance
+                print(f"[Registry] Loaded lazy tool: {self.name} ({self.load_time * 1000:.1f}ms)")
+        if changed and self.on_description_change is not None:
+            self.on_description_change(self)
+        return self._instance
+    
+    @property
+    def metadata(self) -> ToolMetadata:
+        if self._metadata is not None and self._instance is None:
+            return self._metadata
+        return self.materialize().metadata
+    
+    @property
+    def cache_policy(self) -> CachePolicy:
+        if self._cache_policy is not None and self._instance is None:
+            return self._cache_policy
+        return self.materialize().cache_policy
+    
+    def run(self, query: str) -> str:
+        return self.materialize().run(query)
+    
+    def run_stream(self, query: str) -> Iterator[str]:
+        return self.materialize().run_stream(query)
+    
+    @property
+    def supports_streaming(self) -> bool:
+        return self.materialize().supports_streaming
+    
+    def normalize_query(self, query: str) -> str:
+        return self.materialize().normalize_query(query)
+    
+    def is_cacheable(self, result: str) -> bool:
+        return self.materialize().is_cacheable(result)
+    
+    def is_error(self, result: str) -> bool:
+        return self.materialize().is_error(result)
+
+
+class ToolSnapshot:
+    """
+    工具集合的不可变快照
+    
+    注册器每次变更都会发布一个新快照（版本号加一）。读取方拿到快照后可以无锁地反复查找，
+    整个 ReAct 循环看到的是同一份一致的工具集合。
+    """
+    
+    __slots__ = ("version", "tools")
+    
+    def __init__(self, version: int, tools: Dict[str, BaseTool]):
+        self.version = version
+        self.tools: Mapping[str, BaseTool] = MappingProxyType(tools)
+    
+    def get(self, name: str) -> Optional[BaseTool]:
+        return self.tools.get(name)
+    
+    def names(self) -> List[str]:
+        return list(self.tools)
+    
+    def values(self) -> List[BaseTool]:
+        return list(self.tools.values())
+    
+    def __contains__(self, name: object) -> bool:
+        return name in self.tools
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.tools)
+    
+    def __len__(self) -> int:
+        return len(self.tools)
+    
+    def __repr__(self) -> str:
+        return f"ToolSnapshot(version={self.version}, tools={list(self.tools)})"
+
+
+SnapshotListener = Callable[[ToolSnapshot], None]
+
 
 class ToolRegistry:
     """
@@ -7,38 +154,215 @@ class ToolRegistry:
     
     功能:
     - 注册工具实例或类
+    - 延迟注册：首次使用时才导入模块并构造工具
     - 通过装饰器自动注册工具
     - 获取所有可用工具
     - 按名称查找工具
+    - 按工具声明的缓存策略缓存执行结果
+    - 按元数据（延迟、纯函数、副作用等）查询工具
+    - 执行隔离：每个工具独立的硬超时、并发舱壁和熔断器
+    
+    线程安全：写操作（注册/注销）在锁内复制工具表并发布新的不可变快照 (copy-on-write)；
+    读操作只读取当前快照的引用，不加锁。订阅者在每次发布新版本后收到通知。
     """
     
-    def __init__(self):
-        self._tools: Dict[str, BaseTool] = {}
+    # 延迟 SLO 的下限（秒），避免极快的工具因偶发抖动（如首次导入）被计为慢调用
+    MIN_LATENCY_SLO = 1.0
+    # 预期耗时不超过该值（秒）且没有声明 timeout 的工具直接在调用线程中执行，不经过工作线程
+    INLINE_LATENCY = 0.05
+    
+    def __init__(
+        self,
+        cache_size: int = 256,
+        default_timeout: Optional[float] = 30.0,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        slow_call_factor: float = 5.0
+    ):
+        """
+        参数:
+            cache_size: 工具结果缓存的最大条目数（0 表示禁用缓存）
+            default_timeout: 工具未声明 timeout 时的硬超时（秒），None 表示不设超时
+            failure_threshold: 熔断器连续失败多少次后打开
+            recovery_timeout: 熔断器打开后多久尝试恢复（秒）
+            slow_call_factor: 延迟 SLO = 预期耗时 * 该系数，超过的调用计为失败
+        """
+        self._snapshot = ToolSnapshot(0, {})
+        self._write_lock = threading.RLock()
+        self._listeners: List[Any] = []
         self._tool_classes: Dict[str, Type[BaseTool]] = {}
+        self.cache = ToolResultCache(max_entries=cache_size)
+        
+        self.default_timeout = default_timeout
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.slow_call_factor = slow_call_factor
+        self._guards: Dict[str, ToolGuard] = {}
+        self._guards_lock = threading.Lock()
+    
+    @property
+    def _tools(self) -> Mapping[str, BaseTool]:
+        """当前快照的只读工具表"""
+        return self._snapshot.tools
+    
+    @property
+    def version(self) -> int:
+        """当前快照的版本号，每次变更加一"""
+        return self._snapshot.version
+    
+    def snapshot(self) -> ToolSnapshot:
+        """获取当前的不可变快照（无锁）"""
+        return self._snapshot
+    
+    def subscribe(self, listener: SnapshotListener) -> Callable[[], None]:
+        """
+        订阅工具集合的变更
+        
+        参数:
+            listener: 每次发布新快照后以快照为参数调用（在写锁内同步调用，应尽快返回）；
+                      绑定方法以弱引用保存，对象被回收后自动取消订阅
+        
+        返回:
+            取消订阅的函数
+        """
+        ref = weakref.WeakMethod(listener) if hasattr(listener, "__self__") else (lambda: listener)
+        with self._write_lock:
+            self._listeners.append(ref)
+        
+        def unsubscribe() -> None:
+            with self._write_lock:
+                if ref in self._listeners:
+                    self._listeners.remove(ref)
+        
+        return unsubscribe
+    
+    def _publish(self, tools: Dict[str, BaseTool]) -> ToolSnapshot:
+        """发布新快照并通知订阅者（调用方持有写锁）"""
+        snapshot = ToolSnapshot(self._snapshot.version + 1, tools)
+        self._snapshot = snapshot
+        
+        alive = []
+        for ref in self._listeners:
+            listener = ref()
+            if listener is None:
+                continue
+            alive.append(ref)
+            listener(snapshot)
+        self._listeners = alive
+        return snapshot
+    
+    def _add_tools(self, tools: List[BaseTool]) -> None:
+        with self._write_lock:
+            updated = dict(self._snapshot.tools)
+            for tool in tools:
+                if tool.name in updated:
+                    print(f"Warning: Tool '{tool.name}' already exists. Overwriting.")
+                    self.cache.invalidate(tool.name)
+                    self._guards.pop(tool.name, None)
+                updated[tool.name] = tool
+            self._publish(updated)
+        for tool in tools:
+            print(f"[Registry] Registered tool: {tool.name}")
     
     def register(self, tool: BaseTool) -> None:
         """注册一个工具实例"""
-        if tool.name in self._tools:
-            print(f"Warning: Tool '{tool.name}' already exists. Overwriting.")
-        self._tools[tool.name] = tool
-        print(f"[Registry] Registered tool: {tool.name}")
-    
-    def register_class(self, tool_class: Type[BaseTool]) -> None:
-        """注册一个工具类（用于延迟实例化）"""
-        # 创建临时实例以获取名称
-        temp_instance = tool_class()
-        name = temp_instance.name
-        self._tool_classes[name] = tool_class
-        print(f"[Registry] Registered tool class: {name}")
+        self._add_tools([tool])
+    
+    def register_lazy(
+        self,
+        name: str,
+        description: str,
+        factory: ToolFactory,
+        *args: Any,
+        metadata: Optional[ToolMetadata] = None,
+        cache_policy: Optional[CachePolicy] = None,
+        **kwargs: Any
+    ) -> LazyTool:
+        """
+        延迟注册一个工具：首次 get_tool / run 时才导入模块并构造
+        
+        参数:
+            name: 工具名称
+            description: 工具描述（用于提示词，无需导入即可使用）
+            factory: 工具类、返回工具实例的函数，或 "module:Class" 导入路径
+            *args, **kwargs: 传给工厂的参数
+            metadata: 可选的元数据（提供后查询元数据不会触发实例化）
+            cache_policy: 可选的缓存策略
+        
+        用法:
+            registry.register_lazy("DateTime", "获取当前日期时间", "tools.datetime_tool:DateTimeTool")
+        """
+        lazy_tool = LazyTool(
+            name, description, factory,
+            args=args, kwargs=kwargs, metadata=metadata, cache_policy=cache_policy
+        )
+        lazy_tool.on_description_change = self._republish
+        self.register(lazy_tool)
+        return lazy_tool
+    
+    def register_builtin(
+        self,
+        name: str,
+        *args: Any,
+        factory: Optional[ToolFactory] = None,
+        **kwargs: Any
+    ) -> LazyTool:
+        """
+        延迟注册一个内置工具，描述、元数据和缓存策略取自 tools.catalog（不导入工具模块）
+        
+        参数:
+            name: 目录中的工具名称
+            *args, **kwargs: 传给工厂的参数
+            factory: 代替目录中导入路径的工厂（例如构造时需要其他工具）
+        
+        用法:
+            registry.register_builtin("Search", docs_dir)
+        """
+        spec = BUILTIN_TOOLS[name]
+        return self.register_lazy(
+            name, spec.description, factory or spec.factory, *args,
+            metadata=spec.metadata, cache_policy=spec.cache_policy, **kwargs
+        )
+    
+    def _republish(self, tool: BaseTool) -> None:
+        """工具的描述发生变化时发布新版本，让工具选择器等订阅者重建索引"""
+        with self._write_lock:
+            if self._snapshot.tools.get(tool.name) is tool:
+                self._publish(dict(self._snapshot.tools))
+    
+    def register_class(
+        self,
+        tool_class: Type[BaseTool],
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        *args: Any,
+        **kwargs: Any
+    ) -> None:
+        """
+        注册一个工具类
+        
+        提供 name 和 description 时延迟实例化；否则立即构造（需要实例才能知道名称）
+        """
+        if name is not None and description is not None:
+            self._tool_classes[name] = tool_class
+            self.register_lazy(name, description, tool_class, *args, **kwargs)
+            return
+        
+        instance = tool_class(*args, **kwargs)
+        self._tool_classes[instance.name] = tool_class
+        self.register(instance)
     
     def register_multiple(self, tools: List[BaseTool]) -> None:
-        """批量注册多个工具"""
-        for tool in tools:
-            self.register(tool)
+        """批量注册多个工具（只发布一个新版本）"""
+        if tools:
+            self._add_tools(list(tools))
     
     def get_tool(self, name: str) -> Optional[BaseTool]:
-        """根据名称获取工具"""
-        return self._tools.get(name)
+        """根据名称获取工具（延迟注册的工具会在此时实例化）"""
+        tool = self._tools.get(name)
+        if isinstance(tool, LazyTool):
+            return tool.materialize()
+        return tool
     
     def get_all_tools(self) -> List[BaseTool]:
         """获取所有已注册的工具"""
@@ -48,27 +372,221 @@ class ToolRegistry:
         """获取所有工具名称"""
         return list(self._tools.keys())
     
+    def find_tools(
+        self,
+        predicate: Optional[Callable[[ToolMetadata], bool]] = None,
+        **criteria: Any
+    ) -> List[BaseTool]:
+        """
+        按元数据查询工具
+        
+        参数:
+            predicate: 自定义过滤函数，接收工具的 ToolMetadata
+            **criteria: 元数据属性必须等于给定值，如 pure=True, latency_class="instant"
+        
+        用法:
+            registry.find_tools(pure=True)
+            registry.find_tools(side_effects=False, latency_class="fast")
+            registry.find_tools(lambda m: m.expected_latency < 0.5)
+        """
+        result = []
+        for tool in self._tools.values():
+            metadata = tool.metadata
+            if any(getattr(metadata, key) != value for key, value in criteria.items()):
+                continue
+            if predicate is not None and not predicate(metadata):
+                continue
+            result.append(tool)
+        return result
+    
+    def get_metadata(self, name: str) -> Optional[ToolMetadata]:
+        """获取工具的元数据"""
+        tool = self._tools.get(name)
+        return tool.metadata if tool else None
+    
     def unregister(self, name: str) -> bool:
         """注销一个工具"""
-        if name in self._tools:
-            del self._tools[name]
-            print(f"[Registry] Unregistered tool: {name}")
-            return True
-        return False
+        with self._write_lock:
+            if name not in self._snapshot.tools:
+                return False
+            updated = dict(self._snapshot.tools)
+            del updated[name]
+            self._tool_classes.pop(name, None)
+            self.cache.invalidate(name)
+            self._guards.pop(name, None)
+            self._publish(updated)
+        print(f"[Registry] Unregistered tool: {name}")
+        return True
     
     def clear(self) -> None:
         """清空所有工具"""
-        self._tools.clear()
-        self._tool_classes.clear()
+        with self._write_lock:
+            self._tool_classes.clear()
+            self.cache.invalidate()
+            self._guards.clear()
+            self._publish({})
         print("[Registry] Cleared all tools")
     
-    def get_tools_description(self) -> str:
-        """获取所有工具的描述信息（用于提示词）"""
-        if not self._tools:
+    def _get_guard(self, tool: BaseTool) -> ToolGuard:
+        """获取（首次执行时创建）工具的执行保护"""
+        guard = self._guards.get(tool.name)
+        if guard is not None:
+            return guard
+        with self._guards_lock:
+            guard = self._guards.get(tool.name)
+            if guard is None:
+                metadata = tool.metadata
+                breaker = CircuitBreaker(
+                    failure_threshold=self.failure_threshold,
+                    recovery_timeout=self.recovery_timeout,
+                    slow_call_threshold=max(
+                        metadata.expected_latency * self.slow_call_factor, self.MIN_LATENCY_SLO
+                    )
+                )
+                if metadata.timeout is not None:
+                    timeout = metadata.timeout
+                elif metadata.expected_latency <= self.INLINE_LATENCY:
+                    # 极快的工具（如 Calculator）交给工作线程的开销比执行本身还大
+                    timeout = None
+                else:
+                    timeout = self.default_timeout
+                guard = ToolGuard(
+                    tool.name,
+                    timeout=timeout,
+                    max_concurrent=metadata.max_concurrency,
+                    breaker=breaker
+                )
+                self._guards[tool.name] = guard
+        return guard
+    
+    @staticmethod
+    def _truncate(result: str, max_chars: Optional[int]) -> str:
+        if max_chars is None or len(result) <= max_chars:
+            return result
+        return result[:max_chars] + TRUNCATION_NOTICE
+    
+    @staticmethod
+    def _execute(tool: BaseTool, query: str, max_chars: Optional[int]) -> Tuple[str, bool]:
+        """
+        执行工具
+        
+        返回:
+            (结果, 是否完整)。流式工具在输出达到 max_chars 后关闭生成器，结果不完整
+        """
+        if max_chars is None or not tool.supports_streaming:
+            return tool.run(query), True
+        
+        chunks: List[str] = []
+        size = 0
+        stream = tool.run_stream(query)
+        try:
+            for chunk in stream:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= max_chars:
+                    return "".join(chunks), False
+        finally:
+            # 提前关闭时生成器内的 finally / with 会被执行，剩余的工作不再进行
+            stream.close()
+        return "".join(chunks), True
+    
+    def run_tool(
+        self,
+        name: Union[str, BaseTool],
+        query: str,
+        max_chars: Optional[int] = None,
+        snapshot: Optional[ToolSnapshot] = None
+    ) -> str:
+        """
+        执行工具，按工具的缓存策略复用结果
+        
+        未命中缓存时在执行保护下运行：超时、并发已满或熔断时抛出 ToolExecutionError 的子类。
+        缓存命中不经过熔断器，工具故障期间仍可返回已缓存的结果。
+        
+        参数:
+            name: 工具名称，或已经从快照中取得的工具实例（直接执行该实例，不再按名称查找）
+            query: 工具参数
+            max_chars: 结果的最大字符数（观察预算）。支持流式输出的工具达到预算后立即停止；
+                       截断的结果不会写入缓存
+            snapshot: 按名称查找时使用的快照（默认为当前快照）。一轮对话固定一个快照，
+                      期间工具被注销或替换也会执行这一轮看到的实现
+        
+        返回:
+            工具执行结果（超出预算时截断并附加 TRUNCATION_NOTICE）
+        """
+        if isinstance(name, BaseTool):
+            tool: Optional[BaseTool] = name
+            name = tool.name
+        else:
+            tool = (snapshot or self._snapshot).get(name)
+        if tool is None:
+            raise KeyError(f"Tool '{name}' not found")
+        
+        guard = self._get_guard(tool)
+        policy = tool.cache_policy
+        # 缓存按名称存放：快照中的旧实现已被替换或注销时不读写缓存，避免与当前实现的结果混在一起
+        # 工具返回的错误文本（而不是抛出异常）也计为熔断器的失败
+        is_error = lambda outcome: tool.is_error(outcome[0])
+        if not policy.enabled or self._snapshot.get(name) is not tool:
+            result, _ = guard.call(self._execute, tool, query, max_chars, is_error=is_error)
+            return self._truncate(result, max_chars)
+        
+        key = tool.normalize_query(query)
+        cached = self.cache.get(name, key)
+        if cached is not None:
+            return self._truncate(cached, max_chars)
+        
+        result, complete = guard.call(self._execute, tool, query, max_chars, is_error=is_error)
+        if complete and tool.is_cacheable(result):
+            self.cache.put(name, key, result, policy)
+        return self._truncate(result, max_chars)
+    
+    def get_lazy_stats(self) -> Dict[str, Optional[float]]:
+        """
+        获取延迟注册工具的加载情况
+        
+        返回:
+            {工具名: 导入+构造耗时（秒），尚未加载为 None}
+        """
+        return {
+            name: tool.load_time
+            for name, tool in self._tools.items()
+            if isinstance(tool, LazyTool)
+        }
+    
+    def get_guard_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取每个已执行过的工具的隔离状态
+        
+        返回:
+            {工具名: {state, calls, failures, slow_calls, rejected, opened, in_flight, timeouts, ...}}
+        """
+        return {name: guard.get_stats() for name, guard in list(self._guards.items())}
+    
+    def reset_breaker(self, name: Optional[str] = None) -> None:
+        """手动关闭熔断器（name 为 None 时重置全部）"""
+        for guard_name, guard in list(self._guards.items()):
+            if name is None or guard_name == name:
+                guard.breaker.reset()
+    
+    def get_cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """获取每个工具的缓存命中统计"""
+        return self.cache.get_stats()
+    
+    def get_tools_description(self, names: Optional[List[str]] = None) -> str:
+        """
+        获取工具的描述信息（用于提示词）
+        
+        参数:
+            names: 只描述这些工具（例如 ToolSelector 选出的工具）；为 None 时描述全部工具
+        """
+        current = self._tools
+        tools = current.values() if names is None else [current[n] for n in names if n in current]
+        if not tools:
             return "No tools available."
         
         descriptions = []
-        for tool in self._tools.values():
+        for tool in tools:
             descriptions.append(f"- {tool.name}: {tool.description}")
         return "\n".join(descriptions)
 
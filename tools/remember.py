@@ -1,11 +1,15 @@
 from .base import BaseTool
+from .catalog import BUILTIN_TOOLS
 from agent.memory import Memory
 
 class RememberTool(BaseTool):
+    cache_policy = BUILTIN_TOOLS["Remember"].cache_policy
+    metadata = BUILTIN_TOOLS["Remember"].metadata
+
     def __init__(self, memory: Memory):
         super().__init__(
             name="Remember",
-            description="Save important information about the user. Format: [category: content]. Categories: profile, preference, fact. Example: [preference: likes python]"
+            description=BUILTIN_TOOLS["Remember"].description
         )
         self.memory = memory
 
@@ -46,3 +50,6 @@ class RememberTool(BaseTool):
 
         except Exception as e:
             return f"Error saving memory: {str(e)}"
+
+    def is_error(self, result: str) -> bool:
+        return result.startswith("Error saving memory")
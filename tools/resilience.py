@@ -0,0 +1,376 @@
+"""
+工具执行隔离 - 防止单个慢工具或故障工具拖垮整个对话
+
+- CircuitBreaker: 熔断器。连续失败（异常、超时、超出延迟 SLO）达到阈值后打开，
+  打开期间直接失败；冷却后进入半开状态放行少量探测调用，成功则恢复
+- Bulkhead: 舱壁。限制每个工具同时执行的数量，满时立即拒绝而不是排队
+- ToolGuard: 把舱壁、熔断和超时组合在一起，包装一次工具调用
+
+超时说明: Python 无法强制终止线程，超时后工具调用会在后台守护线程中继续运行直到结束，
+但调用方会立即得到 ToolTimeoutError；该调用在结束前一直占用舱壁名额，
+因此反复卡死的工具会很快被舱壁和熔断器隔离。
+带超时的调用在复用的守护工作线程中执行，不为每次调用新建线程。
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class ToolExecutionError(Exception):
+    """工具执行被隔离机制拒绝或中断"""
+
+
+class CircuitOpenError(ToolExecutionError):
+    """熔断器打开，工具暂时不可用"""
+
+
+class BulkheadFullError(ToolExecutionError):
+    """工具并发已满"""
+
+
+class ToolTimeoutError(ToolExecutionError):
+    """工具执行超时"""
+
+
+class _WorkerPool:
+    """
+    复用的守护工作线程
+
+    有空闲线程时交给它执行，否则新建一个；卡住的任务只占住它自己的线程，不影响其他调用。
+    线程空闲 idle_timeout 秒后退出。使用守护线程，卡死的工具不会阻止进程退出。
+    """
+
+    def __init__(self, idle_timeout: float = 60.0):
+        self.idle_timeout = idle_timeout
+        self._tasks: "queue.SimpleQueue[Callable[[], None]]" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._idle = 0
+        self.threads_started = 0
+
+    def submit(self, task: Callable[[], None]) -> None:
+        with self._lock:
+            if self._idle > 0:
+                # 预定一个空闲线程，它一定会取走一个任务
+                self._idle -= 1
+                spawn = False
+            else:
+                spawn = True
+                self.threads_started += 1
+        self._tasks.put(task)
+        if spawn:
+            threading.Thread(target=self._work, name="tool-worker", daemon=True).start()
+
+    def _work(self) -> None:
+        while True:
+            try:
+                task = self._tasks.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                with self._lock:
+                    if self._idle > 0:
+                        self._idle -= 1
+                        return
+                # 刚被 submit 预定，继续等待那个任务
+                continue
+            task()
+            with self._lock:
+                self._idle += 1
+
+
+_WORKERS = _WorkerPool()
+
+
+def run_in_background(task: Callable[[], None]) -> None:
+    """在共享的守护工作线程中执行 task（卡死的任务不会阻止进程退出）"""
+    _WORKERS.submit(task)
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    状态:
+    - closed: 正常放行，记录连续失败次数
+    - open: 直接拒绝，recovery_timeout 秒后转为 half_open
+    - half_open: 最多放行 half_open_max_calls 个探测调用；成功则 closed，失败则重新 open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        slow_call_threshold: Optional[float] = None,
+        half_open_max_calls: int = 1
+    ):
+        """
+        参数:
+            failure_threshold: 连续失败多少次后打开
+            recovery_timeout: 打开后多久进入半开状态（秒）
+            slow_call_threshold: 延迟 SLO（秒），超过该耗时的成功调用也计为失败；None 表示不检查
+            half_open_max_calls: 半开状态下同时放行的探测调用数
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+        self.stats = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "slow_calls": 0,
+            "rejected": 0,
+            "opened": 0,
+        }
+
+    def _current_state(self, now: float) -> str:
+        # 调用方持有锁
+        if self._state == self.OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def allow(self) -> bool:
+        """判断是否放行本次调用（放行的调用必须随后调用 record_success 或 record_failure）"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self.stats["rejected"] += 1
+            return False
+
+    def retry_after(self) -> float:
+        """距离进入半开状态还剩多少秒"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+    def _open(self, now: float) -> None:
+        self._state = self.OPEN
+        self._opened_at = now
+        self.stats["opened"] += 1
+
+    def record_success(self, latency: float) -> None:
+        """记录一次成功调用；超过延迟 SLO 时按失败处理"""
+        if self.slow_call_threshold is not None and latency > self.slow_call_threshold:
+            with self._lock:
+                self.stats["slow_calls"] += 1
+            self.record_failure()
+            return
+
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["successes"] += 1
+            self._consecutive_failures = 0
+            if self._state == self.HALF_OPEN:
+                self._state = self.CLOSED
+                self._half_open_calls = 0
+
+    def record_failure(self) -> None:
+        """记录一次失败调用"""
+        with self._lock:
+            now = time.monotonic()
+            self.stats["calls"] += 1
+            self.stats["failures"] += 1
+            self._consecutive_failures += 1
+            state = self._current_state(now)
+            if state == self.HALF_OPEN or (
+                state == self.CLOSED and self._consecutive_failures >= self.failure_threshold
+            ):
+                self._open(now)
+
+    def release(self) -> None:
+        """放行的调用被中断（如 KeyboardInterrupt），不计成功或失败，只归还半开探测名额"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def reset(self) -> None:
+        """手动恢复为 closed"""
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._half_open_calls = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["state"] = self._current_state(time.monotonic())
+            stats["consecutive_failures"] = self._consecutive_failures
+            return stats
+
+
+class Bulkhead:
+    """
+    舱壁 - 限制同时执行的调用数，满时立即拒绝
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None):
+        """
+        参数:
+            max_concurrent: 最大并发数，None 表示不限制
+        """
+        self.max_concurrent = max_concurrent
+        self._semaphore = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self._semaphore is not None and not self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "rejected_bulkhead": self.rejected,
+            }
+
+
+class ToolGuard:
+    """
+    单个工具的执行保护：舱壁 -> 熔断 -> 带超时执行
+
+    用法:
+        guard = ToolGuard("Search", timeout=10, max_concurrent=2)
+        result = guard.call(tool.run, query)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: Optional[float] = None,
+        max_concurrent: Optional[int] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        参数:
+            name: 工具名称（用于错误信息）
+            timeout: 硬超时（秒），None 表示在调用线程中直接执行、不设超时
+            max_concurrent: 最大并发数
+            breaker: 熔断器，None 时使用默认参数
+        """
+        self.name = name
+        self.timeout = timeout
+        self.bulkhead = Bulkhead(max_concurrent)
+        self.breaker = breaker or CircuitBreaker()
+        self.timeouts = 0
+
+    def _run_with_timeout(self, func: Callable[..., Any], args: tuple) -> Any:
+        outcome: Dict[str, Any] = {}
+        done = threading.Event()
+
+        def target():
+            try:
+                outcome["result"] = func(*args)
+            except BaseException as e:
+                outcome["error"] = e
+            finally:
+                # 即使调用方已超时返回，也要等工具真正结束后才归还舱壁名额
+                self.bulkhead.release()
+                done.set()
+
+        _WORKERS.submit(target)
+        if not done.wait(self.timeout):
+            self.timeouts += 1
+            raise ToolTimeoutError(f"工具 '{self.name}' 执行超时（{self.timeout:g}s）")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+    def call(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        is_error: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """
+        在保护下执行 func(*args)
+
+        参数:
+            is_error: 判断返回值是否表示失败；为真时照常返回结果，但熔断器记为失败
+
+        异常:
+            CircuitOpenError: 熔断器打开
+            BulkheadFullError: 并发已满
+            ToolTimeoutError: 超时
+            以及工具自身抛出的异常
+        """
+        # 先占舱壁名额再问熔断器，避免半开探测名额被并发已满的调用占掉
+        if not self.bulkhead.try_acquire():
+            raise BulkheadFullError(
+                f"工具 '{self.name}' 并发已满（最多 {self.bulkhead.max_concurrent} 个）"
+            )
+        if not self.breaker.allow():
+            self.bulkhead.release()
+            raise CircuitOpenError(
+                f"工具 '{self.name}' 暂时不可用（熔断中，{self.breaker.retry_after():.0f}s 后重试）"
+            )
+
+        start = time.perf_counter()
+        finished = False
+        try:
+            if self.timeout is None:
+                try:
+                    result = func(*args)
+                finally:
+                    self.bulkhead.release()
+            else:
+                result = self._run_with_timeout(func, args)
+            finished = True
+        except Exception:
+            finished = True
+            self.breaker.record_failure()
+            raise
+        finally:
+            if not finished:
+                # KeyboardInterrupt 等中断：不计成功或失败，但要归还半开探测名额
+                self.breaker.release()
+        if is_error is not None and is_error(result):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success(time.perf_counter() - start)
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.breaker.get_stats()
+        stats.update(self.bulkhead.get_stats())
+        stats["timeouts"] = self.timeouts
+        stats["timeout"] = self.timeout
+        return stats
@@ -1,17 +1,28 @@
 import os
-from typing import List
+from typing import Iterator, List
 from .base import BaseTool
+from .catalog import BUILTIN_TOOLS
 
 class SearchTool(BaseTool):
+    cache_policy = BUILTIN_TOOLS["Search"].cache_policy
+    metadata = BUILTIN_TOOLS["Search"].metadata
+
     def __init__(self, docs_dir: str):
         super().__init__(
             name="Search",
-            description="在本地文档中搜索关键字。当你需要回答有关特定主题（如 Python 或 Agent）的问题时很有用。"
+            description=BUILTIN_TOOLS["Search"].description
         )
         self.docs_dir = docs_dir
 
+    # 最多返回的匹配行数，避免上下文溢出
+    MAX_RESULTS = 5
+
     def run(self, query: str) -> str:
-        results = []
+        return "".join(self.run_stream(query))
+
+    def run_stream(self, query: str) -> Iterator[str]:
+        """逐行产出匹配结果；找到 MAX_RESULTS 条后不再读取剩余文件"""
+        count = 0
         # 简单的关键字搜索
         # 1. 过滤停用词
         stopwords = {"what", "is", "a", "the", "an", "tell", "me", "about", "how", "to", "in", "of", "for", "with", "on"}
@@ -22,23 +33,30 @@ class SearchTool(BaseTool):
             keywords = raw_keywords # 如果所有内容都是停用词，则回退
 
         if not os.path.exists(self.docs_dir):
-            return "Error: Knowledge base directory not found."
+            yield "Error: Knowledge base directory not found."
+            return
 
         for filename in os.listdir(self.docs_dir):
-            if filename.endswith(".txt"):
-                filepath = os.path.join(self.docs_dir, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        lines = f.readlines()
-                        for i, line in enumerate(lines):
-                            # 检查行中是否包含任何有意义的关键字
-                            if any(k in line.lower() for k in keywords):
-                                results.append(f"[{filename}:{i+1}] {line.strip()}")
-                except Exception as e:
-                    results.append(f"Error reading {filename}: {str(e)}")
-        
-        if not results:
-            return f"No relevant information found for keywords: {keywords}"
-            
-        # 限制结果以避免上下文溢出
-        return "\n".join(results[:5])
+            if not filename.endswith(".txt"):
+                continue
+            filepath = os.path.join(self.docs_dir, filename)
+            matches: List[str] = []
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    for i, line in enumerate(f):
+                        # 检查行中是否包含任何有意义的关键字
+                        if any(k in line.lower() for k in keywords):
+                            matches.append(f"[{filename}:{i+1}] {line.strip()}")
+                            if count + len(matches) >= self.MAX_RESULTS:
+                                break
+            except Exception as e:
+                matches.append(f"Error reading {filename}: {str(e)}")
+
+            for match in matches:
+                yield match if count == 0 else "\n" + match
+                count += 1
+                if count >= self.MAX_RESULTS:
+                    return
+
+        if count == 0:
+            yield f"No relevant information found for keywords: {keywords}"
@@ -1,4 +1,5 @@
 from .base import BaseTool
+from .catalog import BUILTIN_TOOLS
 
 class TranslatorTool(BaseTool):
     """
@@ -9,10 +10,13 @@ class TranslatorTool(BaseTool):
     2. 或使用 LLM 进行翻译
     """
     
+    cache_policy = BUILTIN_TOOLS["Translator"].cache_policy
+    metadata = BUILTIN_TOOLS["Translator"].metadata
+    
     def __init__(self):
         super().__init__(
             name="Translator",
-            description="翻译文本。格式: '[源语言]->[目标语言] 文本内容'。例如: 'en->zh Hello World' 或 'zh->en 你好世界'"
+            description=BUILTIN_TOOLS["Translator"].description
         )
         
         # 简单的示例词典
@@ -96,10 +100,13 @@ class LLMTranslatorTool(BaseTool):
     利用已有的 LLM 能力进行翻译
     """
     
+    cache_policy = BUILTIN_TOOLS["LLMTranslator"].cache_policy
+    metadata = BUILTIN_TOOLS["LLMTranslator"].metadata
+    
     def __init__(self, llm=None):
         super().__init__(
             name="LLMTranslator",
-            description="使用 LLM 进行高质量翻译。格式同 Translator 工具。"
+            description=BUILTIN_TOOLS["LLMTranslator"].description
         )
         self.llm = llm
     
@@ -117,4 +124,10 @@ class LLMTranslatorTool(BaseTool):
             return result
         except Exception as e:
             return f"LLM 翻译出错: {str(e)}"
+    
+    def is_cacheable(self, result: str) -> bool:
+        return not result.startswith(("错误", "LLM 翻译出错"))
+    
+    def is_error(self, result: str) -> bool:
+        return result.startswith("LLM 翻译出错")
 
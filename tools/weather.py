@@ -1,5 +1,6 @@
 import random
 from .base import BaseTool
+from .catalog import BUILTIN_TOOLS
 
 class WeatherTool(BaseTool):
     """
@@ -9,10 +10,13 @@ class WeatherTool(BaseTool):
     如 OpenWeatherMap, 和风天气等
     """
     
+    cache_policy = BUILTIN_TOOLS["Weather"].cache_policy
+    metadata = BUILTIN_TOOLS["Weather"].metadata
+    
     def __init__(self):
         super().__init__(
             name="Weather",
-            description="查询指定城市的天气信息。输入城市名称，例如: '北京', 'Shanghai', 'New York'"
+            description=BUILTIN_TOOLS["Weather"].description
         )
         
         # 模拟天气数据
@@ -53,6 +57,10 @@ class WeatherTool(BaseTool):
 """.strip()
         
         return weather_info
+    
+    def normalize_query(self, query: str) -> str:
+        """城市名不区分大小写"""
+        return " ".join(query.split()).lower()
 
 
 class WeatherAPITool(BaseTool):
@@ -65,10 +73,13 @@ class WeatherAPITool(BaseTool):
     - WeatherAPI: https://www.weatherapi.com/
     """
     
+    cache_policy = BUILTIN_TOOLS["WeatherAPI"].cache_policy
+    metadata = BUILTIN_TOOLS["WeatherAPI"].metadata
+    
     def __init__(self, api_key: str = None, provider: str = "openweathermap"):
         super().__init__(
             name="WeatherAPI",
-            description="使用真实天气API查询天气信息。输入城市名称。"
+            description=BUILTIN_TOOLS["WeatherAPI"].description
         )
         self.api_key = api_key
         self.provider = provider
@@ -98,4 +109,13 @@ class WeatherAPITool(BaseTool):
             
         except Exception as e:
             return f"查询天气失败: {str(e)}"
+    
+    def normalize_query(self, query: str) -> str:
+        return " ".join(query.split()).lower()
+    
+    def is_cacheable(self, result: str) -> bool:
+        return not result.startswith(("错误", "查询天气失败"))
+    
+    def is_error(self, result: str) -> bool:
+        return result.startswith("查询天气失败")
 
@@ -1,4 +1,6 @@
+from typing import Iterator
 from .base import BaseTool
+from .catalog import BUILTIN_TOOLS
 
 class WebSearchTool(BaseTool):
     """
@@ -8,10 +10,13 @@ class WebSearchTool(BaseTool):
     如 Google Search API, Bing Search API, SerpAPI 等
     """
     
+    cache_policy = BUILTIN_TOOLS["WebSearch"].cache_policy
+    metadata = BUILTIN_TOOLS["WebSearch"].metadata
+    
     def __init__(self, api_key: str = None):
         super().__init__(
             name="WebSearch",
-            description="在互联网上搜索信息。输入搜索关键词，返回相关结果。"
+            description=BUILTIN_TOOLS["WebSearch"].description
         )
         self.api_key = api_key
     
@@ -65,10 +70,13 @@ class DuckDuckGoSearchTool(BaseTool):
     优势: 无需 API Key，尊重隐私
     """
     
+    cache_policy = BUILTIN_TOOLS["DuckDuckGoSearch"].cache_policy
+    metadata = BUILTIN_TOOLS["DuckDuckGoSearch"].metadata
+    
     def __init__(self):
         super().__init__(
             name="DuckDuckGoSearch",
-            description="使用 DuckDuckGo 搜索互联网信息（免费，无需 API Key）"
+            description=BUILTIN_TOOLS["DuckDuckGoSearch"].description
         )
     
     def run(self, query: str) -> str:
@@ -77,31 +85,19 @@ class DuckDuckGoSearchTool(BaseTool):
         
         需要安装: pip install duckduckgo-search
         """
+        return "".join(self.run_stream(query))
+    
+    def run_stream(self, query: str) -> Iterator[str]:
+        """
+        逐条产出搜索结果
+        
+        不再把全部结果先读进列表；调用方关闭生成器时会退出 DDGS 会话，不再拉取剩余结果。
+        """
         try:
             # 尝试导入 duckduckgo_search
             from duckduckgo_search import DDGS
-            
-            results = []
-            with DDGS() as ddgs:
-                search_results = list(ddgs.text(query, max_results=5))
-                
-                for i, result in enumerate(search_results, 1):
-                    title = result.get('title', 'No title')
-                    link = result.get('link', '')
-                    snippet = result.get('body', 'No description')
-                    
-                    results.append(f"{i}. {title}")
-                    results.append(f"   链接: {link}")
-                    results.append(f"   摘要: {snippet}")
-                    results.append("")
-            
-            if results:
-                return f"搜索结果: \"{query}\"\n\n" + "\n".join(results)
-            else:
-                return f"未找到关于 '{query}' 的搜索结果"
-                
         except ImportError:
-            return """
+            yield """
 错误: 未安装 duckduckgo-search 库
 
 请运行以下命令安装:
@@ -109,6 +105,32 @@ pip install duckduckgo-search
 
 然后重启应用程序。
 """.strip()
+            return
+        
+        found = False
+        try:
+            with DDGS() as ddgs:
+                for i, result in enumerate(ddgs.text(query, max_results=5), 1):
+                    title = result.get('title', 'No title')
+                    link = result.get('link', '')
+                    snippet = result.get('body', 'No description')
+                    
+                    if not found:
+                        yield f"搜索结果: \"{query}\"\n\n"
+                        found = True
+                    yield f"{i}. {title}\n   链接: {link}\n   摘要: {snippet}\n\n"
         except Exception as e:
-            return f"搜索出错: {str(e)}"
+            error = f"搜索出错: {str(e)}"
+            yield "\n" + error if found else error
+            return
+        
+        if not found:
+            yield f"未找到关于 '{query}' 的搜索结果"
+    
+    def is_cacheable(self, result: str) -> bool:
+        """网络错误和缺少依赖是临时性的，不缓存（流式输出中途出错时错误信息在末尾）"""
+        return not result.startswith(("搜索出错", "错误")) and "\n搜索出错: " not in result
+    
+    def is_error(self, result: str) -> bool:
+        return result.startswith("搜索出错") or "\n搜索出错: " in result
 